@@ -0,0 +1,98 @@
+import asyncio
+import random
+import threading
+import time
+
+
+class TransientModelError(Exception):
+    """Injected upstream failure; retried like a 503 from the real API"""
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeStream:
+    def __init__(self, model, text):
+        self._model = model
+        self._text = text
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        words = self._text.split(" ")
+        step = self._model.chunk_words
+        for i in range(0, len(words), step):
+            piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+            if self._model.tokens_per_second:
+                await asyncio.sleep(len(piece) / 4 / self._model.tokens_per_second)
+            yield FakeResponse(piece)
+
+
+class FakeModel:
+    """Local stand-in for ``genai.GenerativeModel`` with injectable latency and errors.
+
+    Each call waits ``latency`` seconds (plus up to ``jitter``) before
+    answering; with probability ``error_rate`` it raises
+    ``TransientModelError`` instead, and with ``slow_rate`` it takes
+    ``slow_latency`` (a tail the hedging should cut). Streams emit
+    ``chunk_words`` words at a time at ``tokens_per_second``.
+    """
+
+    RESPONSE = (
+        "DUBAI PROPERTY OVERVIEW\n\n"
+        "Dubai offers a wide range of apartments, villas and townhouses across established and emerging communities. "
+        "Prices depend on the area, view, size and completion status of the project.\n\n"
+        "1. Dubai Marina - waterfront apartments close to the beach and metro\n"
+        "2. Downtown Dubai - central living around Burj Khalifa and The Dubai Mall\n"
+        "3. Palm Jumeirah - villas and apartments with private beach access\n\n"
+        "Please share your budget, preferred area and number of bedrooms so I can recommend specific properties."
+    )
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = 5.0, tokens_per_second: float = 0,
+                 chunk_words: int = 8, response: str = None, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.tokens_per_second = tokens_per_second
+        self.chunk_words = chunk_words
+        self.response = response or self.RESPONSE
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """(delay, fail) for one call"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            if self._random.random() < self.slow_rate:
+                delay = self.slow_latency
+            if self.tokens_per_second:
+                delay += len(self.response) / 4 / self.tokens_per_second
+            return delay, self._random.random() < self.error_rate
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise TransientModelError("injected model failure")
+        return FakeResponse(self.response)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay, fail = self._draw()
+        if stream:
+            # Time to first token; the rest arrives at ``tokens_per_second``
+            await asyncio.sleep(self.latency)
+            if fail:
+                raise TransientModelError("injected model failure")
+            return _FakeStream(self, self.response)
+        await asyncio.sleep(delay)
+        if fail:
+            raise TransientModelError("injected model failure")
+        return FakeResponse(self.response)
@@ -0,0 +1,278 @@
+import re
+import threading
+from .topic_classifier import TopicClassifier
+
+# Turns answered without the model
+REDIRECT = "redirect"
+GREETING = "greeting"
+COMPANY_INFO = "company_info"
+PROPERTY_SEARCH = "property_search"
+# Everything else goes to the LLM
+OPEN_ENDED = "open_ended"
+
+INTENTS = (REDIRECT, GREETING, COMPANY_INFO, PROPERTY_SEARCH, OPEN_ENDED)
+
+_WORD = re.compile(r"[\w\u0610-\u061A\u064B-\u065F\u0670\u0B80-\u0BFF]+")
+
+# Words a bare greeting is made of: "hi", "good morning", "السلام عليكم", "வணக்கம்"
+GREETING_WORDS = {
+    "hi", "hello", "hey", "hiya", "greetings", "good", "morning", "afternoon", "evening", "day", "there",
+    "salam", "salaam", "assalamu", "alaikum", "marhaba", "yo", "howdy",
+    "مرحبا", "مرحبًا", "اهلا", "اهلًا", "السلام", "عليكم", "سلام", "صباح", "مساء", "الخير", "النور", "هلا",
+    "வணக்கம்", "ஹாய்", "ஹலோ",
+}
+# Words that only fill out a greeting
+_FILLER = {"and", "all", "everyone", "sir", "madam", "team", "agent", "و"}
+
+# Topic keywords asking about developers and companies
+COMPANY_KEYWORDS = {
+    "developer", "developers", "company", "companies", "emaar", "nakheel", "damac",
+    "مطور", "مطورين", "شركة", "شركات", "اعمار", "نخيل", "داماك",
+    "டெவலப்பர்", "நிறுவனம்", "நிறுவனங்கள்", "எமார்", "நகீல்", "டாமாக்",
+}
+
+# Cues that a message wants reasoning, advice or comparison rather than a lookup.
+# Tamil words are matched as prefixes since case markers attach to the stem.
+OPEN_ENDED_CUES = {
+    "why", "how", "should", "explain", "compare", "comparison", "versus", "vs", "difference", "better",
+    "worth", "advice", "advise", "pros", "cons", "invest", "investment", "investing", "yield", "roi",
+    "return", "returns", "appreciation", "forecast", "predict", "trend", "trends", "market", "mortgage",
+    "loan", "finance", "financing", "visa", "law", "legal", "tax", "taxes", "fees", "process", "procedure",
+    "future", "history", "risk", "risks",
+    "لماذا", "كيف", "قارن", "مقارنة", "الفرق", "استثمار", "عائد", "رهن", "تمويل", "تاشيرة", "قانون",
+    "ضريبة", "رسوم", "سوق", "توقعات", "نصيحة",
+    "ஏன்", "எப்படி", "ஒப்பிடு", "முதலீடு", "கடன்", "சந்தை", "விசா", "சட்டம்", "வரி", "ஆலோசனை",
+}
+_TAMIL_CUES = tuple(cue for cue in OPEN_ENDED_CUES if "\u0B80" <= cue[0] <= "\u0BFF")
+
+# Cues of an owner or a price question rather than a buyer or tenant searching:
+# single words, and word pairs matched on consecutive tokens
+SELLER_CUES = {
+    "sell", "selling", "sold", "seller", "landlord", "deal", "deals", "cheaper", "cheapest", "charge", "charges",
+    "valuation", "value", "list my",
+    "rent out", "renting out", "let out", "lease out",
+    "أبيع", "ابيع", "أؤجر", "اؤجر", "صفقة", "أرخص", "ارخص", "تكلفة",
+    "விற்க", "விற்கப்", "மலிவான",
+}
+_SELLER_PAIRS = {tuple(cue.split()) for cue in SELLER_CUES if " " in cue}
+_TAMIL_SELLER_CUES = tuple(cue for cue in SELLER_CUES if "\u0B80" <= cue[0] <= "\u0BFF")
+
+# A question is answered by the model even when it names search criteria
+QUESTION_WORDS = {
+    "what", "which", "is", "are", "can", "could", "does", "do", "will", "would", "where", "when", "who",
+    "ما", "ماذا", "هل", "أي", "اي", "متى", "أين", "اين",
+    "என்ன", "எந்த", "எங்கே", "எப்போது",
+}
+_QUESTION_MARKS = ("?", "؟")
+
+# Words asking to be shown listings: "looking for", "need", "show me", "find", "want"
+SEARCH_CUES = {
+    "looking", "look", "need", "needs", "show", "find", "want", "wants", "search", "searching", "seeking",
+    "أبحث", "ابحث", "أريد", "اريد", "أحتاج", "احتاج", "اعرض", "أعرض", "ابغى", "ابي", "أبي",
+    "வேண்டும்", "தேவை", "தேடு", "காட்டு",
+}
+_TAMIL_SEARCH_CUES = tuple(cue for cue in SEARCH_CUES if "\u0B80" <= cue[0] <= "\u0BFF")
+
+SEARCH_TEMPLATES = {
+    "english": {
+        "title": "PROPERTIES MATCHING YOUR SEARCH",
+        "found": "I found {count} available {noun} for {criteria}:",
+        "closest": "I couldn't find an exact match for {criteria}. These are the closest available properties:",
+        "none": "I couldn't find any available properties for {criteria} right now.\n\nTry widening your budget, adding nearby areas or allowing fewer bedrooms, and I'll search again.",
+        "noun": ("property", "properties"),
+        "location": "Location", "type": "Type", "bedrooms": "Bedrooms", "price": "Price", "area": "Area",
+        "sqft": "sqft", "studio": "Studio",
+        "closing": "Would you like more details on any of these, or shall I refine the search?",
+        "criteria": {
+            "bedrooms": "{n}+ bedrooms", "budget_max": "under AED {max}", "budget_min": "from AED {min}",
+            "budget_range": "AED {min} - {max}", "in": "in {places}", "any": "your search", "join": ", ",
+        },
+    },
+    "arabic": {
+        "title": "عقارات تطابق بحثك",
+        "found": "وجدت {count} {noun} متاحة لـ {criteria}:",
+        "closest": "لم أجد تطابقًا تامًا لـ {criteria}. هذه أقرب العقارات المتاحة:",
+        "none": "لم أجد أي عقارات متاحة لـ {criteria} حاليًا.\n\nجرّب توسيع الميزانية أو إضافة مناطق قريبة أو تقليل عدد غرف النوم، وسأبحث مجددًا.",
+        "noun": ("عقار", "عقارات"),
+        "location": "الموقع", "type": "النوع", "bedrooms": "غرف النوم", "price": "السعر", "area": "المساحة",
+        "sqft": "قدم مربع", "studio": "استوديو",
+        "closing": "هل تريد مزيدًا من التفاصيل عن أي منها، أم أضيّق البحث؟",
+        "criteria": {
+            "bedrooms": "{n}+ غرف نوم", "budget_max": "أقل من {max} درهم", "budget_min": "من {min} درهم",
+            "budget_range": "{min} - {max} درهم", "in": "في {places}", "any": "بحثك", "join": "، ",
+        },
+    },
+    "tamil": {
+        "title": "உங்கள் தேடலுக்கு பொருந்தும் வீடுகள்",
+        "found": "உங்கள் தேடலுக்கு ({criteria}) {count} {noun} கிடைக்கின்றன:",
+        "closest": "உங்கள் தேடலுக்கு ({criteria}) சரியான பொருத்தம் கிடைக்கவில்லை. மிக நெருக்கமான வீடுகள் இவை:",
+        "none": "உங்கள் தேடலுக்கு ({criteria}) தற்போது எந்த வீடும் கிடைக்கவில்லை.\n\nபட்ஜெட்டை அதிகரிக்கவும், அருகிலுள்ள பகுதிகளைச் சேர்க்கவும் அல்லது படுக்கையறைகளைக் குறைக்கவும், நான் மீண்டும் தேடுகிறேன்.",
+        "noun": ("வீடு", "வீடுகள்"),
+        "location": "இடம்", "type": "வகை", "bedrooms": "படுக்கையறைகள்", "price": "விலை", "area": "பரப்பளவு",
+        "sqft": "சதுர அடி", "studio": "ஸ்டுடியோ",
+        "closing": "இவற்றில் ஏதேனும் பற்றி மேலும் விவரங்கள் வேண்டுமா, அல்லது தேடலைச் சுருக்கட்டுமா?",
+        "criteria": {
+            "bedrooms": "{n}+ படுக்கையறைகள்", "budget_max": "AED {max} க்குள்", "budget_min": "AED {min} முதல்",
+            "budget_range": "AED {min} - {max}", "in": "{places} இல்", "any": "உங்கள் தேடல்", "join": ", ",
+        },
+    },
+}
+
+
+def _tokens(message: str):
+    return _WORD.findall(TopicClassifier.normalise(message or ""))
+
+
+def _money(value) -> str:
+    return f"{int(round(float(value))):,}"
+
+
+def matches_preferences(prop: dict, preferences: dict) -> bool:
+    """Whether a retrieved property meets every filter, as the strict query applies them"""
+    price = prop.get("price") or 0
+    if preferences.get("budget_min") and price < preferences["budget_min"]:
+        return False
+    if preferences.get("budget_max") and price > preferences["budget_max"]:
+        return False
+    locations = preferences.get("preferred_locations") or []
+    if locations and not any(str(prop.get("location", "")).lower().startswith(loc) for loc in locations):
+        return False
+    types = preferences.get("property_types") or []
+    if types and str(prop.get("property_type", "")).lower() not in types:
+        return False
+    if preferences.get("bedrooms") and (prop.get("bedrooms") or 0) < preferences["bedrooms"]:
+        return False
+    return True
+
+
+def describe_search(language: str, preferences: dict) -> str:
+    """The search criteria in a few localized words: "2+ bedrooms, apartment, in dubai marina, under AED 2,000,000" """
+    words = SEARCH_TEMPLATES.get(language, SEARCH_TEMPLATES["english"])["criteria"]
+    parts = []
+    if preferences.get("bedrooms"):
+        parts.append(words["bedrooms"].format(n=preferences["bedrooms"]))
+    if preferences.get("property_types"):
+        parts.append(" / ".join(preferences["property_types"]))
+    if preferences.get("preferred_locations"):
+        places = " / ".join(loc.title() for loc in preferences["preferred_locations"])
+        parts.append(words["in"].format(places=places))
+    low, high = preferences.get("budget_min"), preferences.get("budget_max")
+    if low and high:
+        parts.append(words["budget_range"].format(min=_money(low), max=_money(high)))
+    elif high:
+        parts.append(words["budget_max"].format(max=_money(high)))
+    elif low:
+        parts.append(words["budget_min"].format(min=_money(low)))
+    return words["join"].join(parts) if parts else words["any"]
+
+
+def render_search(language: str, preferences: dict, properties) -> str:
+    """Localized answer listing the retrieved properties for a structured search"""
+    t = SEARCH_TEMPLATES.get(language, SEARCH_TEMPLATES["english"])
+    criteria = describe_search(language, preferences)
+    properties = list(properties or [])
+    if not properties:
+        return f"{t['title']}\n\n" + t["none"].format(criteria=criteria)
+
+    exact = [p for p in properties if matches_preferences(p, preferences)]
+    if exact:
+        noun = t["noun"][0] if len(exact) == 1 else t["noun"][1]
+        lines = [t["title"], "", t["found"].format(count=len(exact), noun=noun, criteria=criteria)]
+        shown = exact
+    else:
+        # Retrieval relaxed the filters: say so rather than present them as matches
+        lines = [t["title"], "", t["closest"].format(criteria=criteria)]
+        shown = properties
+
+    for i, p in enumerate(shown, start=1):
+        bedrooms = p.get("bedrooms") or 0
+        lines += [
+            "",
+            f"{i}. {p.get('title') or ''}".rstrip(),
+            f"• {t['location']}: {p.get('location')}",
+            f"• {t['type']}: {p.get('property_type')}",
+            f"• {t['bedrooms']}: {bedrooms if bedrooms else t['studio']}",
+            f"• {t['price']}: AED {_money(p.get('price') or 0)}",
+        ]
+        if p.get("area_sqft"):
+            lines.append(f"• {t['area']}: {_money(p['area_sqft'])} {t['sqft']}")
+    lines += ["", t["closing"]]
+    return "\n".join(lines)
+
+
+class IntentRouter:
+    """Rule-based intent routing for turns that need no LLM call.
+
+    Runs after the topic check on the extracted preferences and the topic
+    keyword matches: bare greetings, developer/company questions and plain
+    structured searches are answered from templates and the retrieved
+    properties. A search has to say so ("looking for", "show me", "need")
+    as well as name criteria; questions, owners selling or letting and
+    anything with an open-ended cue (why, compare, invest, ...) go to the
+    model. Counts every routed turn so the bypass rate can be reported.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {intent: 0 for intent in INTENTS}
+
+    @staticmethod
+    def is_greeting(tokens) -> bool:
+        words = [t for t in tokens if t not in _FILLER]
+        return bool(words) and all(t in GREETING_WORDS for t in words)
+
+    @staticmethod
+    def is_open_ended(tokens) -> bool:
+        return any(t in OPEN_ENDED_CUES or t.startswith(_TAMIL_CUES) for t in tokens)
+
+    @staticmethod
+    def is_question(message: str, tokens) -> bool:
+        return any(mark in message for mark in _QUESTION_MARKS) or tokens[0] in QUESTION_WORDS
+
+    @staticmethod
+    def is_seller(tokens) -> bool:
+        return (
+            any(t in SELLER_CUES or t.startswith(_TAMIL_SELLER_CUES) for t in tokens)
+            or any(pair in _SELLER_PAIRS for pair in zip(tokens, tokens[1:]))
+        )
+
+    @staticmethod
+    def is_search_request(tokens) -> bool:
+        return any(t in SEARCH_CUES or t.startswith(_TAMIL_SEARCH_CUES) for t in tokens)
+
+    def classify(self, message: str, preferences: dict = None, topic=None) -> str:
+        """Intent of a real-estate message; ``topic`` is the classifier's ``TopicResult``"""
+        preferences = preferences or {}
+        tokens = _tokens(message)
+        if not tokens:
+            return OPEN_ENDED
+        if self.is_greeting(tokens):
+            return GREETING
+        if self.is_open_ended(tokens) or self.is_question(message, tokens) or self.is_seller(tokens):
+            return OPEN_ENDED
+
+        searching = any(preferences.get(field) for field in (
+            "preferred_locations", "property_types", "bedrooms", "budget_min", "budget_max"
+        ))
+        keywords = {m.keyword for m in topic.matches} if topic is not None else set()
+        if (keywords | set(tokens)) & COMPANY_KEYWORDS:
+            # "Emaar villas in Arabian Ranches" mixes both: leave it to the model
+            return OPEN_ENDED if searching else COMPANY_INFO
+        return PROPERTY_SEARCH if searching and self.is_search_request(tokens) else OPEN_ENDED
+
+    def record(self, intent: str):
+        with self._lock:
+            self.counts[intent] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        turns = sum(counts.values())
+        bypassed = turns - counts[OPEN_ENDED]
+        return {
+            "turns": turns,
+            "llm_turns": counts[OPEN_ENDED],
+            "bypassed": bypassed,
+            "bypass_rate": round(bypassed / turns, 4) if turns else 0.0,
+            "intents": counts,
+        }
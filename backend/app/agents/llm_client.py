@@ -0,0 +1,351 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+
+# Upstream errors worth another attempt; google.api_core is matched by name so
+# the wrapper works with any model object, including the local fake
+TRANSIENT_ERRORS = {
+    "ServiceUnavailable", "DeadlineExceeded", "ResourceExhausted", "TooManyRequests",
+    "InternalServerError", "GatewayTimeout", "BadGateway", "Aborted", "TransientModelError",
+}
+
+
+class CircuitOpenError(Exception):
+    """The upstream model is marked unhealthy; answer without calling it"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline budget ran out before the model answered"""
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Closed: calls pass. After ``failure_threshold`` failures in a row it
+    opens and rejects calls for ``reset_seconds``; then one probe call is
+    let through (half-open), which closes it on success or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """Give up a half-open probe that ended without an outcome, so the next call probes instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` successful calls, for the hedging threshold"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 20):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ResilientModel:
+    """Deadline, retry, hedging, circuit breaker and single-flight around a Gemini-style model.
+
+    ``get_model`` returns the model to call (the agent resolves it lazily).
+    Every call gets ``deadline_seconds`` in total; transient errors are
+    retried with full-jitter exponential backoff inside that budget. An
+    async call still running after the recent p95 latency gets one hedged
+    duplicate and the first answer wins. Identical prompts in flight at the
+    same time share one upstream call. While the breaker is open calls
+    raise ``CircuitOpenError`` immediately.
+    """
+
+    def __init__(self, get_model, deadline_seconds: float = 20, max_retries: int = 2, backoff_base: float = 0.25,
+                 backoff_max: float = 2.0, hedge: bool = True, hedge_quantile: float = 0.95,
+                 breaker: CircuitBreaker = None):
+        self.get_model = get_model
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self._inflight = {}  # key -> asyncio.Task
+        self._executor = None
+        self._lock = threading.Lock()
+        self.counts = {
+            "calls": 0, "upstream_calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "coalesced": 0, "timeouts": 0, "failures": 0, "rejected": 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _backoff(self, attempt: int, remaining: float) -> float:
+        return min(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)), max(remaining, 0))
+
+    def _admit(self):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("model upstream circuit is open")
+
+    def _settle(self, error: BaseException = None):
+        if error is None:
+            self.breaker.record_success()
+        else:
+            self._count("failures")
+            if isinstance(error, DeadlineExceeded):
+                self._count("timeouts")
+            if is_transient(error):
+                # Only upstream health counts; bad requests do not trip the breaker
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    @staticmethod
+    def flight_key(prompt, kwargs) -> str:
+        digest = hashlib.sha256(str(prompt).encode("utf-8"))
+        digest.update(repr(sorted(kwargs.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    # Async
+
+    async def agenerate(self, prompt, **kwargs):
+        """``generate_content_async`` with the full policy; identical concurrent prompts share one call"""
+        self._admit()
+        key = self.flight_key(prompt, kwargs)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._agenerate(prompt, kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            self._count("coalesced")
+        # Shielded: a caller that goes away must not cancel the call others wait on
+        return await asyncio.shield(task)
+
+    async def _agenerate(self, prompt, kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        attempt = 0
+        while True:
+            try:
+                response = await self._hedged(lambda: self._attempt(prompt, kwargs), deadline)
+                self._settle()
+                return response
+            except Exception as e:
+                remaining = deadline - loop.time()
+                if not is_transient(e) or attempt >= self.max_retries or remaining <= 0:
+                    self._settle(e)
+                    raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt, remaining))
+
+    async def _attempt(self, prompt, kwargs):
+        self._count("upstream_calls")
+        started = time.perf_counter()
+        response = await self.get_model().generate_content_async(prompt, **kwargs)
+        self.latency.add(time.perf_counter() - started)
+        return response
+
+    async def _hedged(self, call, deadline):
+        """Run ``call``; past the p95 latency start a second one and take whichever finishes first"""
+        loop = asyncio.get_running_loop()
+        hedge_after = self.latency.percentile(self.hedge_quantile) if self.hedge else None
+        hedge_at = loop.time() + hedge_after if hedge_after is not None else None
+        tasks = {asyncio.ensure_future(call())}
+        first = next(iter(tasks))
+        error = None
+        try:
+            while tasks:
+                now = loop.time()
+                if now >= deadline:
+                    raise DeadlineExceeded(f"model call exceeded {self.deadline_seconds:.1f} s")
+                wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(tasks, timeout=max(wait_until - now, 0), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and loop.time() >= hedge_at and self.breaker.state == CircuitBreaker.CLOSED:
+                        hedge_at = None
+                        self._count("hedges")
+                        tasks.add(asyncio.ensure_future(call()))
+                    elif hedge_at is not None:
+                        hedge_at = None
+                    continue
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, prompt, **kwargs):
+        """Streaming ``generate_content_async``: chunk texts as they arrive.
+
+        Retried only until the first chunk; after that a failure ends the
+        stream with what was produced. The deadline bounds the wait for each
+        chunk, not the length of the whole answer. A stream closed or
+        cancelled before any chunk does not hold on to the breaker's probe.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        attempt = 0
+        started = False
+        settled = False
+        try:
+            while True:
+                try:
+                    self._count("upstream_calls")
+                    began = time.perf_counter()
+                    remaining = deadline - loop.time()
+                    response = await asyncio.wait_for(
+                        self.get_model().generate_content_async(prompt, stream=True, **kwargs), max(remaining, 0.001)
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.deadline_seconds if started else max(deadline - loop.time(), 0.001))
+                        except StopAsyncIteration:
+                            break
+                        if not started:
+                            started = True
+                            self.latency.add(time.perf_counter() - began)
+                        yield chunk.text
+                    settled = True
+                    self._settle()
+                    return
+                except asyncio.TimeoutError:
+                    error = DeadlineExceeded(f"model stream exceeded {self.deadline_seconds:.1f} s")
+                except Exception as e:
+                    error = e
+                remaining = deadline - loop.time()
+                if started or not is_transient(error) or attempt >= self.max_retries or remaining <= 0:
+                    settled = True
+                    self._settle(error)
+                    raise error
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt, remaining))
+        finally:
+            if not settled:
+                # Closed or cancelled by the consumer: an upstream that already answered is healthy,
+                # otherwise hand the half-open probe back rather than keep the breaker waiting on it
+                if started:
+                    self._settle()
+                else:
+                    self.breaker.release_probe()
+
+    # Sync
+
+    def generate(self, prompt, **kwargs):
+        """``generate_content`` with deadline, retries and the breaker (no hedging or coalescing)"""
+        self._admit()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+        deadline = time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            try:
+                self._count("upstream_calls")
+                started = time.perf_counter()
+                future = self._executor.submit(self.get_model().generate_content, prompt, **kwargs)
+                try:
+                    response = future.result(timeout=max(deadline - time.monotonic(), 0.001))
+                except concurrent.futures.TimeoutError:
+                    # The SDK call has no timeout of its own; it finishes in the background
+                    future.cancel()
+                    raise DeadlineExceeded(f"model call exceeded {self.deadline_seconds:.1f} s")
+                self.latency.add(time.perf_counter() - started)
+                self._settle()
+                return response
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if not is_transient(e) or attempt >= self.max_retries or remaining <= 0:
+                    self._settle(e)
+                    raise
+                attempt += 1
+                self._count("retries")
+                time.sleep(self._backoff(attempt, remaining))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        p50 = self.latency.percentile(0.5, min_samples=1)
+        p95 = self.latency.percentile(0.95, min_samples=1)
+        return {
+            **counts,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+import anyio
+
+USER = "user"
+ASSISTANT = "assistant"
+
+
+class MemoryStore:
+    """Per-session conversation memory kept as (role, content) pairs.
+
+    ``get`` returns ``None`` on a miss so callers can tell an unknown session
+    (rehydrate it from the conversations table) from an empty one. The
+    ``a``-prefixed methods are for the event loop: stores that do blocking
+    I/O set ``blocking`` and run them in a worker thread.
+    """
+
+    blocking = False
+
+    def __init__(self, max_messages: int = 20):
+        self.max_messages = max_messages
+
+    async def _call(self, fn, *args):
+        if self.blocking:
+            return await anyio.to_thread.run_sync(fn, *args)
+        return fn(*args)
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def seed(self, session_id, messages):
+        """Install history loaded from the database for a session"""
+        raise NotImplementedError
+
+    def append(self, session_id, *messages):
+        raise NotImplementedError
+
+    def clear(self, session_id):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    async def aget(self, session_id):
+        return await self._call(self.get, session_id)
+
+    async def aseed(self, session_id, messages):
+        await self._call(self.seed, session_id, messages)
+
+    async def aappend(self, session_id, *messages):
+        await self._call(self.append, session_id, *messages)
+
+    async def aclear(self, session_id):
+        await self._call(self.clear, session_id)
+
+    async def acontains(self, session_id):
+        return await self.aget(session_id) is not None
+
+
+class InProcessMemoryStore(MemoryStore):
+    """LRU + TTL bounded store holding a ring buffer per session.
+
+    At most ``max_sessions`` sessions are resident; the least recently used
+    one is evicted first and sessions idle for ``ttl_seconds`` expire.
+    """
+
+    def __init__(self, max_messages: int = 20, max_sessions: int = 10000, ttl_seconds: float = 3600):
+        super().__init__(max_messages)
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # session_id -> (last_used, deque)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def _touch(self, session_id, buffer, now):
+        self._sessions[session_id] = (now, buffer)
+        self._sessions.move_to_end(session_id)
+        self._evict(now)
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            last_used, buffer = entry
+            if now - last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._touch(session_id, buffer, now)
+            return list(buffer)
+
+    def seed(self, session_id, messages):
+        with self._lock:
+            self._touch(session_id, deque(messages, maxlen=self.max_messages), time.monotonic())
+
+    def append(self, session_id, *messages):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            buffer = entry[1] if entry else deque(maxlen=self.max_messages)
+            buffer.extend(messages)
+            self._touch(session_id, buffer, now)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """Out-of-process store shared by every worker on the host.
+
+    A local stand-in for a networked cache such as Redis: workers share one
+    SQLite file in WAL mode, so a session can be served by any worker. Each
+    session keeps its last ``max_messages`` rows and expires after
+    ``ttl_seconds`` without activity.
+    """
+
+    # Writers wait up to the 5 s busy timeout for each other's locks
+    blocking = True
+
+    def __init__(self, path: str, max_messages: int = 20, ttl_seconds: float = 3600):
+        super().__init__(max_messages)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_memory ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+            " content TEXT NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_memory_meta ("
+            " session_id TEXT PRIMARY KEY, touched_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_session_memory_meta_touched ON session_memory_meta(touched_at)")
+        conn.commit()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expire(self, conn, now):
+        cutoff = now - self.ttl_seconds
+        expired = [row[0] for row in conn.execute(
+            "SELECT session_id FROM session_memory_meta WHERE touched_at < ? LIMIT 100", (cutoff,)
+        )]
+        for session_id in expired:
+            conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_memory_meta WHERE session_id = ?", (session_id,))
+
+    def get(self, session_id):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT touched_at FROM session_memory_meta WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or now - row[0] > self.ttl_seconds:
+            return None
+        conn.execute("UPDATE session_memory_meta SET touched_at = ? WHERE session_id = ?", (now, session_id))
+        return [tuple(r) for r in conn.execute(
+            "SELECT role, content FROM session_memory WHERE session_id = ? ORDER BY seq", (session_id,)
+        )]
+
+    def _write(self, session_id, messages, replace):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if replace:
+                conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+            start = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM session_memory WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO session_memory (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, start + i + 1, role, content) for i, (role, content) in enumerate(messages)]
+            )
+            # Keep only the ring buffer tail for the session
+            conn.execute(
+                "DELETE FROM session_memory WHERE session_id = ? AND seq <= ?",
+                (session_id, start + len(messages) - self.max_messages)
+            )
+            conn.execute(
+                "INSERT INTO session_memory_meta (session_id, touched_at) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET touched_at = excluded.touched_at",
+                (session_id, now)
+            )
+            self._expire(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def seed(self, session_id, messages):
+        self._write(session_id, list(messages)[-self.max_messages:], replace=True)
+
+    def append(self, session_id, *messages):
+        self._write(session_id, messages, replace=False)
+
+    def clear(self, session_id):
+        conn = self._connect()
+        conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM session_memory_meta WHERE session_id = ?", (session_id,))
+
+
+def create_memory_store(backend: str = "local", max_messages: int = 20, max_sessions: int = 10000,
+                        ttl_seconds: float = 3600, path: str = "session_memory.db") -> MemoryStore:
+    """Build the configured memory store (``local`` or ``shared``)"""
+    if backend == "shared":
+        return SQLiteMemoryStore(path, max_messages=max_messages, ttl_seconds=ttl_seconds)
+    if backend != "local":
+        raise ValueError(f"Unknown memory backend: {backend}")
+    return InProcessMemoryStore(max_messages=max_messages, max_sessions=max_sessions, ttl_seconds=ttl_seconds)
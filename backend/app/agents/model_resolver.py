@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import threading
+import time
+from app.services.metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Used until discovery has produced (or cached) a model name
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+
+class ModelResolver:
+    """Resolve which Gemini model to use without blocking on the network.
+
+    An explicitly configured model wins. Otherwise the name comes from an
+    on-disk cache written by a previous discovery, or ``DEFAULT_MODEL``
+    when there is none; a stale or missing cache triggers one background
+    ``genai.list_models()`` refresh whose result is used from then on.
+    """
+
+    def __init__(self, api_key: str, model_name: str = None, cache_path: str = None,
+                 cache_ttl_seconds: float = 86400, default_model: str = DEFAULT_MODEL):
+        self.api_key = api_key
+        self.configured = model_name
+        self.cache_path = cache_path
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.default_model = default_model
+        self._name = None
+        self._resolved_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def resolve(self) -> str:
+        """Current model name; never waits on discovery"""
+        if self.configured:
+            return self.configured
+        with self._lock:
+            if self._name is None:
+                self._name, self._resolved_at = self._read_cache()
+            stale = time.time() - self._resolved_at > self.cache_ttl_seconds
+            if stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name="gemini-model-discovery", daemon=True).start()
+            return self._name or self.default_model
+
+    def _read_cache(self):
+        if not self.cache_path:
+            return None, 0.0
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+            return data["model"], float(data["resolved_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, 0.0
+
+    def _write_cache(self, name, resolved_at):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"model": name, "resolved_at": resolved_at}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            ERRORS.inc(component="model_resolver")
+            logger.error(f"Error writing model cache: {e}")
+
+    def discover(self):
+        """Pick a generateContent-capable Gemini model, preferring flash models for speed"""
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+        gemini_models = [
+            model.name for model in genai.list_models()
+            if 'gemini' in model.name.lower() and 'generateContent' in model.supported_generation_methods
+        ]
+        for name in gemini_models:
+            if 'flash' in name.lower():
+                return name
+        return gemini_models[0] if gemini_models else None
+
+    def _refresh(self):
+        try:
+            name = self.discover()
+        except Exception as e:
+            ERRORS.inc(component="model_resolver")
+            logger.error(f"Error discovering Gemini models: {e}")
+            name = None
+        now = time.time()
+        with self._lock:
+            self._refreshing = False
+            if name:
+                self._name = name
+                self._write_cache(name, now)
+                logger.info(f"Resolved Gemini model: {name}")
+            # Back off for a full TTL either way so a failing API is not hammered
+            self._resolved_at = now
@@ -1,67 +1,84 @@
-import google.generativeai as genai
 import json
+import logging
 import re
 import time
+import anyio
 from datetime import datetime
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import BaseMessage
-from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain.schema import AIMessage, HumanMessage
+from app.services.inventory import inventory
+from app.services.metrics import stage, LLM_TOKENS, FALLBACKS, REDIRECTIONS
+from .memory_store import InProcessMemoryStore, USER, ASSISTANT
+from .response_cache import ResponseCache
+from .topic_classifier import topic_classifier
+from .prompt_builder import PromptBuilder, estimate_tokens
+from .llm_client import ResilientModel, CircuitOpenError
+from .intent_router import IntentRouter, REDIRECT, COMPANY_INFO, PROPERTY_SEARCH, OPEN_ENDED, render_search
+from .preference_extractor import PreferenceExtractor
+from .model_resolver import ModelResolver
+from .stream_formatter import IncrementalFormatter
+
+logger = logging.getLogger(__name__)
 
 class MultilingualRealEstateAgent:
-    def __init__(self, api_key):
-        if not api_key:
-            raise ValueError("API key is required")
-        
-        # Configure for Google AI Studio
-        genai.configure(api_key=api_key)
-        
-        # For Google AI Studio, use the correct model name
-        try:
-            # List available models to see what's accessible
-            available_models = genai.list_models()
-            print("Available models:")
-            gemini_models = []
-            for model in available_models:
-                if 'gemini' in model.name.lower() and 'generateContent' in model.supported_generation_methods:
-                    gemini_models.append(model.name)
-                    print(f"- {model.name} (supports generateContent: True)")
-            
-            if gemini_models:
-                # Use a more reliable model - prefer flash models for speed
-                model_name = None
-                for model in gemini_models:
-                    if 'flash' in model.lower():
-                        model_name = model
-                        break
-                if not model_name and gemini_models:
-                    model_name = gemini_models[0]
-                
-                self.model = genai.GenerativeModel(model_name)
-                print(f"Successfully initialized model: {model_name}")
-            else:
-                # Fallback to common model names
-                try:
-                    self.model = genai.GenerativeModel('gemini-1.5-flash')
-                    print("Using gemini-1.5-flash")
-                except:
-                    try:
-                        self.model = genai.GenerativeModel('gemini-1.0-pro')
-                        print("Using gemini-1.0-pro")
-                    except:
-                        self.model = genai.GenerativeModel('models/gemini-pro')
-                        print("Using models/gemini-pro")
-                        
-        except Exception as e:
-            print(f"Error initializing model: {e}")
-            # Final fallback
-            self.model = genai.GenerativeModel('gemini-pro')
-        
-        # LangChain memory for each session
-        self.memories = {}
-        
-        # Define the chat prompt template with enhanced formatting instructions
-        self.system_template = """You are a professional real estate agent in Dubai. You speak {language} fluently.
+    GENERATION_CONFIG = {
+        "temperature": 0.7,
+        "top_p": 0.8,
+        "top_k": 40,
+        "max_output_tokens": 1024,
+    }
+    
+    SAFETY_SETTINGS = [
+        {
+            "category": "HARM_CATEGORY_HARASSMENT",
+            "threshold": "BLOCK_NONE"
+        },
+        {
+            "category": "HARM_CATEGORY_HATE_SPEECH", 
+            "threshold": "BLOCK_NONE"
+        },
+        {
+            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+            "threshold": "BLOCK_NONE"
+        },
+        {
+            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+            "threshold": "BLOCK_NONE"
+        },
+    ]
+    
+    REDIRECTION_RESPONSES = {
+        "english": """I specialize exclusively in Dubai real estate and cannot provide information on other topics.
+
+How can I assist you with:
+• Property search and recommendations in Dubai
+• Real estate market insights
+• Investment opportunities in Dubai properties
+• Area information and community details
+
+Please let me know how I can help with your Dubai property needs!""",
+
+        "arabic": """أتخصص حصريًا في عقارات دبي ولا يمكنني تقديم معلومات حول مواضيع أخرى.
+
+كيف يمكنني مساعدتك في:
+• البحث عن العقارات والتوصيات في دبي
+• رؤى سوق العقارات
+• فرص الاستثمار في عقارات دبي
+• معلومات المناطق وتفاصيل المجتمعات
+
+يرجى إخباري كيف يمكنني المساعدة في احتياجاتك العقارية في دبي!""",
+
+        "tamil": """நான் பிரத்தியேகமாக டுபாய் ரியல் எஸ்டேட்டில் நிபுணத்துவம் பெற்றுள்ளேன் மற்றும் பிற தலைப்புகள் குறித்து தகவல்களை வழங்க முடியாது.
+
+டுபாயில் உள்ள பின்வரும் துறைகளில் நான் உங்களுக்கு எவ்வாறு உதவ முடியும்:
+• வீடு தேடல் மற்றும் பரிந்துரைகள்
+• ரியல் எஸ்டேட் சந்தை நுண்ணறிவுகள்
+• டுபாய் வீடுகளில் முதலீட்டு வாய்ப்புகள்
+• பகுதி தகவல்கள் மற்றும் கம்யூனிட்டி விவரங்கள்
+
+தயவு செய்து டுபாயில் உங்கள் வீடு தேவைகளுக்கு நான் எவ்வாறு உதவ முடியும் என்று சொல்லுங்கள்!"""
+    }
+    
+    # Chat prompt template with enhanced formatting instructions
+    SYSTEM_TEMPLATE = """You are a professional real estate agent in Dubai. You speak {language} fluently.
 Your role is to help users find properties, answer real estate questions, and provide market insights.
 
 **STRICT CONTENT POLICY - YOU MUST FOLLOW THESE RULES:**
@@ -144,13 +161,64 @@ If asked about travel: "I focus on helping clients with Dubai property matters.
 - Ensure good readability on both mobile and desktop
 - MOST IMPORTANT: Respond ONLY in {language} and ONLY about Dubai real estate"""
 
-        self.human_template = "{text}"
-
-        self.chat_prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(self.system_template),
-            HumanMessagePromptTemplate.from_template(self.human_template)
-        ])
+    HUMAN_TEMPLATE = "{text}"
+    
+    def __init__(self, api_key, memory_store=None, response_cache=None, preference_extractor=None, model_resolver=None,
+                 intent_router=None, prompt_builder=None, llm=None):
+        if not api_key:
+            raise ValueError("API key is required")
+        
+        self.api_key = api_key
+        
+        # Model name comes from config or the discovery cache; nothing touches the network here
+        self.model_resolver = model_resolver or ModelResolver(api_key)
+        self._model = None
+        self._model_name = None
+        
+        # Bounded conversation memory (last 10 exchanges) per session
+        self.memory_store = memory_store or InProcessMemoryStore(max_messages=20)
+        
+        # Keyword classifier compiled once at import and shared by all agents
+        self.topic_classifier = topic_classifier
+        
+        # Vocabularies grow from the properties table when the owner loads them
+        self.preference_extractor = preference_extractor or PreferenceExtractor()
+        
+        # Formatted responses reused for equivalent prompts; pass False to disable
+        self.response_cache = ResponseCache() if response_cache is None else response_cache
+        
+        # Greetings, company questions and plain searches are answered without the model; pass False to disable
+        self.intent_router = IntentRouter() if intent_router is None else intent_router
+        
+        self.system_template = self.SYSTEM_TEMPLATE
+        self.human_template = self.HUMAN_TEMPLATE
+        
+        # Static prompt text rendered once per language; history trimmed to a token budget
+        self.prompt_builder = prompt_builder or PromptBuilder(self.system_template, self.human_template)
+        
+        # Deadlines, retries, hedging, circuit breaker and single-flight around every model call
+        self.llm = llm or ResilientModel(lambda: self.model)
         
+    @property
+    def model(self):
+        """Gemini model, built on first use and rebuilt when discovery picks another"""
+        if self._model is not None and self._model_name is None:
+            return self._model
+        name = self.model_resolver.resolve()
+        if self._model is None or (self._model_name is not None and name != self._model_name):
+            import google.generativeai as genai
+            
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(name)
+            self._model_name = name
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        # An injected model is used as-is and never swapped by discovery
+        self._model = model
+        self._model_name = None
+    
     def detect_language(self, message, requested_language="auto"):
         """Detect language of the message with fallback, respecting requested language"""
         # If user specifically requested a language, use it
@@ -173,146 +241,43 @@ If asked about travel: "I focus on helping clients with Dubai property matters.
                 return "english"
                 
         except Exception as e:
-            print(f"Language detection fallback error: {e}")
+            logger.error(f"Language detection fallback error: {e}")
             return "english"
     
     def get_memory(self, session_id):
-        """Get or create conversation memory for session"""
-        if session_id not in self.memories:
-            self.memories[session_id] = ConversationBufferWindowMemory(
-                k=10,  # Keep last 10 exchanges
-                return_messages=True,
-                memory_key="history",
-                human_prefix="User",
-                ai_prefix="Assistant"
-            )
-        return self.memories[session_id]
+        """Get the (role, content) messages remembered for a session"""
+        return self.memory_store.get(session_id) or []
+    
+    def remember(self, session_id, user_message, ai_message):
+        """Append one exchange to the session memory"""
+        self.memory_store.append(session_id, (USER, user_message), (ASSISTANT, ai_message))
+    
+    async def aget_memory(self, session_id):
+        return await self.memory_store.aget(session_id) or []
+    
+    async def aremember(self, session_id, user_message, ai_message):
+        await self.memory_store.aappend(session_id, (USER, user_message), (ASSISTANT, ai_message))
     
     def extract_preferences(self, message, language):
-        """Simple rule-based preference extraction as fallback"""
-        preferences = {
-            "budget_min": None,
-            "budget_max": None,
-            "preferred_locations": [],
-            "property_types": [],
-            "bedrooms": None,
-            "amenities": []
-        }
-        
-        message_lower = message.lower()
-        
-        # Extract budget
-        if 'budget' in message_lower or 'aed' in message_lower or 'price' in message_lower:
-            numbers = re.findall(r'\d+', message)
-            if numbers:
-                if len(numbers) >= 2:
-                    preferences["budget_min"] = int(numbers[0]) * 1000
-                    preferences["budget_max"] = int(numbers[1]) * 1000
-                else:
-                    preferences["budget_min"] = int(numbers[0]) * 1000
-        
-        # Extract locations
-        locations = ['downtown', 'palm jumeirah', 'deira', 'business bay', 'dubai marina', 'jumeirah']
-        for location in locations:
-            if location in message_lower:
-                preferences["preferred_locations"].append(location)
-        
-        # Extract property types
-        property_types = ['apartment', 'villa', 'studio', 'penthouse', 'house']
-        for prop_type in property_types:
-            if prop_type in message_lower:
-                preferences["property_types"].append(prop_type)
-        
-        # Extract bedrooms
-        bedroom_keywords = ['bedroom', 'bed', 'bhk']
-        for keyword in bedroom_keywords:
-            if keyword in message_lower:
-                numbers = re.findall(r'\d+', message_lower)
-                if numbers:
-                    preferences["bedrooms"] = int(numbers[0])
-        
-        # Extract amenities
-        amenities = ['pool', 'gym', 'parking', 'security', 'beach', 'garden']
-        for amenity in amenities:
-            if amenity in message_lower:
-                preferences["amenities"].append(amenity)
-        
-        return preferences
+        """Rule-based extraction of budget, bedrooms, locations, types and amenities"""
+        return self.preference_extractor.extract(message)
     
-    def format_messages_for_prompt(self, memory):
+    def format_messages_for_prompt(self, messages):
         """Format memory messages for the prompt"""
-        messages = memory.load_memory_variables({})['history']
         formatted_history = ""
         
         for msg in messages:
-            if isinstance(msg, HumanMessage):
-                formatted_history += f"User: {msg.content}\n"
-            elif isinstance(msg, AIMessage):
-                formatted_history += f"Assistant: {msg.content}\n"
+            role, content = msg
+            if role == USER:
+                formatted_history += f"User: {content}\n"
+            elif role == ASSISTANT:
+                formatted_history += f"Assistant: {content}\n"
         
         return formatted_history.strip()
     
     def is_real_estate_related(self, message):
         """Check if the message is related to Dubai real estate"""
-        message_lower = message.lower()
-        
-        # Real estate keywords
-        real_estate_keywords = [
-            'property', 'properties', 'real estate', 'realestate', 'house', 'apartment', 'villa',
-            'studio', 'penthouse', 'duplex', 'townhouse', 'condo', 'flat', 'rent', 'buy', 'purchase',
-            'sell', 'sale', 'investment', 'invest', 'price', 'cost', 'budget', 'aed', 'location',
-            'area', 'sqft', 'square feet', 'bedroom', 'bathroom', 'amenities', 'facilities',
-            'developer', 'construction', 'built', 'ready', 'offplan', 'community', 'compound',
-            'view', 'facing', 'parking', 'balcony', 'terrace', 'garden', 'pool', 'gym', 'security',
-            'maintenance', 'service', 'charge', 'fee', 'commission', 'agent', 'broker', 'agency',
-            'dubai', 'uae', 'emirates', 'emirate', 'burj', 'marina', 'palm', 'jumeirah', 'deira',
-            'downtown', 'business bay', 'sheikh zayed', 'szx', 'dubai hills', 'arabian ranches',
-            'motor city', 'sports city', 'international city', 'discovery gardens', 'jlt', 'jumeirah lake',
-            'dubai creek', 'dubai harbour', 'bluewaters', 'city walk', 'dubai design district', 'd3',
-            'al barsha', 'al quoz', 'al safa', 'al wasl', 'al manara', 'umm suqeim', 'nad al sheba',
-            'mirdif', 'meydan', 'ras al khor', 'dubai silicon oasis', 'dso', 'dubai investment park',
-            'dip', 'dubai land', 'dubai south', 'dubai world central', 'dwc', 'expo', 'expo city',
-            'rental', 'lease', 'tenancy', 'tenant', 'landlord', 'owner', 'mortgage', 'loan', 'finance',
-            'down payment', 'deposit', 'contract', 'agreement', 'ejari', 'rera', 'dld', 'dubai land department',
-            'transfer fee', 'registration', 'title deed', 'ownership', 'freehold', 'leasehold'
-        ]
-        
-        # Prohibited topics keywords
-        prohibited_keywords = [
-            'car', 'vehicle', 'automotive', 'lamborghini', 'ferrari', 'porsche', 'bmw', 'mercedes', 'audi',
-            'toyota', 'honda', 'nissan', 'ford', 'chevrolet', 'hyundai', 'kia', 'volkswagen', 'volvo',
-            'stock', 'share', 'market', 'trading', 'investment', 'crypto', 'bitcoin', 'ethereum', 'forex',
-            'currency', 'exchange', 'dollar', 'euro', 'pound', 'politics', 'government', 'election', 'vote',
-            'religion', 'islam', 'christian', 'hindu', 'buddhist', 'jewish', 'god', 'prayer', 'worship',
-            'technology', 'gadget', 'iphone', 'samsung', 'laptop', 'computer', 'software', 'hardware',
-            'travel', 'tourism', 'vacation', 'holiday', 'flight', 'airline', 'hotel', 'resort', 'beach',
-            'food', 'restaurant', 'cafe', 'cuisine', 'meal', 'dinner', 'lunch', 'breakfast', 'recipe',
-            'sports', 'football', 'soccer', 'cricket', 'tennis', 'basketball', 'golf', 'fitness', 'exercise',
-            'celebrity', 'movie', 'film', 'music', 'song', 'artist', 'actor', 'actress', 'entertainment',
-            'weather', 'climate', 'temperature', 'rain', 'sun', 'health', 'medical', 'doctor', 'hospital',
-            'education', 'school', 'university', 'college', 'course', 'study', 'learn', 'student'
-        ]
-        
-        # Check if message contains real estate keywords
-        has_real_estate_keywords = any(keyword in message_lower for keyword in real_estate_keywords)
-        
-        # Check if message contains prohibited keywords
-        has_prohibited_keywords = any(keyword in message_lower for keyword in prohibited_keywords)
-        
-        # If it has prohibited keywords but no real estate context, it's not related
-        if has_prohibited_keywords and not has_real_estate_keywords:
-            return False
-        
-        # If it has real estate keywords, it's related
-        if has_real_estate_keywords:
-            return True
-        
-        # For very short or ambiguous messages, assume it might be real estate related
-        # to allow for natural conversation flow
-        if len(message.split()) <= 3:
-            return True
-            
-        return False
+        return self.topic_classifier.classify(message).is_related
     
     def enhance_response_formatting(self, text):
         """Enhance the formatting of the response for better readability"""
@@ -346,152 +311,303 @@ If asked about travel: "I focus on helping clients with Dubai property matters.
         
         return text.strip()
     
-    def generate_response(self, session_id, message, available_properties=None, requested_language="auto"):
-        try:
-            # Use requested language if provided, otherwise detect
-            language = self.detect_language(message, requested_language)
-            memory = self.get_memory(session_id)
-            
-            # Check if message is real estate related
-            if not self.is_real_estate_related(message):
-                # Return a polite redirection message
-                redirection_responses = {
-                    "english": """I specialize exclusively in Dubai real estate and cannot provide information on other topics.
-
-How can I assist you with:
-• Property search and recommendations in Dubai
-• Real estate market insights
-• Investment opportunities in Dubai properties
-• Area information and community details
-
-Please let me know how I can help with your Dubai property needs!""",
-
-                    "arabic": """أتخصص حصريًا في عقارات دبي ولا يمكنني تقديم معلومات حول مواضيع أخرى.
-
-كيف يمكنني مساعدتك في:
-• البحث عن العقارات والتوصيات في دبي
-• رؤى سوق العقارات
-• فرص الاستثمار في عقارات دبي
-• معلومات المناطق وتفاصيل المجتمعات
-
-يرجى إخباري كيف يمكنني المساعدة في احتياجاتك العقارية في دبي!""",
-
-                    "tamil": """நான் பிரத்தியேகமாக டுபாய் ரியல் எஸ்டேட்டில் நிபுணத்துவம் பெற்றுள்ளேன் மற்றும் பிற தலைப்புகள் குறித்து தகவல்களை வழங்க முடியாது.
-
-டுபாயில் உள்ள பின்வரும் துறைகளில் நான் உங்களுக்கு எவ்வாறு உதவ முடியும்:
-• வீடு தேடல் மற்றும் பரிந்துரைகள்
-• ரியல் எஸ்டேட் சந்தை நுண்ணறிவுகள்
-• டுபாய் வீடுகளில் முதலீட்டு வாய்ப்புகள்
-• பகுதி தகவல்கள் மற்றும் கம்யூனிட்டி விவரங்கள்
-
-தயவு செய்து டுபாயில் உங்கள் வீடு தேவைகளுக்கு நான் எவ்வாறு உதவ முடியும் என்று சொல்லுங்கள்!"""
-                }
-                
-                response_text = redirection_responses.get(language, redirection_responses["english"])
-                
-                # Save to memory
-                memory.chat_memory.add_user_message(message)
-                memory.chat_memory.add_ai_message(response_text)
-                
-                return {
-                    "response": response_text,
-                    "language": language,
-                    "preferences": {},
-                    "session_id": session_id
-                }
-            
-            # Extract user preferences
+    def route(self, message, requested_language="auto", preferences=None):
+        """Language, preferences and intent of a turn, counted in the router stats once.
+
+        ``intent`` is REDIRECT for an off-topic message and None when intent
+        routing is off. Pass the result on as ``routing`` so the response
+        methods do not classify the turn again.
+        """
+        # Use requested language if provided, otherwise detect
+        language = self.detect_language(message, requested_language)
+        
+        # Check if message is real estate related
+        topic = self.topic_classifier.classify(message)
+        if not topic.is_related:
+            if self.intent_router:
+                self.intent_router.record(REDIRECT)
+            return {"language": language, "preferences": {}, "intent": REDIRECT}
+        
+        # Extract user preferences unless the caller already did
+        if preferences is None:
             preferences = self.extract_preferences(message, language)
+        
+        intent = None
+        if self.intent_router:
+            intent = self.intent_router.classify(message, preferences, topic)
+            self.intent_router.record(intent)
+        return {"language": language, "preferences": preferences, "intent": intent}
+    
+    def _route_turn(self, session_id, message, available_properties, requested_language, preferences, routing=None):
+        """Answer the turn if it needs no model.
+
+        Returns ``(result, None)`` for a redirection or a routed intent, which
+        the caller still records in memory, otherwise ``(None, turn)`` with
+        what ``_build_turn`` needs.
+        """
+        if routing is None:
+            routing = self.route(message, requested_language, preferences)
+        language, preferences, intent = routing["language"], routing["preferences"], routing["intent"]
+        
+        if intent == REDIRECT:
+            # Return a polite redirection message
+            REDIRECTIONS.inc(language=language)
+            return {
+                "response": self.REDIRECTION_RESPONSES.get(language, self.REDIRECTION_RESPONSES["english"]),
+                "language": language,
+                "preferences": {},
+                "session_id": session_id
+            }, None
+        
+        if intent not in (None, OPEN_ENDED):
+            return {
+                "response": self.routed_response(intent, language, message, preferences, available_properties),
+                "language": language,
+                "preferences": preferences,
+                "session_id": session_id
+            }, None
+        
+        return None, {"language": language, "preferences": preferences}
+    
+    def _build_turn(self, session_id, message, turn, available_properties, history):
+        """Add the prompt and cache key to a turn the model has to answer"""
+        language = turn["language"]
+        
+        # Prepare properties context (already ranked by relevance)
+        property_lines = [
+            f"Property {i+1}: {p.get('title', 'No title')} in {p.get('location', 'Unknown location')}, "
+            f"{p.get('bedrooms', 'N/A')}BR, AED {p.get('price', 'N/A')}, {p.get('property_type', 'Unknown type')}"
+            for i, p in enumerate((available_properties or [])[:5])
+        ]
+        
+        # Recent history within the token budget, older turns as a rolling summary
+        with stage("prompt"):
+            prompt = self.prompt_builder.build(session_id, language, property_lines, history, message)
+        
+        cache_key = None
+        if self.response_cache:
+            cache_key = self.response_cache.make_key(message, language, prompt.properties_context, history, inventory.version)
+        
+        return {
+            **turn,
+            "prompt": prompt.text,
+            "prompt_tokens": prompt.tokens,
+            "cache_key": cache_key
+        }
+    
+    def _prepare_turn(self, session_id, message, available_properties, requested_language, preferences, routing=None):
+        """Resolve language, topic check and prompt for a chat turn.
+
+        Returns ``(result, None)`` when the turn is answered without the model
+        (redirection or a routed intent), otherwise ``(None, turn)`` with the
+        formatted prompt.
+        """
+        result, turn = self._route_turn(session_id, message, available_properties, requested_language, preferences, routing)
+        if result is not None:
+            self.remember(session_id, message, result["response"])
+            return result, None
+        return None, self._build_turn(session_id, message, turn, available_properties, self.get_memory(session_id))
+    
+    async def _aprepare_turn(self, session_id, message, available_properties, requested_language, preferences, routing=None):
+        """``_prepare_turn`` with the memory store kept off the event loop"""
+        result, turn = self._route_turn(session_id, message, available_properties, requested_language, preferences, routing)
+        if result is not None:
+            await self.aremember(session_id, message, result["response"])
+            return result, None
+        history = await self.aget_memory(session_id)
+        return None, self._build_turn(session_id, message, turn, available_properties, history)
+    
+    def routed_response(self, intent, language, message, preferences, available_properties):
+        """Deterministic answer for an intent the router took away from the model"""
+        if intent == PROPERTY_SEARCH:
+            return render_search(language, preferences, available_properties)
+        if intent == COMPANY_INFO:
+            return self.get_structured_fallback_response(language, message, topic="company")
+        return self.get_structured_fallback_response(language, message, topic="general")
+    
+    def _cached_response(self, turn):
+        if not turn["cache_key"]:
+            return None
+        return self.response_cache.get(turn["cache_key"])
+    
+    def _model_response_text(self, turn, message, response):
+        """Extract and format the model text, caching it; fall back when empty"""
+        # Get the response text safely and enhance formatting
+        if response and hasattr(response, 'text'):
+            self._count_tokens(turn, response.text)
+            with stage("format"):
+                response_text = self.enhance_response_formatting(response.text)
+            if turn["cache_key"] and response_text:
+                self.response_cache.set(turn["cache_key"], response_text)
+            return response_text
+        FALLBACKS.inc(reason="empty")
+        return self.get_structured_fallback_response(turn["language"], message)
+    
+    @staticmethod
+    def _count_tokens(turn, response_text):
+        LLM_TOKENS.inc(turn["prompt_tokens"], direction="prompt")
+        LLM_TOKENS.inc(estimate_tokens(response_text), direction="response")
+    
+    @staticmethod
+    def _turn_result(session_id, turn, response_text):
+        return {
+            "response": response_text,
+            "language": turn["language"],
+            "preferences": turn["preferences"],
+            "session_id": session_id
+        }
+    
+    def _complete_turn(self, session_id, message, turn, response_text):
+        """Record the response in memory and build the result"""
+        self.remember(session_id, message, response_text)
+        return self._turn_result(session_id, turn, response_text)
+    
+    async def _acomplete_turn(self, session_id, message, turn, response_text):
+        await self.aremember(session_id, message, response_text)
+        return self._turn_result(session_id, turn, response_text)
+    
+    def _fallback_result(self, session_id, message, requested_language, error):
+        if isinstance(error, CircuitOpenError):
+            # Expected while the upstream is unhealthy; no traceback per request
+            FALLBACKS.inc(reason="circuit_open")
+            logger.warning(f"Gemini unavailable, serving fallback: {error}")
+        else:
+            FALLBACKS.inc(reason=type(error).__name__)
+            logger.error(f"Error generating Gemini response: {error}", exc_info=error)
+        
+        # Use requested language for fallback response
+        fallback_language = self.detect_language(message, requested_language)
+        return {
+            "response": self.get_structured_fallback_response(fallback_language, message),
+            "language": fallback_language,
+            "preferences": {},
+            "session_id": session_id
+        }
+    
+    def generate_response(self, session_id, message, available_properties=None, requested_language="auto", preferences=None, routing=None):
+        try:
+            result, turn = self._prepare_turn(session_id, message, available_properties, requested_language, preferences, routing)
+            if result is not None:
+                return result
             
-            # Prepare properties context
-            properties_context = "No properties available"
-            if available_properties and len(available_properties) > 0:
-                properties_context = "\n".join([
-                    f"Property {i+1}: {p.get('title', 'No title')} in {p.get('location', 'Unknown location')}, "
-                    f"{p.get('bedrooms', 'N/A')}BR, AED {p.get('price', 'N/A')}, {p.get('property_type', 'Unknown type')}"
-                    for i, p in enumerate(available_properties[:5])
-                ])
-            
-            # Get formatted conversation history from memory
-            history_text = self.format_messages_for_prompt(memory)
-            
-            # Format the prompt using LangChain template with explicit language instruction
-            formatted_prompt = self.chat_prompt.format(
-                language=language,
-                properties_context=properties_context,
-                history=history_text,
-                text=message
-            )
+            cached = self._cached_response(turn)
+            if cached is not None:
+                return self._complete_turn(session_id, message, turn, cached)
             
             # Generate response using Gemini with safety settings
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.8,
-                "top_k": 40,
-                "max_output_tokens": 1024,
-            }
-            
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH", 
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                },
-            ]
+            with stage("llm"):
+                response = self.llm.generate(
+                    turn["prompt"],
+                    generation_config=self.GENERATION_CONFIG,
+                    safety_settings=self.SAFETY_SETTINGS
+                )
             
-            response = self.model.generate_content(
-                formatted_prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
+            return self._complete_turn(session_id, message, turn, self._model_response_text(turn, message, response))
             
-            # Get the response text safely and enhance formatting
-            if response and hasattr(response, 'text'):
-                response_text = self.enhance_response_formatting(response.text)
-            else:
-                response_text = self.get_structured_fallback_response(language, message)
+        except Exception as e:
+            return self._fallback_result(session_id, message, requested_language, e)
+    
+    async def agenerate_response(self, session_id, message, available_properties=None, requested_language="auto", preferences=None, routing=None):
+        """Async variant of generate_response that does not block the event loop"""
+        try:
+            result, turn = await self._aprepare_turn(session_id, message, available_properties, requested_language, preferences, routing)
+            if result is not None:
+                return result
             
-            # Save to memory
-            memory.chat_memory.add_user_message(message)
-            memory.chat_memory.add_ai_message(response_text)
+            cached = self._cached_response(turn)
+            if cached is not None:
+                return await self._acomplete_turn(session_id, message, turn, cached)
             
-            return {
-                "response": response_text,
-                "language": language,
-                "preferences": preferences,
-                "session_id": session_id
-            }
+            with stage("llm"):
+                response = await self.llm.agenerate(
+                    turn["prompt"],
+                    generation_config=self.GENERATION_CONFIG,
+                    safety_settings=self.SAFETY_SETTINGS
+                )
             
+            return await self._acomplete_turn(session_id, message, turn, self._model_response_text(turn, message, response))
+
         except Exception as e:
-            print(f"Error generating Gemini response: {e}")
-            import traceback
-            print(f"Full traceback: {traceback.format_exc()}")
+            return self._fallback_result(session_id, message, requested_language, e)
+
+    async def astream_response(self, session_id, message, available_properties=None, requested_language="auto", preferences=None, outcome=None, routing=None):
+        """Stream the formatted response as it is generated.
+
+        Yields formatted text pieces that concatenate to the full response.
+        ``outcome`` is filled with language, preferences and the response so
+        far; memory is updated when the generator closes, including when the
+        client disconnects mid-stream.
+        """
+        outcome = outcome if outcome is not None else {}
+        outcome.update({"response": "", "language": self.detect_language(message, requested_language), "preferences": {}})
+        pieces = []
+
+        def emit(piece):
+            pieces.append(piece)
+            outcome["response"] = "".join(pieces)
+            return piece
+
+        try:
+            result, turn = await self._aprepare_turn(session_id, message, available_properties, requested_language, preferences, routing)
+            if result is not None:
+                # Redirections and routed answers are recorded in memory by _aprepare_turn already
+                outcome.update(result)
+                yield result["response"]
+                return
+
+            outcome.update({"language": turn["language"], "preferences": turn["preferences"]})
+            cached = self._cached_response(turn)
+            if cached is not None:
+                yield emit(cached)
+                return
             
-            # Use requested language for fallback response
-            fallback_language = self.detect_language(message, requested_language)
-            return {
-                "response": self.get_structured_fallback_response(fallback_language, message),
-                "language": fallback_language,
-                "preferences": {},
-                "session_id": session_id
-            }
-    
-    def get_structured_fallback_response(self, language, user_message):
-        """Get structured fallback response with proper formatting in the correct language"""
+            formatter = IncrementalFormatter(self.enhance_response_formatting)
+            try:
+                chunks = self.llm.astream(
+                    turn["prompt"],
+                    generation_config=self.GENERATION_CONFIG,
+                    safety_settings=self.SAFETY_SETTINGS
+                )
+                async for text in chunks:
+                    for piece in formatter.feed(text):
+                        yield emit(piece)
+                for piece in formatter.flush():
+                    yield emit(piece)
+                if pieces:
+                    self._count_tokens(turn, outcome["response"])
+                if pieces and turn["cache_key"]:
+                    self.response_cache.set(turn["cache_key"], outcome["response"])
+            except Exception as e:
+                # No traceback per request while the breaker is open
+                logger.error(f"Error streaming Gemini response: {e}", exc_info=not isinstance(e, CircuitOpenError))
+                if pieces:
+                    return
+                FALLBACKS.inc(reason="circuit_open" if isinstance(e, CircuitOpenError) else type(e).__name__)
+
+            if not pieces:
+                yield emit(self.get_structured_fallback_response(turn["language"], message))
+        finally:
+            if pieces:
+                # Shielded: a disconnect must not lose the part of the answer already sent
+                with anyio.CancelScope(shield=True):
+                    await self.aremember(session_id, message, outcome["response"])
+
+    def get_structured_fallback_response(self, language, user_message, topic=None):
+        """Get structured fallback response with proper formatting in the correct language
+
+        ``topic`` ("company", "property" or "general") picks the response
+        directly; otherwise it is guessed from keywords in the message.
+        """
         user_message_lower = user_message.lower()
+        if topic is None:
+            if "company" in user_message_lower or "developer" in user_message_lower or "real estate" in user_message_lower:
+                topic = "company"
+            elif "property" in user_message_lower or "house" in user_message_lower or "apartment" in user_message_lower:
+                topic = "property"
+            else:
+                topic = "general"
         
-        if "company" in user_message_lower or "developer" in user_message_lower or "real estate" in user_message_lower:
+        if topic == "company":
             # Company/developer related queries
             fallback_responses = {
                 "english": """TOP REAL ESTATE COMPANIES IN DUBAI
@@ -599,7 +715,7 @@ These leading developers have significantly contributed to Dubai's growth and re
 முடிவு
 இந்த முன்னணி டெவலப்பர்கள் டுபாயின் வளர்ச்சி மற்றும் உலகளாவிய ரியல் எஸ்டேட் மையமாக அதன் நற்பெயரில் கணிசமாக பங்களித்துள்ளனர், குடியிருப்பு, வணிக மற்றும் விருந்தோம்பல் துறைகளில் மாறுபட்ட முதலீட்டு வாய்ப்புகளை வழங்குகின்றன, அதே நேரத்தில் நகரின் நகர்ப்புற காட்சியை தொடர்ந்து புதுமைப்படுத்துகின்றன."""
             }
-        elif "property" in user_message_lower or "house" in user_message_lower or "apartment" in user_message_lower:
+        elif topic == "property":
             # Property-related queries
             fallback_responses = {
                 "english": """PROPERTY ASSISTANCE
@@ -748,5 +864,9 @@ Please tell me what you're looking for - whether it's buying, renting, investing
     
     def clear_memory(self, session_id):
         """Clear conversation memory for a session"""
-        if session_id in self.memories:
-            del self.memories[session_id]
\ No newline at end of file
+        self.memory_store.clear(session_id)
+        self.prompt_builder.clear(session_id)
+    
+    async def aclear_memory(self, session_id):
+        await self.memory_store.aclear(session_id)
+        self.prompt_builder.clear(session_id)
\ No newline at end of file
@@ -0,0 +1,404 @@
+import re
+import threading
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import Property
+
+# Digits and separators from Arabic-Indic, Eastern Arabic-Indic and Tamil scripts
+# mapped 1:1 onto ASCII, plus the alef variants, so token spans stay valid
+_NORMALISE = str.maketrans({
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0BE6 + i): str(i) for i in range(10)},
+    "٫": ".", "٬": ",", "أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي",
+})
+
+_WORD = r"[\w\u0610-\u061A\u064B-\u065F\u0670\u0B80-\u0BFF]"
+_TOKEN = re.compile(rf"(?P<num>\d+(?:[.,]\d+)*)|(?P<word>{_WORD}+)|(?P<sep>[-–~])")
+
+_ARABIC_PREFIXES = ("وال", "بال", "فال", "كال", "لل", "ال", "و", "ب", "ل", "ف", "ك")
+_ARABIC_SUFFIXES = ("ات", "ها", "ة", "ه")
+
+# Phrases that are not vocabulary values: kind -> {phrase: value}
+LEXICON = {
+    "number": {
+        "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+        "واحد": 1, "واحدة": 1, "اثنين": 2, "اثنان": 2, "ثلاث": 3, "ثلاثة": 3, "اربع": 4, "اربعة": 4,
+        "خمس": 5, "خمسة": 5, "ஒரு": 1, "ஒன்று": 1, "இரண்டு": 2, "மூன்று": 3, "நான்கு": 4, "ஐந்து": 5,
+    },
+    "unit": {
+        "k": 1e3, "thousand": 1e3, "m": 1e6, "mn": 1e6, "mil": 1e6, "million": 1e6, "millions": 1e6,
+        "الف": 1e3, "مليون": 1e6, "ملايين": 1e6,
+        "ஆயிரம்": 1e3, "லட்சம்": 1e5, "லட்ச": 1e5, "மில்லியன்": 1e6, "கோடி": 1e7,
+    },
+    "currency": {"aed": True, "dirham": True, "dirhams": True, "dhs": True, "درهم": True, "திர்ஹம்": True},
+    "budget": {
+        "budget": True, "price": True, "cost": True, "afford": True, "ميزانية": True, "سعر": True,
+        "பட்ஜெட்": True, "விலை": True,
+    },
+    "cmp": {
+        "under": "max", "below": "max", "less than": "max", "or less": "max", "max": "max",
+        "maximum": "max", "up to": "max", "upto": "max", "within": "max", "not more than": "max",
+        "over": "min", "above": "min", "more than": "min", "or more": "min", "min": "min",
+        "minimum": "min", "at least": "min", "starting": "min", "from": "min",
+        "around": "approx", "about": "approx", "approximately": "approx", "roughly": "approx",
+        "اقل من": "max", "تحت": "max", "حتى": "max", "اكثر من": "min", "فوق": "min", "حوالي": "approx",
+        "வரை": "max", "குறைவாக": "max", "கீழ்": "max", "மேல்": "min", "அதிகமாக": "min", "சுமார்": "approx",
+    },
+    # Comparators that may follow their amount ("500k or less", "50 லட்சம் வரை"); the rest only lead
+    "postfix": {
+        "or less": True, "or more": True, "max": True, "maximum": True, "min": True, "minimum": True,
+        "வரை": True, "குறைவாக": True, "கீழ்": True, "மேல்": True, "அதிகமாக": True,
+    },
+    "connector": {"to": True, "and": True, "or": True, "الى": True, "و": True, "முதல்": True},
+    # Units of distance, area and time: the amount before them is not a price
+    "measure": {
+        "km": True, "kms": True, "kilometer": True, "kilometre": True, "meter": True, "metre": True,
+        "sqft": True, "sq": True, "square feet": True, "minute": True, "mins": True, "كم": True, "متر": True,
+        "دقيقة": True, "கிமீ": True, "மீட்டர்": True, "நிமிடம்": True, "சதுர அடி": True,
+    },
+    "bedroom": {
+        "bedroom": True, "bed": True, "beds": True, "br": True, "bhk": True, "bedrooms": True,
+        "غرف": True, "غرفة": True, "غرفه": True, "غرف نوم": True, "படுக்கையறை": True,
+    },
+    # Arabic dual forms carry their own count ("بغرفتين" = two bedrooms)
+    "bedroom_dual": {"غرفتين": 2, "غرفتان": 2},
+}
+
+# Values known before the properties table is read: field -> {phrase: canonical value}
+SEED_VOCABULARY = {
+    "preferred_locations": {
+        "downtown": "downtown", "palm jumeirah": "palm jumeirah", "palm": "palm jumeirah",
+        "deira": "deira", "business bay": "business bay", "dubai marina": "dubai marina",
+        "marina": "dubai marina", "jumeirah": "jumeirah",
+        "داون تاون": "downtown", "نخلة جميرا": "palm jumeirah", "ديرة": "deira",
+        "الخليج التجاري": "business bay", "مارينا": "dubai marina", "جميرا": "jumeirah",
+        "டவுன்டவுன்": "downtown", "டெய்ரா": "deira", "பிசினஸ் பே": "business bay",
+        "மரீனா": "dubai marina", "ஜுமெய்ரா": "jumeirah",
+    },
+    "property_types": {
+        "apartment": "apartment", "flat": "apartment", "villa": "villa", "studio": "studio",
+        "penthouse": "penthouse", "house": "house", "townhouse": "townhouse",
+        "شقة": "apartment", "شقق": "apartment", "فيلا": "villa", "فلل": "villa", "استوديو": "studio",
+        "بنتهاوس": "penthouse", "منزل": "house", "بيت": "house", "تاون هاوس": "townhouse",
+        "அபார்ட்மெண்ட்": "apartment", "அடுக்குமாடி": "apartment", "வில்லா": "villa",
+        "வீடு": "house", "ஸ்டுடியோ": "studio", "பென்ட்ஹவுஸ்": "penthouse",
+    },
+    "amenities": {
+        "pool": "pool", "gym": "gym", "parking": "parking", "security": "security",
+        "beach": "beach", "garden": "garden",
+        "مسبح": "pool", "صالة رياضية": "gym", "موقف": "parking", "مواقف": "parking", "حديقة": "garden",
+        "நீச்சல் குளம்": "pool", "ஜிம்": "gym", "பார்க்கிங்": "parking", "தோட்டம்": "garden",
+    },
+}
+
+VOCABULARY_FIELDS = tuple(SEED_VOCABULARY)
+
+# Bare budget figures below this are read as thousands ("budget 500" -> 500,000)
+_THOUSANDS_BELOW = 1000
+
+# Bare numbers in this range are years ("reviews from 2023") unless money is mentioned
+_YEARS = (1900, 2100)
+
+# One-letter units that are also metres and kilometres ("100 m from the beach"): money only when
+# the message mentions money or a leading comparator prices the amount ("under 2M")
+_SHORT_UNITS = ("k", "m")
+_DISTANCE_CMPS = ("within",)
+
+
+def _is_arabic(word):
+    return "\u0600" <= word[0] <= "\u06FF"
+
+
+def _is_tamil(word):
+    return "\u0B80" <= word[0] <= "\u0BFF"
+
+
+def _parse_number(text):
+    """'1,500,000' -> 1500000.0, '1.5' -> 1.5, '1,5' -> 1.5"""
+    if "," in text:
+        head, *groups = text.split(",")
+        if all(len(g) == 3 for g in groups):
+            text = head + "".join(groups)
+        else:
+            text = text.replace(",", ".", 1).replace(",", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class PreferenceExtractor:
+    """Rule-based preference extraction compiled once and run in one pass.
+
+    Messages are tokenised into numbers, words and range separators; each
+    position is matched against a phrase lexicon (longest phrase first) that
+    covers units, currencies, comparators and the location, property type
+    and amenity vocabularies. Vocabularies start from built-in seeds and
+    grow from the properties table, so extracted values are the lowercased
+    column values the property query filters on.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._phrases = {}  # tuple of words -> {(kind, value)}
+        self._max_words = 1
+        self._tamil_lengths = []
+        for kind, entries in LEXICON.items():
+            for phrase, value in entries.items():
+                self._add(kind, phrase, value)
+        for field, entries in SEED_VOCABULARY.items():
+            for phrase, value in entries.items():
+                self._add(field, phrase, value)
+
+    @staticmethod
+    def normalise(text: str) -> str:
+        return text.lower().translate(_NORMALISE)
+
+    def _add(self, kind, phrase, value):
+        words = tuple(m.group() for m in re.finditer(f"{_WORD}+", self.normalise(phrase)))
+        if not words:
+            return
+        self._phrases.setdefault(words, set()).add((kind, value))
+        self._max_words = max(self._max_words, len(words))
+        if _is_tamil(words[0]) and len(words[0]) not in self._tamil_lengths:
+            self._tamil_lengths = sorted(self._tamil_lengths + [len(words[0])], reverse=True)
+
+    def add_properties(self, properties):
+        """Grow the vocabularies from property rows; subscribed to inventory writes"""
+        with self._lock:
+            for prop in properties:
+                location = (prop.location or "").split(",")[0].strip().lower()
+                if location:
+                    self._add("preferred_locations", location, location)
+                if prop.property_type:
+                    property_type = prop.property_type.strip().lower()
+                    self._add("property_types", property_type, property_type)
+                for amenity in prop.amenities or []:
+                    amenity = str(amenity).strip().lower()
+                    if not amenity:
+                        continue
+                    self._add("amenities", amenity, amenity)
+                    # "pool" also finds "private pool" and "swimming pool"
+                    head = amenity.split()[-1]
+                    if head != amenity:
+                        self._add("amenities", head, amenity)
+
+    def _vocabulary_query(self):
+        return select(Property.location, Property.property_type, Property.amenities)
+
+    def load(self, db: Session):
+        """Load location, type and amenity vocabularies from the properties table"""
+        self.add_properties(db.execute(self._vocabulary_query()).all())
+        self.loaded = True
+
+    async def aload(self, db: AsyncSession):
+        self.add_properties((await db.execute(self._vocabulary_query())).all())
+        self.loaded = True
+
+    def _forms(self, token):
+        """Token plus its de-inflected forms, most specific first"""
+        forms = [token]
+        if _is_arabic(token):
+            bases = [token] + [token[len(p):] for p in _ARABIC_PREFIXES if token.startswith(p) and len(token) > len(p) + 1]
+            for base in bases:
+                forms.append(base)
+                forms += [base[:-len(s)] for s in _ARABIC_SUFFIXES if base.endswith(s) and len(base) > len(s) + 1]
+        elif _is_tamil(token):
+            # Tamil case endings attach to the stem ("லட்சத்திற்குள்" -> "லட்ச")
+            forms += [token[:n] for n in self._tamil_lengths if n < len(token)]
+        else:
+            forms += [token[:-len(s)] for s in ("es", "s") if token.endswith(s) and len(token) > len(s) + 2]
+        return forms
+
+    def _match(self, tokens, i):
+        """Longest lexicon phrase starting at token ``i``: (length, {(kind, value)})"""
+        for n in range(min(self._max_words, len(tokens) - i), 0, -1):
+            window = tokens[i:i + n]
+            if any(kind != "word" for kind, _ in window):
+                continue
+            heads = self._forms(window[0][1]) if n == 1 else [window[0][1]] + self._forms(window[0][1])[1:]
+            rest = tuple(text for _, text in window[1:])
+            for head in heads:
+                entries = self._phrases.get((head,) + rest)
+                if entries is None and rest:
+                    # Allow the last word of a phrase to inflect ("swimming pools")
+                    for last in self._forms(rest[-1])[1:]:
+                        entries = self._phrases.get((head,) + rest[:-1] + (last,))
+                        if entries:
+                            break
+                if entries:
+                    return n, entries
+        return 0, ()
+
+    def tokenize(self, message):
+        tokens = []
+        for m in _TOKEN.finditer(self.normalise(message)):
+            kind = m.lastgroup
+            tokens.append(("word" if kind == "word" else kind, m.group()))
+        return tokens
+
+    def extract(self, message: str) -> dict:
+        preferences = {
+            "budget_min": None,
+            "budget_max": None,
+            "preferred_locations": [],
+            "property_types": [],
+            "bedrooms": None,
+            "amenities": []
+        }
+        tokens = self.tokenize(message or "")
+        amounts = []
+        budget_context = False
+        money_context = False  # a currency or budget word, not just a comparator
+        pending_cmp = None
+        pending_cue = False  # ``pending_cmp`` is a price comparator, not a distance one
+        last = None  # amount just read, while the next token may still qualify it
+        linked = False  # a range separator or connector follows ``last``
+
+        i = 0
+        while i < len(tokens):
+            kind, text = tokens[i]
+            n, entries = self._match(tokens, i) if kind == "word" else (0, ())
+            n = n or 1
+            kinds = dict(entries)
+            value = _parse_number(text) if kind == "num" else kinds.get("number")
+
+            if value is not None:
+                amount = _Amount(value, pending_cmp)
+                amount.cued = pending_cue
+                if linked and amounts:
+                    amount.low = amounts[-1]
+                    amounts[-1].high = amount
+                amounts.append(amount)
+                last, pending_cmp, pending_cue, linked = amount, None, False, False
+                i += n
+                continue
+
+            if kind == "sep" or "connector" in kinds:
+                linked = last is not None
+                i += n
+                continue
+            elif "unit" in kinds:
+                if last is not None and last.unit is None:
+                    last.unit = kinds["unit"]
+                    last.short = text in _SHORT_UNITS
+                elif text not in _SHORT_UNITS:
+                    # A bare unit counts one of it ("مليون درهم", "a million")
+                    last = _Amount(1, pending_cmp, unit=kinds["unit"])
+                    amounts.append(last)
+                    pending_cmp, pending_cue = None, False
+                i += n
+                continue
+            elif "currency" in kinds:
+                budget_context = money_context = True
+                if last is not None:
+                    last.currency = True
+                i += n
+                continue
+            elif "measure" in kinds:
+                if last is not None:
+                    for amount in (last.low, last):
+                        if amount is not None:
+                            amount.count = True
+            elif "bedroom_dual" in kinds:
+                preferences["bedrooms"] = kinds["bedroom_dual"]
+            elif "bedroom" in kinds:
+                if last is not None and not last.is_money():
+                    # "2-3 bedrooms" asks for at least the lower count; "2M or 3 bedrooms" is not a range
+                    first = last.low if last.low is not None and not last.low.is_money() else last
+                    first.count = last.count = True
+                    preferences["bedrooms"] = int(first.value)
+            elif "cmp" in kinds:
+                budget_context = True
+                # Postpositional comparators bind to the amount just read ("500k or less", "50 லட்சம் வரை")
+                if last is not None and last.cmp is None and "postfix" in kinds and not self._starts_amount(tokens, i + n):
+                    last.cmp = kinds["cmp"]
+                    last.cued = True
+                else:
+                    pending_cmp = kinds["cmp"]
+                    pending_cue = text not in _DISTANCE_CMPS
+            else:
+                if "budget" in kinds:
+                    budget_context = money_context = True
+                for field in VOCABULARY_FIELDS:
+                    for k, v in entries:
+                        if k == field:
+                            # "from the beach": a leading comparator does not reach past a place or feature
+                            pending_cmp, pending_cue = None, False
+                            if v not in preferences[field]:
+                                preferences[field].append(v)
+                # A small bare number directly before another noun counts it ("3 bathrooms")
+                if last is not None and not entries and last.unit is None and last.value <= 10:
+                    last.count = True
+            last, linked = None, False
+            i += n
+
+        self._apply_budget(preferences, amounts, budget_context, money_context)
+        return preferences
+
+    def _starts_amount(self, tokens, i):
+        if i >= len(tokens):
+            return False
+        if tokens[i][0] == "num":
+            return True
+        _, entries = self._match(tokens, i)
+        return any(k in ("number", "unit") for k, _ in entries)
+
+    @staticmethod
+    def _apply_budget(preferences, amounts, budget_context, money_context):
+        for amount in amounts:
+            if amount.count or amount.low is not None:
+                continue
+            high = amount.high
+            if not money_context and amount.is_year() and (high is None or high.is_year()):
+                continue
+            if not (money_context or amount.currency or amount.cued) and (amount.short or (high is not None and high.short)):
+                # "100 m from the beach", "2-3 km": a distance, not a price
+                continue
+            if high is not None and not high.count:
+                # "1-2M": the unit of the upper bound carries over to the lower one
+                if amount.unit is None and high.unit is not None and amount.value <= high.value:
+                    amount.unit = high.unit
+                if amount.is_money() or high.is_money() or budget_context:
+                    low, top = sorted((amount.aed(), high.aed()))
+                    preferences["budget_min"], preferences["budget_max"] = low, top
+                continue
+            if not (amount.is_money() or amount.cmp or budget_context):
+                continue
+            if amount.cmp == "min":
+                preferences["budget_min"] = amount.aed()
+            elif amount.cmp == "approx":
+                preferences["budget_min"] = int(amount.aed() * 0.9)
+                preferences["budget_max"] = int(amount.aed() * 1.1)
+            else:
+                # A stated budget or "under X" is a ceiling
+                preferences["budget_max"] = amount.aed()
+
+
+class _Amount:
+    __slots__ = ("value", "cmp", "unit", "short", "cued", "currency", "count", "low", "high")
+
+    def __init__(self, value, cmp=None, unit=None):
+        self.value = value
+        self.cmp = cmp
+        self.unit = unit
+        self.short = False  # the unit is a bare "k" or "m"
+        self.cued = False  # a leading price comparator ("under", "up to") prices it
+        self.currency = False
+        self.count = False
+        self.low = self.high = None  # the other end of a range
+
+    def is_money(self):
+        return self.unit is not None or self.currency
+
+    def is_year(self):
+        return not self.is_money() and float(self.value).is_integer() and _YEARS[0] <= self.value <= _YEARS[1]
+
+    def aed(self):
+        value = self.value * (self.unit or 1)
+        if self.unit is None and value < _THOUSANDS_BELOW:
+            value *= 1000
+        return int(round(value))
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from .memory_store import USER, ASSISTANT
+
+_PROPERTIES = "{properties_context}"
+_HISTORY = "{history}"
+
+NO_PROPERTIES = "No properties available"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer round trip.
+
+    About four characters per token for Latin text; Arabic and Tamil split
+    into far more tokens per character, so non-ASCII counts double.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars + 1) // 2
+
+
+def clip(text: str, tokens: int) -> str:
+    """Cut text to roughly ``tokens`` tokens on a word boundary"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    # Binary search the longest prefix that fits
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    if " " in cut[lo // 2:]:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + "…"
+
+
+def _message_line(role, content) -> str:
+    return f"User: {content}" if role == USER else f"Assistant: {content}"
+
+
+def _summary_line(role, content) -> str:
+    # The first line of an answer is usually its heading or topic sentence
+    text = " ".join((content or "").strip().split("\n", 1)[0].split()) if role == ASSISTANT else " ".join((content or "").split())
+    return ("User asked: " if role == USER else "Assistant answered: ") + clip(text, 30)
+
+
+class Prompt(NamedTuple):
+    text: str
+    properties_context: str
+    tokens: int
+    history_messages: int
+    summarised_messages: int
+
+
+class RollingSummaries:
+    """Per-session summary of the turns that no longer fit in the prompt.
+
+    Only messages that left the prompt window since the last build are
+    summarised; each session remembers the last message it folded in, so
+    a build costs a few lines at most. LRU bounded like the memory store.
+    """
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (lines, key of the last folded message)
+        self._lock = threading.Lock()
+
+    def update(self, session_id, messages, folded: int, max_tokens: int):
+        """Summary lines for ``messages[:folded]``, extending the cached summary"""
+        with self._lock:
+            lines, anchor = self._sessions.get(session_id, ((), None))
+            start = 0
+            if anchor is not None:
+                keys = [hash(tuple(m)) for m in messages]
+                if anchor in keys:
+                    # Everything up to the anchor is summarised already
+                    start = len(keys) - 1 - keys[::-1].index(anchor) + 1
+            if start < folded:
+                lines = tuple(lines) + tuple(_summary_line(role, content) for role, content in messages[start:folded])
+                anchor = hash(tuple(messages[folded - 1]))
+            # Oldest lines go first when the summary outgrows its budget
+            lines = list(lines)
+            while lines and sum(estimate_tokens(line) for line in lines) > max_tokens:
+                lines.pop(0)
+            if lines or anchor is not None:
+                self._sessions[session_id] = (tuple(lines), anchor)
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            return lines
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class PromptBuilder:
+    """Assembles the chat prompt within a token budget.
+
+    The system template is rendered once per language into the static text
+    around the property context and history slots. Each turn the system
+    text and the user message are always sent; the property context and
+    then the most recent history fill what is left of ``max_tokens``, and
+    older messages are folded into a rolling per-session summary.
+    """
+
+    def __init__(self, system_template: str, human_template: str = "{text}", max_tokens: int = 3000,
+                 summary_tokens: int = 250, max_sessions: int = 10000):
+        self.system_template = system_template
+        self.human_template = human_template
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.summaries = RollingSummaries(max_sessions)
+        self._rendered = {}  # language -> (head, middle, tail, static tokens)
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.unbudgeted_tokens = 0
+        self.summarised_messages = 0
+        self.build_seconds = 0.0
+
+    def _static(self, language):
+        rendered = self._rendered.get(language)
+        if rendered is None:
+            text = self.system_template.replace("{language}", language)
+            head, rest = text.split(_PROPERTIES, 1)
+            middle, tail = rest.split(_HISTORY, 1)
+            head = "System: " + head
+            tail = tail + "\nHuman: "
+            rendered = (head, middle, tail, estimate_tokens(head) + estimate_tokens(middle) + estimate_tokens(tail))
+            self._rendered[language] = rendered
+        return rendered
+
+    def build(self, session_id, language: str, property_lines, history, text: str) -> Prompt:
+        """Prompt for one turn; ``history`` is the session's (role, content) messages, oldest first"""
+        started = time.perf_counter()
+        head, middle, tail, static_tokens = self._static(language)
+        human = self.human_template.format(text=text)
+        left = self.max_tokens - static_tokens - estimate_tokens(human)
+
+        # Properties arrive ranked: keep the best ones that fit
+        kept = []
+        for line in property_lines or ():
+            cost = estimate_tokens(line) + 1
+            if cost > left - self.summary_tokens and kept:
+                break
+            kept.append(line)
+            left -= cost
+        properties_context = "\n".join(kept) or NO_PROPERTIES
+        if not kept:
+            left -= estimate_tokens(NO_PROPERTIES)
+
+        # Newest messages first, while they fit next to a summary of the rest
+        history = list(history or ())
+        recent = []
+        for role, content in reversed(history):
+            line = _message_line(role, content)
+            cost = estimate_tokens(line) + 1
+            if cost > left - self.summary_tokens:
+                if not recent:
+                    # Always keep the last message, shortened if it must be
+                    line = clip(line, max(left - self.summary_tokens, 50))
+                    recent.append(line)
+                    left -= estimate_tokens(line) + 1
+                break
+            recent.append(line)
+            left -= cost
+        folded = len(history) - len(recent)
+
+        summary = self.summaries.update(session_id, history, folded, self.summary_tokens)
+        parts = []
+        if summary:
+            parts.append("Summary of earlier conversation:\n" + "\n".join(f"- {line}" for line in summary))
+        if recent:
+            parts.append("\n".join(reversed(recent)))
+        history_text = "\n\n".join(parts)
+
+        prompt = head + properties_context + middle + history_text + tail + human
+        tokens = static_tokens + estimate_tokens(properties_context) + estimate_tokens(history_text) + estimate_tokens(human)
+        unbudgeted = (static_tokens + estimate_tokens("\n".join(property_lines or ()) or NO_PROPERTIES)
+                      + estimate_tokens("\n".join(_message_line(r, c) for r, c in history)) + estimate_tokens(human))
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += tokens
+            self.unbudgeted_tokens += unbudgeted
+            self.summarised_messages += folded
+            self.build_seconds += time.perf_counter() - started
+        return Prompt(prompt, properties_context, tokens, len(recent), folded)
+
+    def clear(self, session_id):
+        self.summaries.clear(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            prompts, tokens, unbudgeted = self.prompts, self.prompt_tokens, self.unbudgeted_tokens
+            summarised, seconds = self.summarised_messages, self.build_seconds
+        return {
+            "prompts": prompts,
+            "max_tokens": self.max_tokens,
+            "avg_prompt_tokens": round(tokens / prompts, 1) if prompts else 0.0,
+            "avg_unbudgeted_tokens": round(unbudgeted / prompts, 1) if prompts else 0.0,
+            "tokens_saved": unbudgeted - tokens,
+            "reduction": round(1 - tokens / unbudgeted, 4) if unbudgeted else 0.0,
+            "summarised_messages": summarised,
+            "summarised_sessions": len(self.summaries),
+            "avg_build_ms": round(seconds * 1000 / prompts, 3) if prompts else 0.0,
+        }
@@ -0,0 +1,187 @@
+from sqlalchemy import select, case, or_, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models import Property, UserPreference
+from app.services.amenities import amenity_match_count
+from app.services.dedup import not_duplicate
+from app.services.property_index import property_index
+from app.services.property_search import escape_like
+from app.services.semantic_index import semantic_index
+from datetime import datetime
+
+# Number of properties handed to the agent as prompt context
+DEFAULT_CONTEXT_LIMIT = 5
+
+PREFERENCE_FIELDS = ("budget_min", "budget_max", "preferred_locations", "property_types", "bedrooms", "amenities")
+
+
+def merge_preferences(extracted: dict = None, stored: UserPreference = None) -> dict:
+    """Combine preferences from the current message with the stored session preferences.
+
+    Values found in the current message win; anything the user did not mention
+    falls back to what was stored for the session earlier.
+    """
+    merged = {field: None for field in PREFERENCE_FIELDS}
+    extracted = extracted or {}
+
+    for field in PREFERENCE_FIELDS:
+        value = extracted.get(field)
+        if value in (None, [], ""):
+            value = getattr(stored, field, None) if stored is not None else None
+        merged[field] = value
+
+    for field in ("preferred_locations", "property_types", "amenities"):
+        merged[field] = [str(v).lower() for v in (merged[field] or []) if v]
+
+    return merged
+
+
+def _location_filter(locations):
+    # Prefix match on lower(location) so the expression index can serve it
+    return or_(*[func.lower(Property.location).like(f"{escape_like(loc)}%", escape="\\") for loc in locations])
+
+
+def _within_budget(stmt, preferences: dict):
+    if preferences.get("budget_min"):
+        stmt = stmt.where(Property.price >= preferences["budget_min"])
+    if preferences.get("budget_max"):
+        stmt = stmt.where(Property.price <= preferences["budget_max"])
+    return stmt
+
+
+def build_property_query(preferences: dict, limit: int = DEFAULT_CONTEXT_LIMIT, strict: bool = True, now: datetime = None):
+    """Build a filtered, scored and limited SELECT over available properties.
+
+    Budget is always a hard filter. With ``strict`` the requested locations,
+    property types and bedroom count also filter rows; otherwise they only
+    contribute to the score. Amenities are always scored.
+    """
+    now = now or datetime.utcnow()
+    locations = preferences.get("preferred_locations") or []
+    property_types = preferences.get("property_types") or []
+    bedrooms = preferences.get("bedrooms")
+    amenities = preferences.get("amenities") or []
+
+    score_terms = [literal(0)]
+    if locations:
+        score_terms.append(case((_location_filter(locations), 4), else_=0))
+    if property_types:
+        score_terms.append(case((func.lower(Property.property_type).in_(property_types), 3), else_=0))
+    if bedrooms:
+        score_terms.append(case((Property.bedrooms == bedrooms, 2), (Property.bedrooms > bedrooms, 1), else_=0))
+    if amenities:
+        # One point per requested amenity, counted from the property_amenities index
+        score_terms.append(amenity_match_count(amenities))
+
+    score = sum(score_terms[1:], score_terms[0]).label("score")
+
+    stmt = _within_budget(select(Property, score).where(Property.available_from <= now, not_duplicate()), preferences)
+
+    if strict:
+        if locations:
+            stmt = stmt.where(_location_filter(locations))
+        if property_types:
+            stmt = stmt.where(func.lower(Property.property_type).in_(property_types))
+        if bedrooms:
+            stmt = stmt.where(Property.bedrooms >= bedrooms)
+
+    return stmt.order_by(score.desc(), Property.price.asc(), Property.id.asc()).limit(limit)
+
+
+def property_to_dict(prop: Property) -> dict:
+    """Convert a Property row into the dict shape used for the agent context"""
+    return {
+        "id": prop.id,
+        "title": prop.title or "No Title",
+        "description": prop.description or "",
+        "price": float(prop.price) if prop.price else 0,
+        "location": prop.location or "Unknown Location",
+        "property_type": prop.property_type or "Unknown Type",
+        "bedrooms": prop.bedrooms or 0,
+        "bathrooms": prop.bathrooms or 0,
+        "area_sqft": float(prop.area_sqft) if prop.area_sqft else 0,
+        "amenities": prop.amenities or [],
+        "images": prop.images or []
+    }
+
+
+def has_structured_filters(preferences: dict) -> bool:
+    return any(preferences.get(field) for field in ("preferred_locations", "property_types", "bedrooms"))
+
+
+def retrieve_properties(db: Session, preferences: dict, limit: int = DEFAULT_CONTEXT_LIMIT):
+    """Return the top ``limit`` properties for the given preferences.
+
+    Runs the strict query first and relaxes location/type/bedroom filters
+    into scoring only when nothing matches them.
+    """
+    rows = db.execute(build_property_query(preferences, limit)).all()
+    if not rows and has_structured_filters(preferences):
+        rows = db.execute(build_property_query(preferences, limit, strict=False)).all()
+    return [property_to_dict(prop) for prop, _score in rows]
+
+
+async def _aavailable(db: AsyncSession, ids, now: datetime = None):
+    """Available, non-duplicate properties among ``ids``, in the order given"""
+    if not ids:
+        return []
+    rank = {pid: i for i, pid in enumerate(ids)}
+    stmt = select(Property).where(Property.id.in_(ids), Property.available_from <= (now or datetime.utcnow()), not_duplicate())
+    return sorted((await db.execute(stmt)).scalars(), key=lambda prop: rank[prop.id])
+
+
+async def _aretrieve_indexed(db: AsyncSession, preferences: dict, limit: int, strict: bool):
+    """Rank on the in-memory index and load only the winners; ``None`` when SQL has to decide"""
+    # Over-fetch: some ranked listings may not be available yet or be duplicates
+    ids = property_index.rank(
+        limit * 4,
+        locations=preferences.get("preferred_locations"),
+        property_types=preferences.get("property_types"),
+        bedrooms=preferences.get("bedrooms"),
+        amenities=preferences.get("amenities"),
+        budget_min=preferences.get("budget_min"),
+        budget_max=preferences.get("budget_max"),
+        strict=strict
+    )
+    rows = await _aavailable(db, ids)
+    if len(rows) < limit and len(ids) == limit * 4:
+        # Everything fetched was filtered out; lower-ranked rows may still qualify
+        return None
+    return rows[:limit]
+
+
+async def aretrieve_properties(db: AsyncSession, preferences: dict, limit: int = DEFAULT_CONTEXT_LIMIT):
+    """Async variant of retrieve_properties for the non-blocking chat path.
+
+    Ranks on the in-memory property index when it is loaded, so only the
+    returned rows are read from the database; until then (it loads in the
+    background) the SQL query answers.
+    """
+    if property_index.loaded:
+        if property_index.is_stale():
+            property_index.load_in_background()
+        rows = await _aretrieve_indexed(db, preferences, limit, strict=True)
+        if rows == [] and has_structured_filters(preferences):
+            rows = await _aretrieve_indexed(db, preferences, limit, strict=False)
+        if rows is not None:
+            return [property_to_dict(prop) for prop in rows]
+    else:
+        property_index.load_in_background()
+
+    rows = (await db.execute(build_property_query(preferences, limit))).all()
+    if not rows and has_structured_filters(preferences):
+        rows = (await db.execute(build_property_query(preferences, limit, strict=False))).all()
+    return [property_to_dict(prop) for prop, _score in rows]
+
+
+async def aretrieve_semantic(db: AsyncSession, message: str, preferences: dict, limit: int = DEFAULT_CONTEXT_LIMIT, now: datetime = None):
+    """Available properties closest to the free-text message, within the budget"""
+    semantic_index.ensure_fresh()
+    # Over-fetch: some of the nearest listings may be over budget or not yet available
+    hits = semantic_index.search(message, limit * 4)
+    if not hits:
+        return []
+    rank = {pid: i for i, (pid, _score) in enumerate(hits)}
+    stmt = select(Property).where(Property.id.in_(list(rank)), Property.available_from <= (now or datetime.utcnow()), not_duplicate())
+    rows = sorted((await db.execute(_within_budget(stmt, preferences))).scalars(), key=lambda prop: rank[prop.id])
+    return [property_to_dict(prop) for prop in rows[:limit]]
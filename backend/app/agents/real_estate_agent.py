@@ -1,55 +1,145 @@
 from .multilingual import MultilingualRealEstateAgent
-from sqlalchemy.orm import Session
-from app.models import Property, UserPreference, Conversation
+from .memory_store import create_memory_store, USER, ASSISTANT
+from .response_cache import ResponseCache
+from .intent_router import IntentRouter, REDIRECT, GREETING, COMPANY_INFO
+from .prompt_builder import PromptBuilder
+from .llm_client import ResilientModel, CircuitBreaker
+from .fake_model import FakeModel
+from .property_retrieval import merge_preferences, aretrieve_properties, aretrieve_semantic, has_structured_filters
+from .preference_extractor import PreferenceExtractor
+from .model_resolver import ModelResolver
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import UserPreference, Conversation
+from app.services.inventory import inventory
+from app.services.chat_writes import enqueue_turn, preference_rows, preference_upsert
+from app.services.session_locks import SessionLocks
+from app.services.percolator import percolator
+from app.services.metrics import stage, ERRORS
+import anyio
 import json
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Routed intents answered without listings: retrieval is skipped for them
+NO_PROPERTY_INTENTS = (REDIRECT, GREETING, COMPANY_INFO)
+
 class RealEstateAgentService:
     def __init__(self, api_key: str):
+        if settings.FAKE_LLM:
+            # The fake model never calls Gemini, so no key is needed
+            api_key = api_key or "fake"
         if not api_key:
             raise ValueError("Gemini API key is required")
-        self.agent = MultilingualRealEstateAgent(api_key)
-    
-    def process_message(self, db: Session, session_id: str, message: str, requested_language: str = "auto", user_id: int = None):
+        memory_store = create_memory_store(
+            settings.MEMORY_BACKEND,
+            max_messages=settings.MEMORY_MAX_MESSAGES,
+            max_sessions=settings.MEMORY_MAX_SESSIONS,
+            ttl_seconds=settings.MEMORY_TTL_SECONDS,
+            path=settings.MEMORY_STORE_PATH
+        )
+        response_cache = False
+        if settings.RESPONSE_CACHE_ENABLED:
+            response_cache = ResponseCache(
+                max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                history_messages=settings.RESPONSE_CACHE_HISTORY_MESSAGES
+            )
+            # Listings changed: answers quoting the old context are stale
+            inventory.subscribe(response_cache.invalidate)
+        preference_extractor = PreferenceExtractor()
+        # New listings extend the location, type and amenity vocabularies
+        inventory.subscribe(preference_extractor.add_properties)
+        model_resolver = ModelResolver(
+            api_key,
+            model_name=settings.GEMINI_MODEL,
+            cache_path=settings.GEMINI_MODEL_CACHE_PATH,
+            cache_ttl_seconds=settings.GEMINI_MODEL_CACHE_TTL_SECONDS
+        )
+        self.session_locks = SessionLocks()
+        prompt_builder = PromptBuilder(
+            MultilingualRealEstateAgent.SYSTEM_TEMPLATE,
+            max_tokens=settings.PROMPT_MAX_TOKENS,
+            summary_tokens=settings.PROMPT_SUMMARY_TOKENS,
+            max_sessions=settings.MEMORY_MAX_SESSIONS
+        )
+        self.agent = MultilingualRealEstateAgent(
+            api_key,
+            memory_store=memory_store,
+            response_cache=response_cache,
+            preference_extractor=preference_extractor,
+            model_resolver=model_resolver,
+            intent_router=IntentRouter() if settings.INTENT_ROUTING_ENABLED else False,
+            prompt_builder=prompt_builder,
+            llm=ResilientModel(
+                lambda: self.agent.model,
+                deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+                max_retries=settings.LLM_MAX_RETRIES,
+                hedge=settings.LLM_HEDGE_ENABLED,
+                breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+            )
+        )
+        if settings.FAKE_LLM:
+            self.agent.model = FakeModel(
+                latency=settings.FAKE_LLM_LATENCY_MS / 1000,
+                jitter=settings.FAKE_LLM_JITTER_MS / 1000,
+                error_rate=settings.FAKE_LLM_ERROR_RATE,
+                tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND
+            )
+
+    async def process_message(self, db: AsyncSession, session_id: str, message: str, requested_language: str = "auto", user_id: int = None):
+        # One turn per session at a time, so memory updates land in message order
+        async with self.session_locks.hold(session_id):
+            return await self._process_message(db, session_id, message, requested_language, user_id)
+
+    async def _process_message(self, db: AsyncSession, session_id: str, message: str, requested_language: str, user_id: int):
         try:
-            # Get available properties from database
-            properties = self.get_available_properties(db)
-            
+            # Extract preferences up front so they can drive property retrieval
+            language = self.agent.detect_language(message, requested_language)
+            with stage("preferences"):
+                await self.ensure_vocabulary(db)
+                preferences = self.agent.extract_preferences(message, language)
+
+                # Load the stored session preferences once; reused for retrieval and the upsert
+                stored_preferences = await self.get_stored_preferences(db, session_id)
+            # Route before retrieval: greetings, company questions and redirections need no listings
+            routing = self.agent.route(message, requested_language, preferences)
+            with stage("memory"):
+                await self.ensure_memory(db, session_id)
+
+            # Get the most relevant available properties from database
+            properties = []
+            if routing["intent"] not in NO_PROPERTY_INTENTS:
+                with stage("properties"):
+                    properties = await self.get_available_properties(db, preferences, stored_preferences, message)
+
             # Generate response using Gemini with requested language
-            result = self.agent.generate_response(
-                session_id, 
-                message, 
+            result = await self.agent.agenerate_response(
+                session_id,
+                message,
                 properties,
-                requested_language
+                requested_language,
+                preferences=preferences,
+                routing=routing
             )
-            
-            # Save conversation with user_id
-            conversation = Conversation(
-                session_id=session_id,
-                user_id=user_id,  # Link to specific user
-                user_message=message,
-                agent_response=result["response"],
-                language=result["language"],
-                conversation_data={"preferences": result.get("preferences", {})}
-            )
-            db.add(conversation)
-            
-            # Update user preferences if new preferences detected
-            if result.get("preferences"):
-                self.update_user_preferences(db, session_id, result["preferences"], result["language"])
-            
-            db.commit()
-            
+
+            with stage("commit"):
+                await self.save_turn(db, session_id, user_id, message, result)
+
             return {
                 "response": result["response"],
                 "language": result["language"],
                 "session_id": session_id,
                 "timestamp": datetime.utcnow().isoformat()
             }
-            
+
         except Exception as e:
-            db.rollback()
-            print(f"Error in process_message: {e}")
+            await db.rollback()
+            ERRORS.inc(component="process_message")
+            logger.exception(f"Error in process_message: {e}")
             # Return a fallback response
             return {
                 "response": "I'm experiencing technical difficulties. Please try again in a moment.",
@@ -57,51 +147,175 @@ class RealEstateAgentService:
                 "session_id": session_id,
                 "timestamp": datetime.utcnow().isoformat()
             }
-    
-    def get_available_properties(self, db: Session):
+
+    async def stream_message(self, db: AsyncSession, session_id: str, message: str, requested_language: str = "auto", user_id: int = None):
+        """Stream a chat turn as ``(event, payload)`` tuples.
+
+        Emits ``start`` once the language is known, one ``delta`` per formatted
+        chunk and ``done`` at the end. The turn is persisted when the stream
+        finishes or is cancelled, with whatever response was produced so far.
+        """
+        events = self._stream_message(db, session_id, message, requested_language, user_id)
+        async with self.session_locks.hold(session_id):
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                # Persist the turn before the next one for this session may start
+                await events.aclose()
+
+    async def _stream_message(self, db: AsyncSession, session_id: str, message: str, requested_language: str, user_id: int):
+        language = self.agent.detect_language(message, requested_language)
+        with stage("preferences"):
+            await self.ensure_vocabulary(db)
+            preferences = self.agent.extract_preferences(message, language)
+            stored_preferences = await self.get_stored_preferences(db, session_id)
+        routing = self.agent.route(message, requested_language, preferences)
+        with stage("memory"):
+            await self.ensure_memory(db, session_id)
+        properties = []
+        if routing["intent"] not in NO_PROPERTY_INTENTS:
+            with stage("properties"):
+                properties = await self.get_available_properties(db, preferences, stored_preferences, message)
+
+        outcome = {}
+        stream = self.agent.astream_response(
+            session_id,
+            message,
+            properties,
+            requested_language,
+            preferences=preferences,
+            outcome=outcome,
+            routing=routing
+        )
+        try:
+            started = False
+            try:
+                async for piece in stream:
+                    if not started:
+                        started = True
+                        yield "start", {"session_id": session_id, "language": outcome["language"]}
+                    # Pieces carry their leading break; deltas concatenate to the full response
+                    yield "delta", {"text": piece}
+            except Exception as e:
+                ERRORS.inc(component="stream_message")
+                logger.exception(f"Error in stream_message: {e}")
+                if started:
+                    raise
+                outcome.update({
+                    "response": "I'm experiencing technical difficulties. Please try again in a moment.",
+                    "language": language,
+                    "preferences": {}
+                })
+                yield "start", {"session_id": session_id, "language": language}
+                yield "delta", {"text": outcome["response"]}
+
+            yield "done", {
+                "session_id": session_id,
+                "language": outcome["language"],
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        finally:
+            # Closing the agent stream records the (possibly partial) turn in memory
+            await stream.aclose()
+            if outcome.get("response"):
+                # Shield persistence from the cancellation of a disconnected client
+                with anyio.CancelScope(shield=True):
+                    try:
+                        with stage("commit"):
+                            await self.save_turn(db, session_id, user_id, message, outcome)
+                    except Exception as e:
+                        await db.rollback()
+                        ERRORS.inc(component="save_turn")
+                        logger.exception(f"Error saving streamed turn: {e}")
+
+    async def save_turn(self, db: AsyncSession, session_id: str, user_id: int, message: str, result: dict):
+        """Persist the conversation row and any detected preferences for a turn"""
+        if settings.WRITE_BEHIND_ENABLED:
+            await enqueue_turn(session_id, user_id, message, result)
+            self.save_search(session_id, result.get("preferences"))
+            return
+
+        # Save conversation with user_id
+        conversation = Conversation(
+            session_id=session_id,
+            user_id=user_id,  # Link to specific user
+            user_message=message,
+            agent_response=result["response"],
+            language=result["language"],
+            conversation_data={"preferences": result.get("preferences", {})}
+        )
+        db.add(conversation)
+
+        # Update user preferences if new preferences detected
+        if result.get("preferences"):
+            await self.update_user_preferences(db, session_id, result["preferences"], result["language"])
+
+        await db.commit()
+        self.save_search(session_id, result.get("preferences"))
+
+    @staticmethod
+    def save_search(session_id: str, preferences: dict = None):
+        """Start (or refine) the saved search that new listings are percolated against"""
+        if session_id and preferences:
+            percolator.update(session_id, preferences)
+
+    async def ensure_memory(self, db: AsyncSession, session_id: str):
+        """Rehydrate session memory from the conversations table on a store miss"""
+        store = self.agent.memory_store
+        if await store.acontains(session_id):
+            return
         try:
-            properties = db.query(Property).filter(
-                Property.available_from <= datetime.utcnow()
-            ).all()
-            
-            return [
-                {
-                    "id": prop.id,
-                    "title": prop.title or "No Title",
-                    "description": prop.description or "",
-                    "price": float(prop.price) if prop.price else 0,
-                    "location": prop.location or "Unknown Location",
-                    "property_type": prop.property_type or "Unknown Type",
-                    "bedrooms": prop.bedrooms or 0,
-                    "bathrooms": prop.bathrooms or 0,
-                    "area_sqft": float(prop.area_sqft) if prop.area_sqft else 0,
-                    "amenities": prop.amenities or [],
-                    "images": prop.images or []
-                }
-                for prop in properties
-            ]
+            result = await db.execute(
+                select(Conversation.user_message, Conversation.agent_response)
+                .where(Conversation.session_id == session_id)
+                .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+                .limit(store.max_messages // 2)
+            )
         except Exception as e:
-            print(f"Error getting properties: {e}")
-            return []
-    
-    def update_user_preferences(self, db: Session, session_id: str, preferences: dict, language: str):
+            logger.error(f"Error loading conversation memory: {e}")
+            return
+        messages = []
+        for user_message, agent_response in reversed(result.all()):
+            messages.append((USER, user_message or ""))
+            messages.append((ASSISTANT, agent_response or ""))
+        await store.aseed(session_id, messages)
+
+    async def ensure_vocabulary(self, db: AsyncSession):
+        """Load extractor vocabularies from the properties table on first use"""
+        extractor = self.agent.preference_extractor
+        if extractor.loaded:
+            return
         try:
-            # Find existing preferences or create new
-            existing = db.query(UserPreference).filter(UserPreference.session_id == session_id).first()
-            
-            if existing:
-                # Update existing preferences
-                for key, value in preferences.items():
-                    if value is not None:
-                        setattr(existing, key, value)
-            else:
-                # Create new preferences
-                new_prefs = UserPreference(
-                    session_id=session_id,
-                    language=language,
-                    **{k: v for k, v in preferences.items() if v is not None}
-                )
-                db.add(new_prefs)
-                
+            await extractor.aload(db)
         except Exception as e:
-            print(f"Error updating preferences: {e}")
\ No newline at end of file
+            await db.rollback()
+            # Seed vocabularies still work; retry on the next message
+            logger.error(f"Error loading preference vocabulary: {e}")
+
+    async def get_stored_preferences(self, db: AsyncSession, session_id: str):
+        if not session_id:
+            return None
+        result = await db.execute(
+            select(UserPreference).where(UserPreference.session_id == session_id).limit(1)
+        )
+        return result.scalars().first()
+
+    async def get_available_properties(self, db: AsyncSession, preferences: dict = None, stored_preferences: UserPreference = None, message: str = None):
+        try:
+            merged = merge_preferences(preferences, stored_preferences)
+            if message and not has_structured_filters(merged):
+                # Nothing to filter on: rank by what the message describes instead
+                properties = await aretrieve_semantic(db, message, merged, settings.PROPERTY_CONTEXT_LIMIT)
+                if properties:
+                    return properties
+            return await aretrieve_properties(db, merged, settings.PROPERTY_CONTEXT_LIMIT)
+        except Exception as e:
+            ERRORS.inc(component="properties")
+            logger.exception(f"Error getting properties: {e}")
+            return []
+
+    async def update_user_preferences(self, db: AsyncSession, session_id: str, preferences: dict, language: str):
+        # Same upsert as the write-behind flush: concurrent turns of a new session share one row
+        rows = preference_rows([{"session_id": session_id, "language": language, "preferences": preferences}])
+        await db.execute(preference_upsert(db.bind.dialect.name), rows)
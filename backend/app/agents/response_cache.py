@@ -0,0 +1,86 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """TTL and size bounded cache of formatted LLM responses.
+
+    Keys combine the normalized message, resolved language, a hash of the
+    property context, the last ``history_messages`` memory entries and the
+    inventory version, so a cached answer is only reused for an equivalent
+    prompt against the same listings.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 600, history_messages: int = 2):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.history_messages = history_messages
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Case-fold, drop punctuation and collapse whitespace"""
+        text = unicodedata.normalize("NFKC", message or "").casefold()
+        text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+        return " ".join(text.split())
+
+    def make_key(self, message, language, properties_context, history, inventory_version=0) -> str:
+        recent = history[-self.history_messages:] if self.history_messages else []
+        digest = hashlib.sha256()
+        for part in (
+            self.normalize(message),
+            language or "",
+            hashlib.sha256((properties_context or "").encode("utf-8")).hexdigest(),
+            "\x1e".join(f"{role}:{content}" for role, content in recent),
+            str(inventory_version),
+        ):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x1f")
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, text):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *_):
+        """Drop every entry; used when the property inventory changes"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,100 @@
+import re
+
+# A line break, or a whitespace run holding a paragraph break (from its first newline to its last)
+_BREAK = re.compile(r"\n(?:\s*\n)?")
+_HEADING_TAIL = re.compile(r"[A-Z]$")
+_HEADING_JOIN = re.compile(r"[A-Z\s]*[A-Z][A-Z][a-z]")
+_HEADING_RUN = re.compile(r"[A-Z\s]*")
+_LIST_NUMBER = re.compile(r"\d\.$")
+# Brackets a block so formatting it alone does not strip its edges
+_GUARD = "\ue000"
+
+
+class IncrementalFormatter:
+    """Apply a whole-text formatter to a token stream on safe chunk boundaries.
+
+    Tokens are buffered until a paragraph break (blank line) is seen; each
+    completed paragraph block is run through ``format_fn`` and released.
+    When a block grows past ``max_buffer`` without a paragraph break it is
+    released at the last line break instead, so long single-paragraph answers
+    still stream. Each piece after the first starts with the break it was
+    cut at, so the pieces concatenate to the formatted full text.
+
+    A break is only cut once the text after it is known, and not where the
+    formatter's rewrites reach across it (``enhance_response_formatting``
+    joins "1." to the next line, drops "#" with the whitespace after it and
+    splits capitals off a heading run); such text is carried to the next cut.
+    """
+
+    def __init__(self, format_fn, max_buffer: int = 400):
+        self.format_fn = format_fn
+        self.max_buffer = max_buffer
+        self.buffer = ""
+        self._started = False
+        self._tail = ""  # whitespace owed before the next piece
+
+    @staticmethod
+    def _joins(before: str, after: str) -> bool:
+        """Whether a rewrite of the full text could span the break between ``before`` and ``after``"""
+        before, after = before.rstrip(), after.lstrip()
+        # Emphasis markers are removed before headings, so "#" may end up just before the break
+        if before.rstrip("*` \t\n").endswith("#"):
+            return True
+        if _LIST_NUMBER.search(before) and after[:1].isupper():
+            return True
+        if _HEADING_TAIL.search(before):
+            if _HEADING_RUN.match(after).end() == len(after):
+                return True  # the capitals may go on in text not streamed yet
+            return bool(_HEADING_JOIN.match(after))
+        return False
+
+    def _cut_point(self):
+        """(start, end, delimiter) of the last safe break in the buffer, or None"""
+        paragraphs, lines = [], []
+        for match in _BREAK.finditer(self.buffer):
+            if not self.buffer[match.end():].strip():
+                break  # more whitespace may follow: the break is not complete yet
+            if match.start() == 0 or self._joins(self.buffer[:match.start()], self.buffer[match.end():]):
+                continue
+            (paragraphs if match.group().count("\n") > 1 else lines).append(match)
+        if paragraphs:
+            match = paragraphs[-1]
+            return match.start(), match.end(), "\n\n"
+        if lines and len(self.buffer) > self.max_buffer:
+            match = lines[-1]
+            return match.start(), match.end(), "\n"
+        return None
+
+    def _format(self, block):
+        """``format_fn`` of a block as it reads inside the full text, which is not stripped at the block's edges"""
+        return self.format_fn(_GUARD + block + _GUARD)[len(_GUARD):-len(_GUARD)]
+
+    def _emit(self, block, delimiter):
+        piece = self._tail + self._format(block)
+        if not self._started:
+            # The full text is stripped at the start
+            piece = piece.lstrip()
+        text = piece.rstrip()
+        # Whitespace is held back until text follows it: the full text is stripped at the end too
+        self._tail = piece[len(text):] + (delimiter or "")
+        if not text:
+            return []
+        self._started = True
+        return [text]
+
+    def feed(self, text: str):
+        """Add streamed text and return the formatted pieces that became complete"""
+        if not text:
+            return []
+        self.buffer += text
+        cut = self._cut_point()
+        if cut is None:
+            return []
+        start, end, delimiter = cut
+        block, self.buffer = self.buffer[:start], self.buffer[end:]
+        return self._emit(block, delimiter)
+
+    def flush(self):
+        """Format and return whatever is left once the stream has ended"""
+        block, self.buffer = self.buffer, ""
+        return self._emit(block, None)
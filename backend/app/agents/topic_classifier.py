@@ -0,0 +1,222 @@
+import re
+from typing import List, NamedTuple
+
+REAL_ESTATE = "real_estate"
+PROHIBITED = "prohibited"
+
+# Keyword vocabularies per language and category
+KEYWORDS = {
+    "english": {
+        REAL_ESTATE: [
+            'property', 'properties', 'real estate', 'realestate', 'house', 'apartment', 'villa',
+            'studio', 'penthouse', 'duplex', 'townhouse', 'condo', 'flat', 'rent', 'buy', 'purchase',
+            'sell', 'sale', 'investment', 'invest', 'price', 'cost', 'budget', 'aed', 'location',
+            'area', 'sqft', 'square feet', 'bedroom', 'bathroom', 'amenities', 'facilities',
+            'developer', 'construction', 'built', 'ready', 'offplan', 'off plan', 'community', 'compound',
+            'view', 'facing', 'parking', 'balcony', 'terrace', 'garden', 'pool', 'gym', 'security',
+            'maintenance', 'service', 'charge', 'fee', 'commission', 'agent', 'broker', 'agency',
+            'dubai', 'uae', 'emirates', 'emirate', 'burj', 'marina', 'palm', 'jumeirah', 'deira',
+            'downtown', 'business bay', 'sheikh zayed', 'szx', 'dubai hills', 'arabian ranches',
+            'motor city', 'sports city', 'international city', 'discovery gardens', 'jlt', 'jumeirah lake',
+            'dubai creek', 'dubai harbour', 'bluewaters', 'city walk', 'dubai design district', 'd3',
+            'al barsha', 'al quoz', 'al safa', 'al wasl', 'al manara', 'umm suqeim', 'nad al sheba',
+            'mirdif', 'meydan', 'ras al khor', 'dubai silicon oasis', 'dso', 'dubai investment park',
+            'dip', 'dubai land', 'dubai south', 'dubai world central', 'dwc', 'expo', 'expo city',
+            'rental', 'lease', 'tenancy', 'tenant', 'landlord', 'owner', 'mortgage', 'loan', 'finance',
+            'down payment', 'deposit', 'contract', 'agreement', 'ejari', 'rera', 'dld', 'dubai land department',
+            'transfer fee', 'registration', 'title deed', 'ownership', 'freehold', 'leasehold',
+            'home', 'bed', 'bhk', 'emaar', 'nakheel', 'damac', 'company'
+        ],
+        PROHIBITED: [
+            'car', 'vehicle', 'automotive', 'lamborghini', 'ferrari', 'porsche', 'bmw', 'mercedes', 'audi',
+            'toyota', 'honda', 'nissan', 'ford', 'chevrolet', 'hyundai', 'kia', 'volkswagen', 'volvo',
+            'stock', 'share', 'market', 'trading', 'crypto', 'bitcoin', 'ethereum', 'forex',
+            'currency', 'exchange', 'dollar', 'euro', 'pound', 'politics', 'government', 'election', 'vote',
+            'religion', 'islam', 'christian', 'hindu', 'buddhist', 'jewish', 'god', 'prayer', 'worship',
+            'technology', 'gadget', 'iphone', 'samsung', 'laptop', 'computer', 'software', 'hardware',
+            'travel', 'tourism', 'vacation', 'holiday', 'flight', 'airline', 'hotel', 'resort', 'beach',
+            'food', 'restaurant', 'cafe', 'cuisine', 'meal', 'dinner', 'lunch', 'breakfast', 'recipe',
+            'sports', 'football', 'soccer', 'cricket', 'tennis', 'basketball', 'golf', 'fitness', 'exercise',
+            'celebrity', 'movie', 'film', 'music', 'song', 'artist', 'actor', 'actress', 'entertainment',
+            'weather', 'climate', 'temperature', 'rain', 'sun', 'health', 'medical', 'doctor', 'hospital',
+            'education', 'school', 'university', 'college', 'course', 'study', 'learn', 'student'
+        ],
+    },
+    "arabic": {
+        REAL_ESTATE: [
+            'عقار', 'عقارات', 'عقاري', 'عقارية', 'شقة', 'شقق', 'فيلا', 'فلل', 'منزل', 'منازل', 'بيت', 'بيوت',
+            'استوديو', 'بنتهاوس', 'تاون هاوس', 'سكن', 'سكني', 'سكنية', 'ايجار', 'استئجار', 'شراء', 'بيع',
+            'استثمار', 'سعر', 'اسعار', 'ميزانية', 'درهم', 'غرفة', 'غرف', 'غرف نوم', 'حمام', 'موقع',
+            'منطقة', 'مناطق', 'مساحة', 'دبي', 'الامارات', 'مارينا', 'نخلة', 'جميرا', 'ديرة', 'داون تاون',
+            'الخليج التجاري', 'برج', 'مطور', 'مطورين', 'اعمار', 'نخيل', 'داماك', 'رهن', 'تمويل', 'عقد',
+            'مالك', 'مستاجر', 'تملك حر', 'مسبح', 'حديقة', 'موقف', 'مواقف', 'صالة رياضية', 'مجتمع', 'شركة',
+            'شركات', 'وسيط', 'وكيل', 'ملكية', 'سند ملكية', 'ايجاري'
+        ],
+        PROHIBITED: [
+            'سيارة', 'سيارات', 'اسهم', 'بورصة', 'عملات رقمية', 'بيتكوين', 'سياسة', 'انتخابات', 'دين',
+            'كرة القدم', 'رياضة', 'مطعم', 'مطاعم', 'طعام', 'وصفة', 'فيلم', 'افلام', 'موسيقى', 'اغنية',
+            'طقس', 'مستشفى', 'طبيب', 'جامعة', 'مدرسة', 'سفر', 'طيران', 'فندق', 'هاتف', 'كمبيوتر'
+        ],
+    },
+    "tamil": {
+        REAL_ESTATE: [
+            'வீடு', 'வீட்டு', 'வீடுகள்', 'அபார்ட்மெண்ட்', 'அடுக்குமாடி', 'வில்லா', 'சொத்து', 'சொத்துக்கள்',
+            'ரியல் எஸ்டேட்', 'வாடகை', 'வாங்க', 'விற்க', 'விற்பனை', 'விலை', 'பட்ஜெட்', 'படுக்கையறை',
+            'குளியலறை', 'டுபாய்', 'துபாய்', 'மரீனா', 'ஜுமெய்ரா', 'பாம்', 'டெய்ரா', 'டவுன்டவுன்',
+            'பிசினஸ் பே', 'முதலீடு', 'டெவலப்பர்', 'கடன்', 'ஒப்பந்தம்', 'நீச்சல் குளம்', 'ஜிம்',
+            'பார்க்கிங்', 'தோட்டம்', 'பகுதி', 'ஸ்டுடியோ', 'பென்ட்ஹவுஸ்', 'திர்ஹம்', 'நிறுவனம்',
+            'நிறுவனங்கள்', 'எமார்', 'நகீல்', 'டாமாக்', 'குத்தகை', 'உரிமையாளர்', 'சதுர அடி'
+        ],
+        PROHIBITED: [
+            'கார்', 'வாகனம்', 'பங்கு சந்தை', 'கிரிப்டோ', 'அரசியல்', 'தேர்தல்', 'மதம்', 'கிரிக்கெட்',
+            'கால்பந்து', 'விளையாட்டு', 'திரைப்படம்', 'சினிமா', 'பாடல்', 'உணவு', 'உணவகம்', 'வானிலை',
+            'மருத்துவமனை', 'மருத்துவர்', 'பள்ளி', 'கல்லூரி', 'பல்கலைக்கழகம்', 'பயணம்', 'விமானம்', 'ஹோட்டல்'
+        ],
+    },
+}
+
+# Characters that continue a word: \w plus Arabic diacritics and Tamil vowel signs,
+# which Python's \w does not cover
+_WORD = r"[\w\u0610-\u061A\u064B-\u065F\u0670\u0B80-\u0BFF]"
+
+# How a keyword may be inflected around its stem, per language
+_AFFIXES = {
+    "english": ("", r"(?:'s|es|s)?", True),
+    # Clitic prefixes (and/with/for/the) and common plural/feminine/possessive suffixes
+    "arabic": (r"(?:وال|بال|فال|كال|لل|ال|و|ب|ل|ف|ك)?", r"(?:ات|ة|ه|ها|ي|ين|ون|يه|ية)?", True),
+    # Tamil is agglutinative: case and plural markers attach to the end of the stem
+    "tamil": ("", "", False),
+}
+
+_VOWELS = "aeiou"
+_ENGLISH_ENDINGS = ("ing", "ed", "er", "or")
+# Tamil vowel signs and the virama (pulli)
+_TAMIL_SIGNS = [chr(c) for c in range(0x0BBE, 0x0BCE)]
+
+
+def _english_forms(word, category):
+    """Verb and agent forms of a single-word real-estate keyword: renting, rented, renter, investor"""
+    if category != REAL_ESTATE or not word.isalpha():
+        return []
+    # Silent e drops (leasing, priced); a short stem doubles its last consonant (planning)
+    stems = {word[:-1] if word.endswith("e") and not word.endswith("ee") else word}
+    if len(word) >= 3 and word[-1] not in _VOWELS + "wxy" and word[-2] in _VOWELS and word[-3] not in _VOWELS:
+        stems.add(word + word[-1])
+    return [stem + ending for stem in stems for ending in _ENGLISH_ENDINGS]
+
+
+def _tamil_forms(word, category):
+    """Stems with the final virama or u sign swapped for the vowel a case marker brings (டுபாய் -> டுபாயில்)"""
+    if word[-1:] not in ("\u0BCD", "\u0BC1"):
+        return []
+    return [word[:-1] + sign for sign in _TAMIL_SIGNS]
+
+
+# Inflected forms matched as their keyword, per language
+_FORMS = {"english": _english_forms, "tamil": _tamil_forms}
+
+# Alef and alef maqsura variants normalised 1:1 so match spans stay valid on the input
+_ARABIC_NORMALISE = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي"})
+
+
+def _trie_pattern(words):
+    """Regex for a set of words with shared prefixes factored out.
+
+    The regex engine tries alternatives one by one, so a flat alternation of
+    a few hundred keywords costs a few hundred attempts per position; as a
+    trie each position only follows the branch for its next character.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional tail keeps the longest keyword ("dubai hills" over "dubai")
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class TopicMatch(NamedTuple):
+    keyword: str
+    category: str
+    language: str
+    start: int
+    end: int
+
+
+class TopicResult(NamedTuple):
+    is_related: bool
+    score: float
+    matches: List[TopicMatch]
+
+    def categories(self, category):
+        return [m for m in self.matches if m.category == category]
+
+
+class TopicClassifier:
+    """Keyword topic classifier compiled into a single regex.
+
+    All languages and categories share one trie-shaped alternation, so a
+    message is scanned once regardless of vocabulary size. Keywords only
+    match on word boundaries ("car" no longer fires inside "card"), with
+    per-language affix rules for plurals and Arabic clitics, English verb
+    forms and Tamil case endings.
+    """
+
+    def __init__(self, keywords=KEYWORDS, short_message_words: int = 3):
+        self.short_message_words = short_message_words
+        self._lookup = {}
+        branches = []
+        for language, categories in keywords.items():
+            stems = set()
+            forms = _FORMS.get(language, lambda word, category: [])
+            for category, words in categories.items():
+                for word in words:
+                    stem = self.normalise(word)
+                    for form in [stem, *forms(stem, category)]:
+                        # First category wins on overlap, matching the old list precedence
+                        self._lookup.setdefault((language, form), (stem, category))
+                        stems.add(form)
+            prefix, suffix, closed = _AFFIXES.get(language, ("", "", True))
+            right = f"(?!{_WORD})" if closed else ""
+            branches.append(f"{prefix}(?P<{language}>{_trie_pattern(stems)}){suffix}{right}")
+        self._pattern = re.compile(f"(?<!{_WORD})(?:" + "|".join(branches) + ")")
+
+    @staticmethod
+    def normalise(text: str) -> str:
+        return text.lower().translate(_ARABIC_NORMALISE)
+
+    def find(self, message: str) -> List[TopicMatch]:
+        matches = []
+        for m in self._pattern.finditer(self.normalise(message)):
+            language = m.lastgroup
+            stem, category = self._lookup[(language, m.group(language))]
+            matches.append(TopicMatch(stem, category, language, m.start(language), m.end(language)))
+        return matches
+
+    def classify(self, message: str) -> TopicResult:
+        matches = self.find(message or "")
+        related = sum(1 for m in matches if m.category == REAL_ESTATE)
+        prohibited = len(matches) - related
+        score = related / len(matches) if matches else 0.5
+
+        if related:
+            is_related = True
+        elif prohibited:
+            is_related = False
+        else:
+            # Very short or ambiguous messages pass through for natural conversation flow
+            is_related = len((message or "").split()) <= self.short_message_words
+
+        return TopicResult(is_related, round(score, 4), matches)
+
+
+topic_classifier = TopicClassifier()
@@ -1,24 +1,28 @@
-from fastapi import FastAPI
+import time
+
+# Process start reference for the startup time log line
+_started = time.perf_counter()
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 from app.routes import chat, properties, auth
-from app.database import engine
-from app.models import Base
+from app.config import settings
+from app.database import engine, async_engine, AsyncSessionLocal
+from app.services.chat_writes import chat_writes
+from app.services.percolator import percolator
+from app.services.dedup import deduplicator
+from app.services.property_index import property_index
+from app.services.semantic_index import semantic_index
+from app.services.metrics import registry, MetricsMiddleware
+from datetime import datetime
+import asyncio
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create tables with better error handling
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Error creating database tables: {e}")
-    # Try to get more detailed error information
-    import traceback
-    logger.error(traceback.format_exc())
-
 app = FastAPI(
     title="Real Estate Agent API",
     version="1.0.0",
@@ -34,6 +38,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histogram and a Server-Timing header on every response
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def on_startup():
+    # Schema changes normally run as a separate deploy step (python -m app.migrations)
+    if settings.AUTO_MIGRATE:
+        from app.migrations import run_migrations
+        run_migrations()
+    # Saved searches, the property, semantic and duplicate indexes load on background threads so startup does not wait for them
+    percolator.load_in_background()
+    property_index.load_in_background()
+    semantic_index.ensure_fresh()
+    if deduplicator.enabled:
+        deduplicator.load_in_background()
+    logger.info(f"Startup completed in {(time.perf_counter() - _started) * 1000:.0f} ms")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Persist chat turns still waiting in the write-behind queue
+    await chat_writes.stop()
+
 # Include routers
 app.include_router(chat.router, prefix="/api/v1")
 app.include_router(properties.router, prefix="/api/v1")
@@ -47,6 +73,70 @@ async def root():
         "version": "1.0.0"
     }
 
+@registry.collector
+def database_pools():
+    """Connection pool usage of the sync and async engines"""
+    samples = {"size": [], "checked_out": [], "overflow": []}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        # Pools without a fixed size (NullPool, StaticPool) have none of these
+        for metric, method in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+            if callable(getattr(pool, method, None)):
+                samples[metric].append(({"engine": name}, getattr(pool, method)()))
+    return [(f"db_pool_{metric}", "gauge", f"Database connection pool {metric.replace('_', ' ')}", values)
+            for metric, values in samples.items()]
+
+@registry.collector
+def write_behind_queue():
+    stats = chat_writes.stats()
+    return [
+        ("write_behind_pending", "gauge", "Chat writes waiting to be flushed", [({}, stats["pending"])]),
+        ("write_behind_flushed_total", "counter", "Chat writes flushed to the database", [({}, stats["flushed"])]),
+        ("write_behind_dropped_total", "counter", "Chat writes dropped after repeated failures", [({}, stats["dropped"])]),
+    ]
+
+@app.get("/metrics")
+async def metrics():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+async def _probe(check):
+    """``{"status": "up"|"down", "latency_ms": ...}`` for one dependency check"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+        result = {"status": "up"}
+    except Exception as e:
+        result = {"status": "down", "error": str(e) or e.__class__.__name__}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+async def _database_check():
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("SELECT 1"))
+
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
\ No newline at end of file
+async def health_check(response: Response):
+    checks = {"database": await _probe(_database_check)}
+    status = "healthy" if checks["database"]["status"] == "up" else "unhealthy"
+
+    agent_service = chat._agent_service
+    if agent_service is None:
+        # Nothing has needed the model yet; do not build it (or spend quota) for a probe
+        checks["model"] = {"status": "not_started"}
+    else:
+        store = agent_service.agent.memory_store
+        checks["memory_store"] = await _probe(lambda: store.aget("__health__"))
+        llm = agent_service.agent.llm.stats()
+        # The breaker already tracks upstream health from real calls
+        checks["model"] = {
+            "status": "up" if llm["breaker"] == "closed" else "down",
+            "breaker": llm["breaker"],
+            "latency_p95_ms": llm["latency_p95_ms"],
+        }
+        if status == "healthy" and (checks["model"]["status"] != "up" or checks["memory_store"]["status"] != "up"):
+            # Chat still answers from fallbacks; report it without failing the probe
+            status = "degraded"
+    checks["write_behind"] = {"status": "up", "pending": chat_writes.pending}
+
+    if status == "unhealthy":
+        response.status_code = 503
+    return {"status": status, "timestamp": datetime.utcnow().isoformat() + "Z", "checks": checks}
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""Explicit schema migration step.
+
+Run once per deploy before starting the workers:
+
+    python -m app.migrations
+"""
+import logging
+import sys
+import traceback
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from app.database import engine
+from app.models import Base
+from app.services.amenities import backfill_property_amenities
+from app.services.property_search import create_search_indexes
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_unique_chat_sessions(bind=engine):
+    """Merge duplicate chat_sessions rows and make session_id unique.
+
+    Tables created before the constraint existed may hold several rows per
+    session from racing inserts; their message counts are summed into the
+    oldest row before the unique index is added.
+    """
+    inspector = inspect(bind)
+    unique = [c["column_names"] for c in inspector.get_unique_constraints("chat_sessions")]
+    unique += [i["column_names"] for i in inspector.get_indexes("chat_sessions") if i.get("unique")]
+    if ["session_id"] in unique:
+        return
+    with bind.begin() as conn:
+        conn.execute(text(
+            "UPDATE chat_sessions SET message_count = ("
+            " SELECT SUM(COALESCE(d.message_count, 0)) FROM chat_sessions d"
+            " WHERE d.session_id = chat_sessions.session_id)"
+            " WHERE id IN (SELECT MIN(id) FROM chat_sessions GROUP BY session_id HAVING COUNT(*) > 1)"
+        ))
+        removed = conn.execute(text(
+            "DELETE FROM chat_sessions WHERE id NOT IN (SELECT MIN(id) FROM chat_sessions GROUP BY session_id)"
+        )).rowcount
+        conn.execute(text("CREATE UNIQUE INDEX uq_chat_sessions_session_id ON chat_sessions (session_id)"))
+    logger.info(f"Made chat_sessions.session_id unique ({removed} duplicate rows merged)")
+
+
+def ensure_unique_user_preferences(bind=engine):
+    """Keep one user_preferences row per session and make session_id unique.
+
+    Racing first turns could insert several rows for a session before the
+    constraint existed; the oldest row, which later turns updated, is kept.
+    """
+    inspector = inspect(bind)
+    unique = [c["column_names"] for c in inspector.get_unique_constraints("user_preferences")]
+    unique += [i["column_names"] for i in inspector.get_indexes("user_preferences") if i.get("unique")]
+    if ["session_id"] in unique:
+        return
+    with bind.begin() as conn:
+        removed = conn.execute(text(
+            "DELETE FROM user_preferences WHERE id NOT IN (SELECT MIN(id) FROM user_preferences GROUP BY session_id)"
+        )).rowcount
+        # The model's own index, rebuilt as unique in place of the plain one
+        conn.execute(text("DROP INDEX IF EXISTS ix_user_preferences_session_id"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_user_preferences_session_id ON user_preferences (session_id)"))
+    logger.info(f"Made user_preferences.session_id unique ({removed} duplicate rows removed)")
+
+
+def ensure_model_indexes(bind=engine):
+    """Create indexes declared on models whose tables already existed (create_all skips them)"""
+    # IF NOT EXISTS rather than reflection: expression indexes do not reflect
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def ensure_session_updated_at(bind=engine):
+    """Give sessions that were never updated an updated_at; the sidebar pages on it"""
+    with bind.begin() as conn:
+        filled = conn.execute(text(
+            "UPDATE chat_sessions SET updated_at = created_at WHERE updated_at IS NULL"
+        )).rowcount
+    if filled:
+        logger.info(f"Filled updated_at for {filled} chat sessions")
+
+
+def ensure_search_indexes(bind=engine):
+    """Full-text and trigram indexes for property search (FTS5 on SQLite)"""
+    try:
+        with bind.begin() as conn:
+            create_search_indexes(conn)
+    except Exception as e:
+        # pg_trgm may need a superuser; search still works, only slower
+        logger.warning(f"Could not create property search indexes: {e}")
+
+
+def ensure_property_amenities(bind=engine):
+    """Populate property_amenities for rows written before the table existed"""
+    with bind.begin() as conn:
+        added = backfill_property_amenities(conn)
+    if added:
+        logger.info(f"Indexed {added} property amenities")
+
+
+def run_migrations(bind=engine) -> bool:
+    """Create any missing tables and indexes; returns False on failure"""
+    try:
+        Base.metadata.create_all(bind=bind)
+        ensure_unique_user_preferences(bind)
+        ensure_model_indexes(bind)
+        ensure_unique_chat_sessions(bind)
+        ensure_session_updated_at(bind)
+        ensure_search_indexes(bind)
+        ensure_property_amenities(bind)
+        logger.info("Database tables created successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Error creating database tables: {e}")
+        logger.error(traceback.format_exc())
+        return False
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if run_migrations() else 1)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import datetime
@@ -28,11 +28,18 @@ class Conversation(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     conversation_data = Column(JSON)
 
+    # Keyset pagination and export orders for conversation history
+    __table_args__ = (
+        Index("ix_conversations_session_created_id", session_id, created_at, id),
+        Index("ix_conversations_user_created_id", user_id, created_at, id),
+    )
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True)
+    # Unique, as in init.sql: the chat session upsert conflicts on it
+    session_id = Column(String, unique=True, index=True)
     user_id = Column(Integer, index=True)  # Link to user
     title = Column(String)
     language = Column(String, default="english")
@@ -41,6 +48,11 @@ class ChatSession(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
 
+    # Keyset pagination of the sidebar and its delta sync
+    __table_args__ = (
+        Index("ix_chat_sessions_user_active_updated", user_id, is_active, updated_at, id),
+    )
+
 class Property(Base):
     __tablename__ = "properties"
     
@@ -59,11 +71,23 @@ class Property(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Indexes backing preference-driven retrieval for the chat agent
+    __table_args__ = (
+        Index("ix_properties_location_lower", func.lower(location)),
+        Index("ix_properties_type_lower", func.lower(property_type)),
+        Index("ix_properties_available_price", available_from, price),
+        Index("ix_properties_bedrooms_price", bedrooms, price),
+        # Keyset pagination orders for property search
+        Index("ix_properties_price_id", price, id),
+        Index("ix_properties_created_id", created_at, id),
+    )
+
 class UserPreference(Base):
     __tablename__ = "user_preferences"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True)
+    # Unique, as in init.sql: the preference upsert conflicts on it
+    session_id = Column(String, unique=True, index=True)
     budget_min = Column(Float)
     budget_max = Column(Float)
     preferred_locations = Column(JSON)
@@ -71,4 +95,24 @@ class UserPreference(Base):
     bedrooms = Column(Integer)
     amenities = Column(JSON)
     language = Column(String, default="english")
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class PropertyAmenity(Base):
+    """One row per (property, amenity); the filterable form of Property.amenities"""
+    __tablename__ = "property_amenities"
+
+    property_id = Column(Integer, primary_key=True)
+    amenity = Column(String, primary_key=True)  # normalised: stripped, lower case
+
+    __table_args__ = (
+        Index("ix_property_amenities_amenity", amenity, property_id),
+    )
+
+class PropertyDuplicate(Base):
+    """A listing flagged at ingest as a near-duplicate of an earlier one"""
+    __tablename__ = "property_duplicates"
+
+    property_id = Column(Integer, primary_key=True)
+    duplicate_of = Column(Integer, nullable=False, index=True)
+    similarity = Column(Float)  # estimated Jaccard similarity of the text shingles
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
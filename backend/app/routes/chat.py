@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas import ChatMessage, ChatResponse, ChatSessionResponse, ChatHistoryResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, AsyncSessionLocal
+from app.schemas import ChatMessage, ChatResponse, ChatSessionResponse, ChatHistoryResponse, ConversationPage
 from app.agents.real_estate_agent import RealEstateAgentService
 from app.config import settings
-from app.models import Conversation, ChatSession
+from app.services.chat_writes import enqueue_session_message, session_upsert, session_row
+from app.services.chat_sidebar import sidebar_etag, get_sidebar_page, DEFAULT_PAGE_SIZE as DEFAULT_SIDEBAR_PAGE, MAX_PAGE_SIZE as MAX_SIDEBAR_PAGE
+from app.services.conversation_history import get_history_page, export_ndjson, DEFAULT_PAGE_SIZE as DEFAULT_HISTORY_PAGE, MAX_PAGE_SIZE as MAX_HISTORY_PAGE
+from app.services.notifications import notifications
+from app.services.property_search import InvalidCursor
+from app.services.percolator import percolator
+from app.services.metrics import registry, stage, ERRORS
+from app.models import ChatSession
+import asyncio
+import json
 import logging
 import uuid
 from datetime import datetime
@@ -14,8 +25,43 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize the agent service
-agent_service = RealEstateAgentService(settings.GEMINI_API_KEY)
+_agent_service = None
+
+def get_agent_service() -> RealEstateAgentService:
+    """Create the agent service on first use instead of at import time"""
+    global _agent_service
+    if _agent_service is None:
+        _agent_service = RealEstateAgentService(settings.GEMINI_API_KEY)
+    return _agent_service
+
+@registry.collector
+def agent_metrics():
+    """Counters the agent's components keep themselves, read at scrape time"""
+    if _agent_service is None:
+        return []
+    agent = _agent_service.agent
+    llm = agent.llm.stats()
+    families = [
+        ("llm_calls_total", "counter", "Model calls made by chat turns", [({}, llm["calls"])]),
+        ("llm_upstream_requests_total", "counter", "Requests sent to the model upstream, retries and hedges included",
+         [({}, llm["upstream_calls"])]),
+        ("llm_call_events_total", "counter", "Retries, hedges, coalesced calls, timeouts, failures and breaker rejections",
+         [({"event": event}, llm[event]) for event in ("retries", "hedges", "hedge_wins", "coalesced", "timeouts", "failures", "rejected")]),
+        ("llm_circuit_state", "gauge", "1 for the model circuit breaker's current state",
+         [({"state": state}, int(llm["breaker"] == state)) for state in ("closed", "open", "half_open")]),
+    ]
+    if agent.response_cache:
+        cache = agent.response_cache.stats()
+        families += [
+            ("response_cache_lookups_total", "counter", "LLM response cache lookups",
+             [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+            ("response_cache_entries", "gauge", "Responses held in the LLM response cache", [({}, cache["size"])]),
+        ]
+    if agent.intent_router:
+        intents = agent.intent_router.stats()["intents"]
+        families.append(("chat_turns_total", "counter", "Chat turns by routed intent (open_ended turns call the model)",
+                         [({"intent": intent}, count) for intent, count in intents.items()]))
+    return families
 
 def generate_chat_title(message: str, language: str) -> str:
     """Generate a chat title from the first message"""
@@ -34,37 +80,28 @@ def generate_chat_title(message: str, language: str) -> str:
     
     return title.strip() or "New Chat"
 
-def get_or_create_chat_session(db: Session, session_id: str, message: str, language: str, user_id: Optional[int] = None):
-    """Get existing chat session or create new one"""
-    chat_session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
-    
-    if not chat_session:
-        # Create new chat session
-        title = generate_chat_title(message, language)
-        chat_session = ChatSession(
-            session_id=session_id,
-            title=title,
-            language=language,
-            message_count=1,
-            user_id=user_id,
-            is_active=True
-        )
-        db.add(chat_session)
-    else:
-        # Update existing session
-        chat_session.message_count += 1
-        chat_session.updated_at = datetime.utcnow()
-        chat_session.is_active = True
-    
-    db.commit()
-    db.refresh(chat_session)
+async def get_or_create_chat_session(db: AsyncSession, session_id: str, message: str, language: str, user_id: Optional[int] = None):
+    """Create the chat session or count one more message on it, in one atomic upsert"""
+    upsert = session_upsert(db.bind.dialect.name)
+    row = session_row(session_id, generate_chat_title(message, language), language, user_id)
+    result = await db.execute(select(ChatSession).from_statement(upsert.returning(*ChatSession.__table__.c)), row)
+    chat_session = result.scalars().first()
+    await db.commit()
     return chat_session
 
+async def record_session_message(db: AsyncSession, session_id: str, message: str, language: str, user_id: Optional[int] = None):
+    """Count a message against its chat session, off the request path when write-behind is on"""
+    with stage("session"):
+        if settings.WRITE_BEHIND_ENABLED:
+            await enqueue_session_message(session_id, generate_chat_title(message, language), language, user_id)
+        else:
+            await get_or_create_chat_session(db, session_id, message, language, user_id)
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     message: ChatMessage, 
     user_id: int = None,  # Add user_id as query parameter
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         logger.info(f"Processing chat message for session: {message.session_id}, language: {message.language}, user_id: {user_id}")
@@ -77,10 +114,10 @@ async def chat(
             message.session_id = str(uuid.uuid4())
         
         # Create or update chat session for sidebar with user_id
-        chat_session = get_or_create_chat_session(db, message.session_id, message.message, message.language, user_id)
+        await record_session_message(db, message.session_id, message.message, message.language, user_id)
         
         # Process the message through the agent service with language preference
-        result = agent_service.process_message(
+        result = await get_agent_service().process_message(
             db, 
             message.session_id, 
             message.message,
@@ -94,6 +131,7 @@ async def chat(
     except HTTPException:
         raise
     except Exception as e:
+        ERRORS.inc(component="chat")
         logger.error(f"Error processing chat message: {str(e)}")
         # Return a fallback response instead of raising exception
         return {
@@ -103,78 +141,193 @@ async def chat(
             "timestamp": datetime.utcnow().isoformat()
         }
         
-@router.get("/conversations/{session_id}")
-async def get_conversation_history(session_id: str, db: Session = Depends(get_db)):
+def format_sse(event: str, payload: dict) -> str:
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    message: ChatMessage,
+    user_id: int = None
+):
+    """Stream the agent response over Server-Sent Events.
+
+    Emits ``start`` (session_id, language), ``delta`` events whose ``text``
+    concatenates to the full formatted response, and ``done``.
+    """
+    if not message.message or not message.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    if not message.session_id:
+        message.session_id = str(uuid.uuid4())
+
+    async def event_stream():
+        # The stream outlives the request scope, so it owns its DB session
+        async with AsyncSessionLocal() as db:
+            try:
+                await record_session_message(db, message.session_id, message.message, message.language, user_id)
+                async for event, payload in get_agent_service().stream_message(
+                    db,
+                    message.session_id,
+                    message.message,
+                    message.language,
+                    user_id
+                ):
+                    yield format_sse(event, payload)
+            except Exception as e:
+                ERRORS.inc(component="chat_stream")
+                logger.error(f"Error streaming chat message: {str(e)}")
+                yield format_sse("error", {
+                    "detail": "I apologize for the inconvenience. I'm currently experiencing technical difficulties. Please try again in a moment.",
+                    "session_id": message.session_id
+                })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/notifications/stream")
+async def notification_stream(session_id: str):
+    """Server-Sent Events stream of new listings matching the session's saved search"""
+    if not percolator.loaded:
+        percolator.load_in_background()
+    queue = notifications.subscribe(session_id)
+
+    async def event_stream():
+        try:
+            yield format_sse("subscribed", {"session_id": session_id})
+            while True:
+                try:
+                    event, payload = await asyncio.wait_for(queue.get(), settings.NOTIFICATION_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment frame so proxies keep the idle connection open
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, payload)
+        finally:
+            notifications.unsubscribe(session_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/chat/cache-stats")
+async def get_chat_cache_stats():
+    """Hit-rate counters for the LLM response cache"""
+    cache = get_agent_service().agent.response_cache
+    if not cache:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@router.get("/chat/intent-stats")
+async def get_chat_intent_stats():
+    """Turns per routed intent and the share answered without an LLM call"""
+    intent_router = get_agent_service().agent.intent_router
+    if not intent_router:
+        return {"enabled": False}
+    return {"enabled": True, **intent_router.stats()}
+
+@router.get("/chat/prompt-stats")
+async def get_chat_prompt_stats():
+    """Estimated prompt sizes sent to the model against what the full history would have cost"""
+    return get_agent_service().agent.prompt_builder.stats()
+
+@router.get("/chat/llm-stats")
+async def get_chat_llm_stats():
+    """Model call outcomes: retries, hedges, coalesced calls, timeouts and circuit breaker state"""
+    return get_agent_service().agent.llm.stats()
+
+@router.get("/conversations/{session_id}", response_model=ConversationPage)
+async def get_conversation_history(
+    session_id: str,
+    limit: int = Query(DEFAULT_HISTORY_PAGE, ge=1, le=MAX_HISTORY_PAGE),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Only turns after this time, oldest first"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The latest ``limit`` turns, oldest first; ``next_cursor`` fetches the page before them"""
     try:
-        conversations = db.query(Conversation).filter(
-            Conversation.session_id == session_id
-        ).order_by(Conversation.created_at.asc()).all()
-        
-        return conversations
-        
+        return await get_history_page(db, session_id, limit=limit, cursor=cursor, since=since)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching conversation history: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching conversation history")
 
+def ndjson_export(filename: str, **filters):
+    async def lines():
+        # The stream outlives the request scope, so it owns its DB session
+        async with AsyncSessionLocal() as db:
+            try:
+                async for chunk in export_ndjson(db, **filters):
+                    yield chunk
+            except Exception as e:
+                ERRORS.inc(component="export")
+                logger.error(f"Error exporting conversations: {str(e)}")
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/conversations/{session_id}/export")
+async def export_conversation(session_id: str):
+    """Every turn of a session as NDJSON, streamed"""
+    return ndjson_export(f"conversation-{session_id}.ndjson", session_id=session_id)
+
+@router.get("/users/{user_id}/conversations/export")
+async def export_user_conversations(user_id: int):
+    """Every turn of all of a user's sessions as NDJSON, streamed"""
+    return ndjson_export(f"conversations-user-{user_id}.ndjson", user_id=user_id)
+
 @router.get("/chat-sessions", response_model=ChatHistoryResponse)
 async def get_chat_sessions(
-    skip: int = 0,
-    limit: int = 50,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_SIDEBAR_PAGE, ge=1, le=MAX_SIDEBAR_PAGE),
+    cursor: Optional[str] = None,
+    updated_since: Optional[datetime] = Query(None, description="Delta sync: only sessions changed after this time"),
+    include_total: bool = False,
     user_id: int = None,  # Make it optional
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Sidebar sessions, most recently updated first, with keyset pagination.
+
+    Guest sessions are listed when no user_id is given. Responses carry an
+    ETag; a matching If-None-Match gets 304 without reading the page.
+    """
     try:
-        logger.info(f"Fetching chat sessions for user_id: {user_id}")
-        
-        # Filter chat sessions by user_id
-        query = db.query(ChatSession).filter(
-            ChatSession.is_active == True
+        etag = await sidebar_etag(
+            db, user_id, limit=limit, cursor=cursor, updated_since=str(updated_since), include_total=include_total
         )
-        
-        if user_id:
-            query = query.filter(ChatSession.user_id == user_id)
-            logger.info(f"Filtering by user_id: {user_id}")
-        else:
-            # If no user_id provided, return empty for now
-            # In production, you might want to handle guest users differently
-            query = query.filter(ChatSession.user_id.is_(None))
-            logger.info("No user_id provided, showing guest sessions")
-        
-        sessions = query.order_by(
-            ChatSession.updated_at.desc()
-        ).offset(skip).limit(limit).all()
-        
-        total_count = query.count()
-        
-        logger.info(f"Found {total_count} sessions for user_id: {user_id}")
-        
-        return {
-            "sessions": [
-                {
-                    "id": session.id,
-                    "session_id": session.session_id,
-                    "title": session.title,
-                    "language": session.language,
-                    "message_count": session.message_count,
-                    "created_at": session.created_at,
-                    "updated_at": session.updated_at,
-                    "is_active": session.is_active
-                }
-                for session in sessions
-            ],
-            "total_count": total_count
-        }
-        
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        page = await get_sidebar_page(
+            db, user_id, limit=limit, include_total=include_total, cursor=cursor, updated_since=updated_since
+        )
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+        return page
+
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching chat sessions: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching chat sessions")
 
 @router.get("/chat-sessions/{session_id}", response_model=ChatSessionResponse)
-async def get_chat_session(session_id: str, db: Session = Depends(get_db)):
+async def get_chat_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
-        session = db.query(ChatSession).filter(
-            ChatSession.session_id == session_id
-        ).first()
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.session_id == session_id).limit(1)
+        )
+        session = result.scalars().first()
         
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
@@ -188,19 +341,28 @@ async def get_chat_session(session_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error fetching chat session")
 
 @router.delete("/chat-sessions/{session_id}")
-async def delete_chat_session(session_id: str, db: Session = Depends(get_db)):
+async def delete_chat_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
     try:
-        session = db.query(ChatSession).filter(
-            ChatSession.session_id == session_id
-        ).first()
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.session_id == session_id).limit(1)
+        )
+        session = result.scalars().first()
         
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
         
-        # Soft delete by marking as inactive
+        # Soft delete by marking as inactive; updated_at moves (on the clock turn
+        # writes use) so the sidebar ETag changes and delta syncs see the delete
         session.is_active = False
-        db.commit()
+        session.updated_at = datetime.utcnow()
+        await db.commit()
         
+        # Drop the cached conversation memory along with the session; the delete stands if this fails
+        try:
+            await get_agent_service().agent.aclear_memory(session_id)
+        except Exception as e:
+            logger.error(f"Error clearing memory of deleted chat session: {str(e)}")
+
         return {"message": "Chat session deleted successfully"}
         
     except HTTPException:
@@ -213,12 +375,13 @@ async def delete_chat_session(session_id: str, db: Session = Depends(get_db)):
 async def update_chat_session_title(
     session_id: str, 
     title: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        session = db.query(ChatSession).filter(
-            ChatSession.session_id == session_id
-        ).first()
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.session_id == session_id).limit(1)
+        )
+        session = result.scalars().first()
         
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
@@ -227,7 +390,9 @@ async def update_chat_session_title(
             raise HTTPException(status_code=400, detail="Title cannot be empty")
         
         session.title = title.strip()
-        db.commit()
+        # Set here rather than by onupdate=func.now(), which SQLite stores to the second
+        session.updated_at = datetime.utcnow()
+        await db.commit()
         
         return {"message": "Chat session title updated successfully"}
         
@@ -1,13 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import Property
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import get_db, get_async_db
+from app.models import Property, PropertyAmenity, PropertyDuplicate
+from app.services.inventory import inventory
+from app.services.amenities import amenity_filter, amenity_rows, normalise_amenities, MATCH_MODES
+from app.services.dedup import deduplicator, not_duplicate
+from app.services.property_index import property_index
+from app.services.semantic_index import semantic_index
+from app.services.similar_properties import similar_properties
+from app.services.property_import import aimport_properties, FORMATS as IMPORT_FORMATS
+from app.services.property_search import search_properties, escape_like, InvalidCursor, SORTS, MAX_PAGE_SIZE
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
 
 router = APIRouter()
 
+def _columns(prop: Property) -> dict:
+    return {column.name: getattr(prop, column.name) for column in Property.__table__.columns}
+
+AMENITY_MATCH_PATTERN = f"^({'|'.join(MATCH_MODES)})$"
+
+# Ids per IN (...) list, well under the bound-parameter limits of SQLite and PostgreSQL
+ID_BATCH_SIZE = 5000
+
 class PropertyCreate(BaseModel):
     title: str
     description: str
@@ -37,20 +56,83 @@ class PropertyResponse(BaseModel):
     created_at: datetime.datetime
     updated_at: Optional[datetime.datetime] = None
 
+class SemanticMatch(PropertyResponse):
+    score: float
+
+class SimilarProperty(PropertyResponse):
+    similarity: float
+
+class PropertyPage(BaseModel):
+    items: List[PropertyResponse]
+    next_cursor: Optional[str] = None
+
 @router.post("/properties", response_model=PropertyResponse)
-async def create_property(
+def create_property(
     property_data: PropertyCreate,
     db: Session = Depends(get_db)
 ):
+    # A plain def: the sync session and the duplicate check run on the threadpool, off the event loop
+    signature, duplicate = None, None
+    if deduplicator.enabled:
+        signature, duplicate = deduplicator.check(db, property_data.dict())
+        if duplicate and deduplicator.mode == "merge":
+            existing = db.get(Property, duplicate[0])
+            if existing is not None:
+                # Same unit posted again: keep the listing we already have
+                return existing
+
     property_obj = Property(
-        **property_data.dict(),
+        **property_data.dict(exclude={"available_from"}),
         available_from=property_data.available_from or datetime.datetime.utcnow()
     )
     db.add(property_obj)
+    db.flush()
+    rows = amenity_rows([property_obj])
+    if rows:
+        db.execute(PropertyAmenity.__table__.insert(), rows)
+    if duplicate:
+        db.add(PropertyDuplicate(property_id=property_obj.id, duplicate_of=duplicate[0], similarity=duplicate[1]))
     db.commit()
     db.refresh(property_obj)
+    if signature is not None and not duplicate:
+        deduplicator.add(property_obj.id, signature, property_obj)
+    
+    # Invalidate caches and refresh indexes built over the inventory; a flagged
+    # duplicate stays out of the indexes, as it does out of search
+    inventory.notify([] if duplicate else [property_obj])
     return property_obj
 
+@router.post("/properties/import")
+async def import_properties(
+    request: Request,
+    format: Optional[str] = Query(None, pattern=f"^({'|'.join(IMPORT_FORMATS)})$", description="Default: from Content-Type"),
+    dry_run: bool = False
+):
+    """Bulk import a streamed CSV (with a header row) or JSONL body; returns per-row errors"""
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get("content-type", "")
+        fmt = "jsonl" if "json" in content_type else "csv"
+    return await aimport_properties(request.stream(), fmt, dry_run=dry_run)
+
+def _property_filters(location=None, property_type=None, min_price=None, max_price=None,
+                      bedrooms=None, amenities=None, amenities_match="all"):
+    """WHERE clauses matching PropertyIndex.search filters"""
+    clauses = []
+    if location:
+        clauses.append(func.lower(Property.location).like(f"%{escape_like(location.strip().lower())}%", escape="\\"))
+    if property_type:
+        clauses.append(func.lower(Property.property_type) == property_type.strip().lower())
+    if min_price is not None:
+        clauses.append(Property.price >= min_price)
+    if max_price is not None:
+        clauses.append(Property.price <= max_price)
+    if bedrooms:
+        clauses.append(Property.bedrooms >= bedrooms)
+    if amenities:
+        clauses.append(amenity_filter(amenities, amenities_match))
+    return clauses
+
 @router.get("/properties", response_model=List[PropertyResponse])
 async def get_properties(
     location: Optional[str] = None,
@@ -58,27 +140,112 @@ async def get_properties(
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     bedrooms: Optional[int] = None,
-    db: Session = Depends(get_db)
+    amenities: Optional[str] = Query(None, description="Comma-separated, e.g. pool,gym"),
+    amenities_match: str = Query("all", pattern=AMENITY_MATCH_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Property)
-    
-    if location:
-        query = query.filter(Property.location.ilike(f"%{location}%"))
-    if property_type:
-        query = query.filter(Property.property_type == property_type)
-    if min_price:
-        query = query.filter(Property.price >= min_price)
-    if max_price:
-        query = query.filter(Property.price <= max_price)
-    if bedrooms:
-        query = query.filter(Property.bedrooms >= bedrooms)
-    
-    properties = query.all()
+    filters = {
+        "location": location, "property_type": property_type, "min_price": min_price or None,
+        "max_price": max_price or None, "bedrooms": bedrooms, "amenities": normalise_amenities(amenities)
+    }
+    stmt = select(Property).where(not_duplicate()).order_by(Property.id)
+    if not any(filters.values()):
+        return (await db.execute(stmt)).scalars().all()
+
+    if not property_index.loaded:
+        # The index loads on a worker thread; SQL answers until it is ready
+        property_index.load_in_background()
+        return (await db.execute(stmt.where(*_property_filters(amenities_match=amenities_match, **filters)))).scalars().all()
+
+    # Filter on the in-memory index, then load only the matching rows
+    await property_index.ensure_fresh()
+    ids = property_index.search(limit=None, amenities_match=amenities_match, **filters)
+    properties = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        properties += (await db.execute(stmt.where(Property.id.in_(ids[start:start + ID_BATCH_SIZE])))).scalars().all()
     return properties
 
+@router.get("/properties/search", response_model=PropertyPage)
+async def search_property_listings(
+    q: Optional[str] = None,
+    location: Optional[str] = None,
+    property_type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    bedrooms: Optional[int] = None,
+    amenities: Optional[str] = Query(None, description="Comma-separated, e.g. pool,gym"),
+    amenities_match: str = Query("all", pattern=AMENITY_MATCH_PATTERN),
+    sort: str = Query("relevance", pattern=f"^({'|'.join(SORTS)})$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ranked full-text search; pass ``next_cursor`` back as ``cursor`` for the next page"""
+    try:
+        items, next_cursor = await search_properties(
+            db, q=q, location=location, property_type=property_type, min_price=min_price,
+            max_price=max_price, bedrooms=bedrooms, amenities=amenities, amenities_match=amenities_match,
+            sort=sort, cursor=cursor, limit=limit
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/properties/semantic", response_model=List[SemanticMatch])
+async def semantic_property_search(
+    q: str = Query(..., min_length=1, description="Free-text description of the property wanted"),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Listings ranked by similarity of their title, description and amenities to ``q``"""
+    semantic_index.ensure_fresh()
+    scores = dict(semantic_index.search(q, limit))
+    if not scores:
+        return []
+    rows = (await db.execute(select(Property).where(Property.id.in_(list(scores)), not_duplicate()))).scalars()
+    matches = [{**_columns(prop), "score": scores[prop.id]} for prop in rows]
+    return sorted(matches, key=lambda match: -match["score"])
+
+@router.get("/properties/facets")
+async def get_property_facets(
+    location: Optional[str] = None,
+    property_type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    bedrooms: Optional[int] = None,
+    amenities: Optional[str] = Query(None, description="Comma-separated, e.g. pool,gym"),
+    amenities_match: str = Query("all", pattern=AMENITY_MATCH_PATTERN),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Counts per location, type, bedrooms and amenity for the given filters"""
+    await property_index.ensure_fresh()
+    return property_index.facets(
+        location=location, property_type=property_type, min_price=min_price,
+        max_price=max_price, bedrooms=bedrooms,
+        amenities=normalise_amenities(amenities), amenities_match=amenities_match
+    )
+
 @router.get("/properties/{property_id}", response_model=PropertyResponse)
 async def get_property(property_id: int, db: Session = Depends(get_db)):
     property_obj = db.query(Property).filter(Property.id == property_id).first()
     if not property_obj:
         raise HTTPException(status_code=404, detail="Property not found")
-    return property_obj
\ No newline at end of file
+    return property_obj
+
+@router.get("/properties/{property_id}/similar", response_model=List[SimilarProperty])
+async def get_similar_properties(
+    property_id: int,
+    limit: int = Query(settings.SIMILAR_PROPERTIES_K, ge=1, le=settings.SIMILAR_PROPERTIES_K),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Nearest listings by price, size, rooms, location, type and amenities"""
+    await similar_properties.ensure_fresh()
+    neighbours = similar_properties.similar(property_id, limit)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Property not found")
+    similarity = dict(neighbours)
+    rows = (await db.execute(select(Property).where(Property.id.in_(list(similarity))))).scalars()
+    return sorted(
+        ({**_columns(prop), "similarity": similarity[prop.id]} for prop in rows),
+        key=lambda match: -match["similarity"]
+    )
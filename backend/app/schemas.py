@@ -55,7 +55,24 @@ class ChatSessionResponse(ChatSessionBase):
 
 class ChatHistoryResponse(BaseModel):
     sessions: List[ChatSessionResponse]
-    total_count: int
+    total_count: Optional[int] = None  # only with include_total=true
+    next_cursor: Optional[str] = None
+    # Send back as updated_since to fetch only what changed
+    latest_updated_at: Optional[datetime.datetime] = None
+
+class ConversationResponse(BaseModel):
+    id: int
+    session_id: Optional[str] = None
+    user_id: Optional[int] = None
+    user_message: Optional[str] = None
+    agent_response: Optional[str] = None
+    language: Optional[str] = None
+    created_at: Optional[datetime.datetime] = None
+    conversation_data: Optional[dict] = None
+
+class ConversationPage(BaseModel):
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None
 
 class UserBase(BaseModel):
     email: str
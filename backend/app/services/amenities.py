@@ -0,0 +1,58 @@
+from sqlalchemy import select, insert, func, distinct
+from app.models import Property, PropertyAmenity
+
+MATCH_MODES = ("all", "any")
+
+
+def normalise_amenities(values) -> list:
+    """Stripped, lower-cased, de-duplicated amenity names in first-seen order"""
+    if isinstance(values, str):
+        values = values.split(",")
+    seen = []
+    for value in values or []:
+        amenity = str(value).strip().lower()
+        if amenity and amenity not in seen:
+            seen.append(amenity)
+    return seen
+
+
+def amenity_rows(properties) -> list:
+    """property_amenities rows for the given Property objects"""
+    return [
+        {"property_id": prop.id, "amenity": amenity}
+        for prop in properties
+        for amenity in normalise_amenities(prop.amenities)
+    ]
+
+
+def amenity_filter(amenities, match: str = "all"):
+    """WHERE clause on Property.id answered from the (amenity, property_id) index"""
+    amenities = normalise_amenities(amenities)
+    matching = select(PropertyAmenity.property_id).where(PropertyAmenity.amenity.in_(amenities))
+    if match == "all" and len(amenities) > 1:
+        matching = matching.group_by(PropertyAmenity.property_id).having(
+            func.count(distinct(PropertyAmenity.amenity)) == len(amenities)
+        )
+    return Property.id.in_(matching)
+
+
+def amenity_match_count(amenities):
+    """Correlated count of the given amenities a property has, for scoring"""
+    return (
+        select(func.count())
+        .where(PropertyAmenity.property_id == Property.id, PropertyAmenity.amenity.in_(normalise_amenities(amenities)))
+        .scalar_subquery()
+    )
+
+
+def backfill_property_amenities(conn) -> int:
+    """Index the JSON amenities of properties that have no property_amenities rows yet"""
+    indexed = select(PropertyAmenity.property_id)
+    rows = conn.execute(
+        select(Property.id, Property.amenities)
+        .where(Property.amenities.isnot(None), Property.id.notin_(indexed))
+    ).all()
+    values = amenity_rows(rows)
+    if values:
+        conn.execute(insert(PropertyAmenity.__table__), values)
+    return len(values)
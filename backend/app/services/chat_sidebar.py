@@ -0,0 +1,100 @@
+import datetime
+import hashlib
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import ChatSession
+from .property_search import encode_cursor, decode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _owner(user_id):
+    # Guest sessions have no user
+    return ChatSession.user_id == user_id if user_id else ChatSession.user_id.is_(None)
+
+
+def _updated_key(dialect: str):
+    if dialect == "sqlite":
+        # SQLite keeps timestamps as text, with or without fractional seconds
+        # depending on who wrote them; compare a normalised form instead
+        return func.strftime("%Y-%m-%d %H:%M:%f", ChatSession.updated_at)
+    return ChatSession.updated_at
+
+
+def _time_value(dialect: str, value: datetime.datetime):
+    return func.strftime("%Y-%m-%d %H:%M:%f", value) if dialect == "sqlite" else value
+
+
+async def sidebar_etag(db: AsyncSession, user_id: int = None, **params) -> str:
+    """Validator for a user's sidebar: changes whenever any of their sessions is written.
+
+    Every session write (new message, rename, delete) bumps ``updated_at``,
+    so the latest ``updated_at`` and the number of sessions identify the
+    state. One aggregate over the (user_id, is_active, updated_at, id) index.
+    """
+    latest, count = (await db.execute(
+        select(func.max(ChatSession.updated_at), func.count()).where(_owner(user_id))
+    )).one()
+    fingerprint = f"{user_id}|{latest}|{count}|{sorted(params.items())}"
+    return '"' + hashlib.sha1(fingerprint.encode()).hexdigest()[:20] + '"'
+
+
+def build_sidebar_query(dialect: str, user_id: int = None, cursor: str = None,
+                        updated_since: datetime.datetime = None, limit: int = DEFAULT_PAGE_SIZE):
+    """One page of a user's sessions over (user_id, is_active, updated_at, id).
+
+    The sidebar lists active sessions, most recently updated first. With
+    ``updated_since`` it is a delta instead: every session changed after
+    that time, oldest change first, deleted (inactive) ones included so the
+    client can drop them. ``limit + 1`` rows are selected so the caller can
+    tell whether another page exists.
+    """
+    key = _updated_key(dialect)
+    stmt = select(ChatSession, key.label("sort_value")).where(_owner(user_id))
+    delta = updated_since is not None or (cursor is not None and _is_delta_cursor(cursor))
+    if delta:
+        if cursor:
+            value, last_id = decode_cursor(cursor, "delta")
+            stmt = stmt.where(or_(key > value, and_(key == value, ChatSession.id > last_id)))
+        else:
+            stmt = stmt.where(key > _time_value(dialect, updated_since))
+        return stmt.order_by(key.asc(), ChatSession.id.asc()).limit(limit + 1), "delta"
+
+    stmt = stmt.where(ChatSession.is_active.is_(True))
+    if cursor:
+        value, last_id = decode_cursor(cursor, "sidebar")
+        stmt = stmt.where(or_(key < value, and_(key == value, ChatSession.id < last_id)))
+    return stmt.order_by(key.desc(), ChatSession.id.desc()).limit(limit + 1), "sidebar"
+
+
+def _is_delta_cursor(cursor: str) -> bool:
+    try:
+        decode_cursor(cursor, "delta")
+        return True
+    except ValueError:
+        return False
+
+
+async def get_sidebar_page(db: AsyncSession, user_id: int = None, limit: int = DEFAULT_PAGE_SIZE,
+                           include_total: bool = False, **params) -> dict:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt, mode = build_sidebar_query(db.bind.dialect.name, user_id, limit=limit, **params)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        session, value = rows[-1]
+        next_cursor = encode_cursor(mode, value, session.id)
+    sessions = [session for session, _value in rows]
+    total = None
+    if include_total:
+        # Only on request: the sidebar itself never needs the count
+        total = await db.scalar(select(func.count()).where(_owner(user_id), ChatSession.is_active.is_(True)))
+    latest = max((s.updated_at for s in sessions if s.updated_at), default=None)
+    return {
+        "sessions": sessions,
+        "total_count": total,
+        "next_cursor": next_cursor,
+        "latest_updated_at": latest,
+    }
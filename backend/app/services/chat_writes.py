@@ -0,0 +1,155 @@
+from datetime import datetime
+from sqlalchemy import insert, bindparam, func, JSON
+from sqlalchemy.dialects import postgresql, sqlite
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import ChatSession, Conversation, UserPreference
+from .write_behind import WriteBehindQueue
+
+SESSION = "session"
+CONVERSATION = "conversation"
+PREFERENCES = "preferences"
+
+PREFERENCE_COLUMNS = ("budget_min", "budget_max", "preferred_locations", "property_types", "bedrooms", "amenities")
+
+
+def _provided(value):
+    return value not in (None, [], "")
+
+
+def _param(column, name=None):
+    # None must bind as SQL NULL, not JSON 'null', for COALESCE and unset columns
+    type_ = JSON(none_as_null=True) if isinstance(column.type, JSON) else column.type
+    return bindparam(name or column.key, type_=type_)
+
+
+def session_upsert(dialect_name: str):
+    """INSERT ... ON CONFLICT (session_id) DO UPDATE bumping message_count.
+
+    Inserted rows carry the number of messages to add in ``message_count``;
+    on conflict that number is added to the stored count in the same
+    statement, so concurrent messages can neither duplicate a session nor
+    lose an increment. Works on PostgreSQL and SQLite (3.24+).
+    """
+    table = ChatSession.__table__
+    stmt = (sqlite if dialect_name == "sqlite" else postgresql).insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.session_id],
+        set_={
+            "message_count": func.coalesce(table.c.message_count, 0) + stmt.excluded.message_count,
+            "updated_at": stmt.excluded.updated_at,
+            "is_active": True,
+        }
+    )
+
+
+def session_row(session_id, title, language, user_id, count=1, now=None):
+    now = now or datetime.utcnow()
+    return {
+        "session_id": session_id,
+        "title": title,
+        "language": language,
+        "message_count": count,
+        "user_id": user_id,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def flush_sessions(db, items):
+    """Create or bump chat_sessions rows: one upsert row per session per batch"""
+    sessions = {}
+    for item in items:
+        entry = sessions.get(item["session_id"])
+        if entry is None:
+            sessions[item["session_id"]] = {**item, "count": 1}
+        else:
+            entry["count"] += 1
+            entry["touched_at"] = item["touched_at"]
+
+    rows = [
+        {**session_row(sid, s["title"], s["language"], s["user_id"], s["count"], s["created_at"]), "updated_at": s["touched_at"]}
+        for sid, s in sessions.items()
+    ]
+    await db.execute(session_upsert(db.bind.dialect.name), rows)
+
+
+async def flush_conversations(db, items):
+    await db.execute(insert(Conversation.__table__), items)
+
+
+def preference_upsert(dialect_name: str):
+    """INSERT ... ON CONFLICT (session_id) DO UPDATE of user_preferences.
+
+    NULL values keep the stored column, so one statement serves every row
+    and a turn only overrides the preferences it mentions. Concurrent first
+    turns of a session (on any worker) end up in one row.
+    """
+    table = UserPreference.__table__
+    columns = ("session_id", "language") + PREFERENCE_COLUMNS
+    stmt = (sqlite if dialect_name == "sqlite" else postgresql).insert(table).values(
+        {c: _param(table.c[c]) for c in columns}
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.session_id],
+        set_={c: func.coalesce(stmt.excluded[c], table.c[c]) for c in PREFERENCE_COLUMNS}
+    )
+
+
+def preference_rows(items):
+    """One upsert row per session, later turns overriding earlier ones field by field"""
+    merged = {}
+    for item in items:
+        entry = merged.setdefault(item["session_id"], {"session_id": item["session_id"], **{c: None for c in PREFERENCE_COLUMNS}})
+        entry["language"] = item["language"]
+        for column in PREFERENCE_COLUMNS:
+            if _provided(item["preferences"].get(column)):
+                entry[column] = item["preferences"][column]
+    return list(merged.values())
+
+
+async def flush_preferences(db, items):
+    await db.execute(preference_upsert(db.bind.dialect.name), preference_rows(items))
+
+
+chat_writes = WriteBehindQueue(
+    AsyncSessionLocal,
+    {SESSION: flush_sessions, CONVERSATION: flush_conversations, PREFERENCES: flush_preferences},
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval_ms=settings.WRITE_BEHIND_FLUSH_MS,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING
+)
+
+
+async def enqueue_session_message(session_id: str, title: str, language: str, user_id: int = None):
+    now = datetime.utcnow()
+    await chat_writes.put(SESSION, {
+        "session_id": session_id,
+        "title": title,
+        "language": language,
+        "user_id": user_id,
+        "created_at": now,
+        "touched_at": now,
+    })
+
+
+async def enqueue_turn(session_id: str, user_id: int, message: str, result: dict):
+    """Queue the conversation row and any detected preferences for one turn"""
+    preferences = result.get("preferences") or {}
+    await chat_writes.put(CONVERSATION, {
+        "session_id": session_id,
+        "user_id": user_id,
+        "user_message": message,
+        "agent_response": result["response"],
+        "language": result["language"],
+        "conversation_data": {"preferences": preferences},
+        # Stamped at enqueue time so history order matches the order of turns
+        "created_at": datetime.utcnow(),
+    })
+    if any(_provided(preferences.get(c)) for c in PREFERENCE_COLUMNS):
+        await chat_writes.put(PREFERENCES, {
+            "session_id": session_id,
+            "language": result["language"],
+            "preferences": preferences,
+        })
@@ -0,0 +1,100 @@
+import datetime
+import json
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Conversation
+from .property_search import encode_cursor, decode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Rows fetched per round trip by the export's server-side cursor
+EXPORT_BATCH_ROWS = 500
+
+_COLUMNS = (Conversation.id, Conversation.session_id, Conversation.user_id, Conversation.user_message,
+            Conversation.agent_response, Conversation.language, Conversation.created_at, Conversation.conversation_data)
+
+
+def _created_key(dialect: str):
+    if dialect == "sqlite":
+        # SQLite keeps timestamps as text, with or without fractional seconds
+        # depending on who wrote them; compare a normalised form instead
+        return func.strftime("%Y-%m-%d %H:%M:%f", Conversation.created_at)
+    return Conversation.created_at
+
+
+def conversation_dict(row) -> dict:
+    created_at = row.created_at
+    return {
+        "id": row.id,
+        "session_id": row.session_id,
+        "user_id": row.user_id,
+        "user_message": row.user_message,
+        "agent_response": row.agent_response,
+        "language": row.language,
+        "created_at": created_at.isoformat() if isinstance(created_at, datetime.datetime) else created_at,
+        "conversation_data": row.conversation_data,
+    }
+
+
+def build_history_query(dialect: str, session_id: str, cursor: str = None, since: datetime.datetime = None,
+                        limit: int = DEFAULT_PAGE_SIZE):
+    """One page of a session's turns over (session_id, created_at, id).
+
+    Without ``since`` pages walk backwards from the latest turn ("older");
+    with it they walk forwards from just after ``since`` ("newer"). A
+    cursor continues in the direction it was issued for. ``limit + 1`` rows
+    are selected so the caller can tell whether another page exists.
+    """
+    key = _created_key(dialect)
+    stmt = select(*_COLUMNS, key.label("sort_value")).where(Conversation.session_id == session_id)
+    if cursor:
+        try:
+            value, last_id = decode_cursor(cursor, "newer")
+            direction = "newer"
+        except ValueError:
+            value, last_id = decode_cursor(cursor, "older")
+            direction = "older"
+        if direction == "newer":
+            stmt = stmt.where(or_(key > value, and_(key == value, Conversation.id > last_id)))
+        else:
+            stmt = stmt.where(or_(key < value, and_(key == value, Conversation.id < last_id)))
+    elif since is not None:
+        direction = "newer"
+        since_key = func.strftime("%Y-%m-%d %H:%M:%f", since) if dialect == "sqlite" else since
+        stmt = stmt.where(key > since_key)
+    else:
+        direction = "older"
+
+    if direction == "newer":
+        stmt = stmt.order_by(key.asc(), Conversation.id.asc())
+    else:
+        stmt = stmt.order_by(key.desc(), Conversation.id.desc())
+    return stmt.limit(limit + 1), direction
+
+
+async def get_history_page(db: AsyncSession, session_id: str, limit: int = DEFAULT_PAGE_SIZE, **params) -> dict:
+    """``{"items": [...] oldest first, "next_cursor": ...}`` for one page of history"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt, direction = build_history_query(db.bind.dialect.name, session_id, limit=limit, **params)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(direction, rows[-1].sort_value, rows[-1].id)
+    if direction == "older":
+        rows.reverse()
+    return {"items": [conversation_dict(row) for row in rows], "next_cursor": next_cursor}
+
+
+async def export_ndjson(db: AsyncSession, session_id: str = None, user_id: int = None):
+    """Yield every matching turn as one JSON line, oldest first, in constant memory"""
+    stmt = select(*_COLUMNS)
+    if session_id is not None:
+        stmt = stmt.where(Conversation.session_id == session_id).order_by(Conversation.created_at, Conversation.id)
+    else:
+        stmt = stmt.where(Conversation.user_id == user_id).order_by(Conversation.created_at, Conversation.id)
+    # A server-side cursor: rows arrive EXPORT_BATCH_ROWS at a time, never all at once
+    result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+    async for partition in result.partitions():
+        yield "".join(json.dumps(conversation_dict(row), ensure_ascii=False) + "\n" for row in partition)
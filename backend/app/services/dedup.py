@@ -0,0 +1,305 @@
+"""Near-duplicate listing detection with MinHash and locality-sensitive hashing.
+
+Each listing's title, description and location are normalised and cut into
+overlapping byte shingles; a MinHash signature estimates the Jaccard similarity of
+two shingle sets. Signatures are split into bands and every band is hashed
+into a bucket, so a new listing is only compared with the listings it shares
+a bucket with: sublinear per insert instead of a scan of the catalogue.
+Candidates count as duplicates when the estimated similarity reaches the
+threshold and price and area agree within tolerance.
+
+Deduplicate the existing table with:
+
+    python -m app.services.dedup [--apply] [--mode flag|merge]
+"""
+import logging
+import re
+import threading
+import numpy as np
+from sqlalchemy import select, delete, insert
+from app.config import settings
+from app.models import Property, PropertyAmenity, PropertyDuplicate
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "flag", "merge")
+
+_NON_WORD = re.compile(r"\W+")
+
+
+def listing_text(values) -> str:
+    """The text a listing is fingerprinted on: title, description and location"""
+    get = values.get if isinstance(values, dict) else lambda name: getattr(values, name, None)
+    text = " ".join(str(get(name) or "") for name in ("title", "description", "location"))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def not_duplicate():
+    """WHERE clause hiding listings flagged as near-duplicates"""
+    return Property.id.notin_(select(PropertyDuplicate.property_id))
+
+
+def lsh_bands(threshold: float, num_perm: int):
+    """(bands, rows) for ``num_perm`` hashes minimising missed plus spurious candidates around ``threshold``"""
+    s = np.linspace(0, 1, 201)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        p = 1 - (1 - s ** rows) ** bands
+        # Pairs below the threshold that become candidates, and pairs above it that do not
+        error = np.trapz(np.where(s < threshold, p, 0), s) + np.trapz(np.where(s >= threshold, 1 - p, 0), s)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures over byte shingles of the text, ``num_perm`` 32-bit hashes each"""
+
+    def __init__(self, num_perm: int = 128, shingle: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: the high 32 bits of (a * x + b) mod 2^64, a odd
+        self._a = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            self._powers = np.uint64(1099511628211) ** np.arange(shingle - 1, -1, -1, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Distinct 64-bit polynomial hashes of the ``shingle``-byte windows of the UTF-8 text"""
+        data = np.frombuffer(text.encode(), dtype=np.uint8).astype(np.uint64)
+        if not len(data):
+            return data
+        if len(data) < self.shingle:
+            data = np.pad(data, (0, self.shingle - len(data)))
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle)
+        with np.errstate(over="ignore"):
+            return np.unique((windows * self._powers).sum(axis=1))
+
+    def signature(self, text: str):
+        """uint32 signature, or None for a listing with no text to compare"""
+        x = self.shingles(text)
+        if not len(x):
+            return None
+        with np.errstate(over="ignore"):
+            hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+class LSHIndex:
+    """Banded buckets of MinHash signatures, with the numbers needed to verify a candidate"""
+
+    def __init__(self, bands: int, rows: int):
+        self.bands, self.rows = bands, rows
+        self._buckets = [{} for _ in range(bands)]
+        self._entries = {}  # key -> (signature, price, area)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [signature[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def add(self, key, signature, price=None, area=None):
+        self._entries[key] = (signature, price, area)
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def candidates(self, signature) -> set:
+        found = set()
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            found.update(bucket.get(band, ()))
+        return found
+
+    def best_match(self, signature, price, area, threshold, price_tolerance, area_tolerance):
+        """(key, similarity) of the most similar verified duplicate, or None"""
+        best = None
+        for key in self.candidates(signature):
+            other, other_price, other_area = self._entries[key]
+            if not (_close(price, other_price, price_tolerance) and _close(area, other_area, area_tolerance)):
+                continue
+            similarity = float(np.mean(signature == other))
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+
+def _close(a, b, tolerance) -> bool:
+    """Within ``tolerance`` of the larger value; unknown values do not rule a match out"""
+    if not a or not b:
+        return True
+    return abs(a - b) <= tolerance * max(abs(a), abs(b))
+
+
+class Deduplicator:
+    """LSH index over the canonical (not flagged) listings, for the write paths.
+
+    ``check`` fingerprints a listing and returns the earlier listing it
+    duplicates, if any; ``add`` indexes a written listing. Listings written
+    by other workers are picked up by ``refresh``, which reads only ids above
+    the highest one indexed. ``load_in_background`` does the first, full
+    refresh off the request path.
+    """
+
+    def __init__(self, mode: str = "flag", threshold: float = 0.8, price_tolerance: float = 0.05,
+                 area_tolerance: float = 0.05, num_perm: int = 128):
+        self.mode = mode
+        self.threshold = threshold
+        self.price_tolerance = price_tolerance
+        self.area_tolerance = area_tolerance
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.index = LSHIndex(self.bands, self.rows)
+        self.max_id = 0
+        self._lock = threading.Lock()
+        self._loading = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def new_index(self) -> LSHIndex:
+        return LSHIndex(self.bands, self.rows)
+
+    def signature(self, values):
+        return self.hasher.signature(listing_text(values))
+
+    def match(self, index: LSHIndex, signature, values):
+        get = values.get if isinstance(values, dict) else lambda name: getattr(values, name, None)
+        return index.best_match(
+            signature, get("price"), get("area_sqft"), self.threshold, self.price_tolerance, self.area_tolerance
+        )
+
+    def refresh(self, conn):
+        """Index listings written since the last refresh (by any worker); ``conn`` is a Session or Connection"""
+        with self._lock:
+            self._refresh(conn)
+
+    def load_in_background(self):
+        """Index the existing listings on a daemon thread unless a load is already running"""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._background_load, name="dedup-load", daemon=True).start()
+
+    def _background_load(self):
+        from app.database import SessionLocal
+
+        try:
+            with SessionLocal() as db:
+                self.refresh(db)
+        except Exception as e:
+            ERRORS.inc(component="dedup")
+            logger.exception(f"Error loading listings into the duplicate index: {e}")
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def _refresh(self, conn):
+        rows = conn.execute(
+            select(Property.id, Property.title, Property.description, Property.location, Property.price, Property.area_sqft)
+            .where(Property.id > self.max_id, not_duplicate())
+            .order_by(Property.id)
+        ).all()
+        for row in rows:
+            self._add(row.id, self.signature(row), row)
+        if rows:
+            self.max_id = max(self.max_id, rows[-1].id)
+
+    def check(self, conn, values):
+        """(signature, (duplicate_of, similarity) or None) for a listing about to be written"""
+        signature = self.signature(values)
+        with self._lock:
+            self._refresh(conn)
+            match = self.match(self.index, signature, values) if signature is not None else None
+        return signature, match
+
+    def lookup(self, signature, values):
+        """(duplicate_of, similarity) among the indexed listings, or None"""
+        with self._lock:
+            return self.match(self.index, signature, values)
+
+    def add(self, property_id: int, signature, values):
+        """Index a written listing as an original others may duplicate"""
+        with self._lock:
+            self._add(property_id, signature, values)
+
+    def _add(self, property_id, signature, values):
+        if signature is None:
+            return
+        get = values.get if isinstance(values, dict) else lambda name: getattr(values, name, None)
+        self.index.add(property_id, signature, get("price"), get("area_sqft"))
+        self.max_id = max(self.max_id, property_id)
+
+
+deduplicator = Deduplicator(
+    mode=settings.DEDUP_MODE,
+    threshold=settings.DEDUP_THRESHOLD,
+    price_tolerance=settings.DEDUP_PRICE_TOLERANCE,
+    area_tolerance=settings.DEDUP_AREA_TOLERANCE
+)
+
+
+def deduplicate_table(conn, mode: str = "flag", apply: bool = False) -> dict:
+    """Find near-duplicates among existing listings, oldest listing kept as the original.
+
+    With ``apply``, ``flag`` records them in property_duplicates and
+    ``merge`` deletes them (and their amenity rows).
+    """
+    checker = Deduplicator(mode, deduplicator.threshold, deduplicator.price_tolerance, deduplicator.area_tolerance)
+    already = set(conn.execute(select(PropertyDuplicate.property_id)).scalars())
+    rows = conn.execute(
+        select(Property.id, Property.title, Property.description, Property.location, Property.price, Property.area_sqft)
+        .order_by(Property.id)
+    ).all()
+    found = []
+    for row in rows:
+        if row.id in already:
+            continue
+        signature = checker.signature(row)
+        if signature is None:
+            continue
+        match = checker.match(checker.index, signature, row)
+        if match:
+            found.append({"property_id": row.id, "duplicate_of": match[0], "similarity": match[1]})
+        else:
+            checker._add(row.id, signature, row)
+
+    if apply and found:
+        ids = [f["property_id"] for f in found]
+        if mode == "merge":
+            for start in range(0, len(ids), 1000):
+                chunk = ids[start:start + 1000]
+                conn.execute(delete(PropertyAmenity).where(PropertyAmenity.property_id.in_(chunk)))
+                conn.execute(delete(Property).where(Property.id.in_(chunk)))
+        else:
+            conn.execute(insert(PropertyDuplicate.__table__), found)
+    return {"scanned": len(rows), "duplicates": len(found), "applied": bool(apply and found), "pairs": found}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from app.database import engine
+    from .inventory import inventory
+
+    parser = argparse.ArgumentParser(description="Find near-duplicate listings in the properties table")
+    parser.add_argument("--mode", choices=("flag", "merge"), default="flag")
+    parser.add_argument("--apply", action="store_true", help="write the result (default: report only)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        result = deduplicate_table(conn, args.mode, args.apply)
+    for pair in result["pairs"][:50]:
+        print(f"{pair['property_id']} duplicates {pair['duplicate_of']} (similarity {pair['similarity']:.2f})")
+    print(
+        f"{result['duplicates']} near-duplicates among {result['scanned']} listings "
+        f"in {time.perf_counter() - started:.1f} s" + ("" if result["applied"] else " (not applied)")
+    )
+    if result["applied"]:
+        inventory.notify()
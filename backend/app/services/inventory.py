@@ -0,0 +1,40 @@
+import logging
+import threading
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryEvents:
+    """Version counter and listeners for writes to the properties table.
+
+    Every successful property write calls ``notify`` with the written rows.
+    Caches compare ``version`` to detect staleness; indexes subscribe to
+    apply the change incrementally.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        """Register ``listener(properties)``; called after each write"""
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def notify(self, properties=None):
+        """Bump the inventory version and fan the change out to listeners"""
+        with self._lock:
+            self.version += 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(properties or [])
+            except Exception as e:
+                ERRORS.inc(component="inventory")
+                logger.exception(f"Error in inventory listener {getattr(listener, '__qualname__', listener)}: {e}")
+
+
+inventory = InventoryEvents()
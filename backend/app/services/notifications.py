@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+
+class NotificationHub:
+    """Fan-out of per-session events to connected stream subscribers.
+
+    Each subscriber gets a bounded queue on its own event loop; ``publish``
+    is safe to call from any thread. A subscriber that stops reading loses
+    its oldest events rather than growing without bound.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subscribers = {}  # session_id -> {queue: loop}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, session_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(session_id, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(session_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self._subscribers.pop(session_id, None)
+
+    def is_connected(self, session_id: str) -> bool:
+        return session_id in self._subscribers
+
+    def _offer(self, queue, item):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(item)
+
+    def publish(self, session_id: str, event: str, payload: dict):
+        with self._lock:
+            targets = list(self._subscribers.get(session_id, {}).items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, (event, payload))
+                self.published += 1
+            except RuntimeError:
+                # The subscriber's loop is closed; it unsubscribes when its stream ends
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+notifications = NotificationHub()
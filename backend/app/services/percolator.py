@@ -0,0 +1,403 @@
+"""Reverse search: which saved session preferences does a new listing satisfy?
+
+Every ``user_preferences`` row is a standing query. Instead of running each
+of them against a new listing, the predicates are indexed: location and
+type postings, and an interval tree over the budgets, so a listing only
+meets the preferences that could possibly match it. Matches are published
+to the session's notification stream.
+"""
+import logging
+import threading
+import time
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import UserPreference
+from .amenities import normalise_amenities
+from .inventory import inventory
+from .notifications import notifications
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+PREFERENCE_FIELDS = ("budget_min", "budget_max", "preferred_locations", "property_types", "bedrooms", "amenities")
+
+# Rows added since the interval tree was built are scanned linearly until there are this many
+TREE_REBUILD_ROWS = 4096
+
+
+class _Vector:
+    """Append-only int64 array growing by doubling"""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self):
+        self.data = np.zeros(4, dtype=np.int64)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros(len(self.data), dtype=np.int64)])
+        self.data[self.size] = value
+        self.size += 1
+
+    def view(self):
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+
+class IntervalTree:
+    """Static centred interval tree over closed intervals ``[lo[i], hi[i]]``.
+
+    Each node keeps the intervals containing its centre sorted by both ends,
+    so a stabbing query takes one binary search per level plus the size of
+    the answer. Open ends are ``-inf`` / ``inf``.
+    """
+
+    def __init__(self, lo, hi, rows):
+        self.size = len(rows)
+        # (centre, lo sorted, rows by lo, hi sorted, rows by hi, left node, right node)
+        self._nodes = []
+        self._root = self._build(lo, hi, np.asarray(rows, dtype=np.int64)) if len(rows) else -1
+
+    def _build(self, lo, hi, rows):
+        ends = np.concatenate([lo[rows], hi[rows]])
+        ends = ends[np.isfinite(ends)]
+        centre = float(np.median(ends)) if len(ends) else 0.0
+        left = rows[hi[rows] < centre]
+        right = rows[(lo[rows] > centre) & (hi[rows] >= centre)]
+        here = rows[(hi[rows] >= centre) & (lo[rows] <= centre)]
+
+        by_lo = here[np.argsort(lo[here], kind="stable")]
+        by_hi = here[np.argsort(hi[here], kind="stable")]
+        node = len(self._nodes)
+        self._nodes.append([centre, lo[by_lo], by_lo, hi[by_hi], by_hi, -1, -1])
+        if len(left):
+            self._nodes[node][5] = self._build(lo, hi, left)
+        if len(right):
+            self._nodes[node][6] = self._build(lo, hi, right)
+        return node
+
+    def _slices(self, x):
+        node = self._root
+        while node != -1:
+            centre, lo_sorted, by_lo, hi_sorted, by_hi, left, right = self._nodes[node]
+            if x < centre:
+                # Every interval here reaches the centre; it contains x if it starts by x
+                yield by_lo[:np.searchsorted(lo_sorted, x, side="right")]
+                node = left
+            elif x > centre:
+                yield by_hi[np.searchsorted(hi_sorted, x, side="left"):]
+                node = right
+            else:
+                yield by_lo
+                return
+
+    def count(self, x) -> int:
+        return sum(len(s) for s in self._slices(x))
+
+    def stab(self, x) -> np.ndarray:
+        """Rows whose interval contains ``x``"""
+        slices = list(self._slices(x))
+        return np.concatenate(slices) if slices else np.zeros(0, dtype=np.int64)
+
+
+class Percolator:
+    """Inverted index over saved preferences, queried with one listing at a time.
+
+    A preference is stored as one row of predicate arrays: budget bounds,
+    minimum bedrooms and required amenity bits. Rows are also posted under
+    each lower-cased preferred location and type, or under "any" when the
+    preference leaves that field open, and budgets go into an
+    ``IntervalTree``. Matching a listing takes whichever of the location,
+    type and budget candidate sets is smallest and checks the remaining
+    predicates on those rows only, vectorised.
+
+    Preferences change by merging, field by field, as ``user_preferences``
+    does: the old row is tombstoned and the merged one appended. Tombstones
+    and rows newer than the tree are compacted away by periodic rebuilds.
+    """
+
+    def __init__(self, max_age_seconds: float = 3600):
+        self.max_age_seconds = max_age_seconds
+        self.loaded_at = None
+        self.matched = 0
+        self._lock = threading.Lock()
+        self._pending = None  # (listings, preference updates) seen while a load is running
+        self._reset()
+
+    def _reset(self, capacity=1024, words=1):
+        self.size = 0
+        self._sessions = []  # row -> session_id
+        self._preferences = {}  # session_id -> merged preference dict
+        self._rows = {}  # session_id -> live row
+        self._lo = np.full(capacity, -np.inf)
+        self._hi = np.full(capacity, np.inf)
+        self._bedrooms = np.zeros(capacity, dtype=np.int32)
+        self._amenities = np.zeros((words, capacity), dtype=np.uint64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._has_location = np.zeros(capacity, dtype=bool)
+        self._has_type = np.zeros(capacity, dtype=bool)
+        self._amenity_codes = {}
+        self._by_location = {}
+        self._any_location = _Vector()
+        self._by_type = {}
+        self._any_type = _Vector()
+        self._tree = IntervalTree(self._lo, self._hi, [])
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _reserve(self, rows, words):
+        words_now, capacity = self._amenities.shape
+        if rows <= capacity and words <= words_now:
+            return
+        grown = max(rows, capacity * 2) if rows > capacity else capacity
+
+        def grow(values, fill):
+            out = np.full(grown, fill, dtype=values.dtype)
+            out[:self.size] = values[:self.size]
+            return out
+
+        self._lo, self._hi = grow(self._lo, -np.inf), grow(self._hi, np.inf)
+        self._bedrooms = grow(self._bedrooms, 0)
+        self._live = grow(self._live, False)
+        self._has_location, self._has_type = grow(self._has_location, False), grow(self._has_type, False)
+        amenities = np.zeros((max(words, words_now), grown), dtype=np.uint64)
+        amenities[:words_now, :self.size] = self._amenities[:, :self.size]
+        self._amenities = amenities
+
+    @staticmethod
+    def _texts(values):
+        return sorted({str(v).strip().lower() for v in values or [] if str(v).strip()})
+
+    def _append(self, session_id, prefs):
+        """Index one merged preference as a new row; caller holds the lock"""
+        locations = self._texts(prefs.get("preferred_locations"))
+        types = self._texts(prefs.get("property_types"))
+        codes = []
+        for amenity in normalise_amenities(prefs.get("amenities")):
+            codes.append(self._amenity_codes.setdefault(amenity, len(self._amenity_codes)))
+        bedrooms = prefs.get("bedrooms") or 0
+        lo, hi = prefs.get("budget_min"), prefs.get("budget_max")
+        if not (locations or types or codes or bedrooms or lo or hi):
+            # Nothing to match on: every listing would qualify
+            return
+        if lo and hi and lo > hi:
+            # Merged from different turns into an empty budget: no listing can qualify
+            return
+
+        self._reserve(self.size + 1, max(1, -(-len(self._amenity_codes) // 64)))
+        row = self.size
+        self.size += 1
+        self._sessions.append(session_id)
+        self._rows[session_id] = row
+        self._lo[row] = lo if lo else -np.inf
+        self._hi[row] = hi if hi else np.inf
+        self._bedrooms[row] = bedrooms
+        self._amenities[:, row] = 0
+        for code in codes:
+            self._amenities[code // 64, row] |= np.uint64(1 << (code % 64))
+        self._has_location[row] = bool(locations)
+        self._has_type[row] = bool(types)
+        self._live[row] = True
+        for location in locations:
+            self._by_location.setdefault(location, _Vector()).append(row)
+        if not locations:
+            self._any_location.append(row)
+        for property_type in types:
+            self._by_type.setdefault(property_type, _Vector()).append(row)
+        if not types:
+            self._any_type.append(row)
+
+    def _rebuild(self):
+        """Reindex the live preferences from scratch; caller holds the lock"""
+        preferences = self._preferences
+        self._reset(capacity=max(1024, 2 * len(preferences)), words=self._amenities.shape[0])
+        self._preferences = preferences
+        for session_id, prefs in preferences.items():
+            self._append(session_id, prefs)
+        self._tree = IntervalTree(self._lo, self._hi, np.arange(self.size))
+
+    def _maintain(self):
+        dead = self.size - len(self._rows)
+        if dead > len(self._rows):
+            self._rebuild()
+        elif self.size - self._tree.size > max(TREE_REBUILD_ROWS, self._tree.size // 10):
+            self._tree = IntervalTree(self._lo, self._hi, np.arange(self.size))
+
+    def update(self, session_id: str, preferences: dict):
+        """Merge a session's new preferences; fields left empty keep their stored value"""
+        with self._lock:
+            if self._pending is not None:
+                # The running load may have read the row before this change
+                self._pending[1].append((session_id, preferences))
+                return
+            if not self.loaded:
+                return
+            merged = dict(self._preferences.get(session_id) or {field: None for field in PREFERENCE_FIELDS})
+            for field in PREFERENCE_FIELDS:
+                if preferences.get(field) not in (None, [], ""):
+                    merged[field] = preferences[field]
+            self._preferences[session_id] = merged
+            row = self._rows.pop(session_id, None)
+            if row is not None:
+                self._live[row] = False
+            self._append(session_id, merged)
+            self._maintain()
+
+    def _replace(self, rows):
+        preferences = {
+            row.session_id: {field: getattr(row, field) for field in PREFERENCE_FIELDS}
+            for row in rows if row.session_id
+        }
+        with self._lock:
+            self._preferences = preferences
+            self._rebuild()
+            self.loaded_at = time.monotonic()
+            (listings, updates), self._pending = self._pending or ([], []), None
+        for session_id, changes in updates:
+            self.update(session_id, changes)
+        if listings:
+            self.on_properties(listings)
+
+    def _begin_load(self) -> bool:
+        with self._lock:
+            if self._pending is not None:
+                return False
+            self._pending = ([], [])
+            return True
+
+    def load(self, db: Session):
+        """Index every stored preference; the latest row wins for a session"""
+        self._begin_load()  # already begun when started by load_in_background
+        try:
+            self._replace(db.execute(
+                select(UserPreference.session_id, *(getattr(UserPreference, f) for f in PREFERENCE_FIELDS))
+                .order_by(UserPreference.id)
+                .execution_options(yield_per=10000)
+            ))
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+    def load_in_background(self):
+        """Start a load on a daemon thread unless one is already running"""
+        if self._begin_load():
+            threading.Thread(target=self._background_load, name="percolator-load", daemon=True).start()
+
+    def _background_load(self):
+        from app.database import SessionLocal
+
+        try:
+            with SessionLocal() as db:
+                self.load(db)
+        except Exception as e:
+            ERRORS.inc(component="percolator")
+            logger.exception(f"Error loading saved preferences into the percolator: {e}")
+
+    def is_stale(self) -> bool:
+        return not self.loaded or time.monotonic() - self.loaded_at > self.max_age_seconds
+
+    @staticmethod
+    def _postings(index, keys):
+        return [index[key].view() for key in keys if key in index]
+
+    def match(self, listing) -> list:
+        """Session ids whose preferences the listing satisfies"""
+        price = listing.price
+        location = str(listing.location or "").strip().lower()
+        property_type = str(listing.property_type or "").strip().lower()
+        with self._lock:
+            if not self._rows:
+                return []
+            # Preferred locations are prefixes of the listing location, as in retrieval
+            by_location = self._postings(self._by_location, {location[:n] for n in range(1, len(location) + 1)})
+            by_type = self._postings(self._by_type, [property_type])
+            any_location, any_type = self._any_location.view(), self._any_type.view()
+            tree, tree_size, size = self._tree, self._tree.size, self.size
+            lo, hi, live = self._lo, self._hi, self._live
+            bedrooms, amenities = self._bedrooms, self._amenities
+            has_location, has_type = self._has_location, self._has_type
+            # A reload or rebuild swaps in a new list; rows must map through this one
+            sessions = self._sessions
+            codes = [self._amenity_codes.get(a) for a in normalise_amenities(listing.amenities)]
+
+        # Candidates from the most selective predicate
+        sources = {
+            "location": sum(len(p) for p in by_location) + len(any_location),
+            "type": sum(len(p) for p in by_type) + len(any_type),
+        }
+        if price is not None:
+            sources["budget"] = tree.count(price) + size - tree_size
+        source = min(sources, key=sources.get)
+        if source == "location":
+            rows = np.concatenate(by_location + [any_location])
+        elif source == "type":
+            rows = np.concatenate(by_type + [any_type])
+        else:
+            rows = np.concatenate([tree.stab(price), np.arange(tree_size, size)])
+        if not len(rows):
+            return []
+
+        keep = live[rows]
+        if price is None:
+            keep &= np.isneginf(lo[rows]) & np.isposinf(hi[rows])
+        else:
+            # Also needed for budget candidates: rows newer than the tree come unfiltered
+            keep &= (lo[rows] <= price) & (price <= hi[rows])
+        if source != "location":
+            specific = np.concatenate(by_location) if by_location else np.zeros(0, dtype=np.int64)
+            keep &= ~has_location[rows] | np.isin(rows, specific)
+        if source != "type":
+            specific = np.concatenate(by_type) if by_type else np.zeros(0, dtype=np.int64)
+            keep &= ~has_type[rows] | np.isin(rows, specific)
+        keep &= bedrooms[rows] <= (listing.bedrooms or 0)
+        # Every amenity the preference asks for must be on the listing
+        listing_bits = np.zeros(len(amenities), dtype=np.uint64)
+        for code in codes:
+            if code is not None and code // 64 < len(listing_bits):
+                listing_bits[code // 64] |= np.uint64(1 << (code % 64))
+        for word in range(len(amenities)):
+            keep &= (amenities[word, rows] & ~listing_bits[word]) == 0
+
+        matched = np.unique(rows[keep])
+        return [sessions[row] for row in matched]
+
+    def on_properties(self, properties):
+        """Percolate written listings and notify the matching sessions; subscribed to inventory writes"""
+        if self.is_stale():
+            # Other workers' preference changes arrive with the next full load
+            self.load_in_background()
+        with self._lock:
+            if self._pending is not None:
+                self._pending[0].extend(properties)
+                return
+        for prop in properties:
+            sessions = self.match(prop)
+            if not sessions:
+                continue
+            self.matched += len(sessions)
+            payload = {
+                "property_id": prop.id,
+                "title": prop.title,
+                "location": prop.location,
+                "property_type": prop.property_type,
+                "price": prop.price,
+                "bedrooms": prop.bedrooms,
+            }
+            for session_id in sessions:
+                notifications.publish(session_id, "property_match", payload)
+
+
+percolator = Percolator(max_age_seconds=settings.PERCOLATOR_MAX_AGE_SECONDS)
+inventory.subscribe(percolator.on_properties)
+
@@ -0,0 +1,338 @@
+"""Bulk property import from streamed CSV or JSONL.
+
+Rows are validated in chunks against ``PropertyCreate`` and each chunk of
+valid rows is written in one transaction: ``COPY`` on PostgreSQL, a
+batched multi-row INSERT elsewhere. Invalid rows are reported and skipped.
+Near-duplicates of existing listings, or of earlier rows, are flagged or
+dropped as ``DEDUP_MODE`` says. Indexes and caches over the inventory are
+updated once, after the last chunk. Import a file from the command line with:
+
+    python -m app.services.property_import listings.csv [--format jsonl]
+"""
+import csv
+import datetime
+import io
+import json
+import logging
+import time
+import anyio
+from pydantic import ValidationError
+from sqlalchemy import insert, text
+from app.config import settings
+from app.models import Property, PropertyAmenity, PropertyDuplicate
+from app.schemas import PropertyCreate
+from .amenities import amenity_rows
+from .dedup import deduplicator
+from .inventory import inventory
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+
+# Per-row errors kept in the report; the counts cover every row
+MAX_REPORTED_ERRORS = 1000
+
+_COLUMNS = ("id", "title", "description", "price", "location", "property_type", "bedrooms", "bathrooms",
+            "area_sqft", "amenities", "images", "available_from")
+_LIST_FIELDS = ("amenities", "images")
+
+
+class _Written:
+    """The written columns of one imported row, as inventory listeners read them"""
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, values: dict):
+        for name in _COLUMNS:
+            setattr(self, name, values[name])
+
+
+def _csv_value(field, value):
+    value = value.strip() if isinstance(value, str) else value
+    if value in ("", None):
+        return None
+    if field in _LIST_FIELDS and isinstance(value, str):
+        # A JSON array, or a comma-separated list
+        if value.startswith("["):
+            return json.loads(value)
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return value
+
+
+def iter_records(stream, fmt: str):
+    """``(row number, dict or parse error)`` for each record in a text stream"""
+    if fmt == "csv":
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            try:
+                values = {field: _csv_value(field, value) for field, value in record.items() if field}
+                # Blank cells are missing values, so optional columns take their defaults
+                yield number, {field: value for field, value in values.items() if value is not None}
+            except ValueError as e:
+                yield number, e
+    elif fmt == "jsonl":
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+                yield number, record if isinstance(record, dict) else ValueError("expected a JSON object")
+            except ValueError as e:
+                yield number, e
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}")
+
+
+def _validate(records, report):
+    """``(row number, column dict)`` for the valid records; errors for the rest go into the report"""
+    now = datetime.datetime.utcnow()
+    valid = []
+    for number, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            data = PropertyCreate(**record).dict()
+        except ValidationError as e:
+            _fail(report, number, [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()])
+            continue
+        except (ValueError, TypeError) as e:
+            _fail(report, number, [str(e)])
+            continue
+        data["available_from"] = data["available_from"] or now
+        valid.append((number, data))
+    return valid
+
+
+def _fail(report, number, errors):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": number, "errors": errors})
+
+
+def _copy_text(value):
+    """One field in PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, ensure_ascii=False)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy(conn, table: str, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(row[c]) for c in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def _write_chunk(conn, rows):
+    """Insert one chunk of validated rows and their amenity rows; returns the rows with ids"""
+    if conn.dialect.name == "postgresql":
+        # COPY cannot return generated keys: take the ids from the sequence up front
+        ids = conn.execute(
+            text("SELECT nextval(pg_get_serial_sequence('properties', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(rows)}
+        ).scalars().all()
+        for row, pid in zip(rows, ids):
+            row["id"] = pid
+        _copy(conn, Property.__tablename__, _COLUMNS, rows)
+        written = [_Written(row) for row in rows]
+        amenities = amenity_rows(written)
+        if amenities:
+            _copy(conn, PropertyAmenity.__tablename__, ("property_id", "amenity"), amenities)
+    else:
+        table = Property.__table__
+        ids = conn.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [{c: row[c] for c in _COLUMNS if c != "id"} for row in rows]
+        ).scalars().all()
+        for row, pid in zip(rows, ids):
+            row["id"] = pid
+        written = [_Written(row) for row in rows]
+        amenities = amenity_rows(written)
+        if amenities:
+            conn.execute(insert(PropertyAmenity.__table__), amenities)
+    return written
+
+
+def _deduplicate(conn, valid, report):
+    """Drop (merge mode) or link (flag mode) near-duplicates of listings already indexed or earlier in the chunk.
+
+    Returns the rows to write, their signatures and ``(row position, duplicate_of key, similarity)``
+    links; a key is a property id, or ``("row", position)`` for a row of this chunk.
+    """
+    deduplicator.refresh(conn)
+    chunk_index = deduplicator.new_index()
+    rows, signatures, links = [], [], []
+    for number, data in valid:
+        signature = deduplicator.signature(data)
+        match = None
+        if signature is not None:
+            candidates = [m for m in (deduplicator.lookup(signature, data), deduplicator.match(chunk_index, signature, data)) if m]
+            match = max(candidates, key=lambda m: m[1]) if candidates else None
+        if match and deduplicator.mode == "merge":
+            report["merged"] += 1
+            continue
+        position = len(rows)
+        rows.append(data)
+        signatures.append(signature)
+        if match:
+            links.append((position, match[0], match[1]))
+        elif signature is not None:
+            chunk_index.add(("row", position), signature, data.get("price"), data.get("area_sqft"))
+    report["duplicates"] += len(links)
+    return rows, signatures, links
+
+
+def _write_links(conn, rows, links):
+    values = [
+        {"property_id": rows[position]["id"], "duplicate_of": rows[key[1]]["id"] if isinstance(key, tuple) else key, "similarity": similarity}
+        for position, key, similarity in links
+    ]
+    if values:
+        conn.execute(insert(PropertyDuplicate.__table__), values)
+
+
+def import_properties(stream, fmt: str = "csv", chunk_rows: int = None, dry_run: bool = False, engine=None) -> dict:
+    """Validate and load every record of a text stream; returns the import report"""
+    if engine is None:
+        from app.database import engine
+    chunk_rows = chunk_rows or settings.PROPERTY_IMPORT_CHUNK_ROWS
+    started = time.perf_counter()
+    report = {"received": 0, "imported": 0, "failed": 0, "duplicates": 0, "merged": 0, "errors": []}
+    written = []
+
+    def load(chunk):
+        valid = _validate(chunk, report)
+        if not valid or dry_run:
+            return
+        try:
+            with engine.begin() as conn:
+                rows, signatures, links = [data for _, data in valid], [], []
+                if deduplicator.enabled:
+                    rows, signatures, links = _deduplicate(conn, valid, report)
+                chunk_written = _write_chunk(conn, rows) if rows else []
+                _write_links(conn, rows, links)
+            report["imported"] += len(rows)
+            linked = {position for position, _, _ in links}
+            # Flagged duplicates stay out of the indexes, as they do out of search
+            written.extend(row for position, row in enumerate(chunk_written) if position not in linked)
+            for position, signature in enumerate(signatures):
+                if position not in linked:
+                    deduplicator.add(rows[position]["id"], signature, rows[position])
+        except Exception as e:
+            ERRORS.inc(component="property_import")
+            logger.exception(f"Error importing rows {chunk[0][0]}-{chunk[-1][0]}: {e}")
+            for number, _ in valid:
+                _fail(report, number, [f"chunk not written: {e.__class__.__name__}"])
+
+    chunk = []
+    try:
+        for record in iter_records(stream, fmt):
+            report["received"] += 1
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                load(chunk)
+                chunk = []
+        load(chunk)
+    except (csv.Error, UnicodeDecodeError) as e:
+        # The stream cannot be read past this point; keep what was loaded
+        report["stream_error"] = str(e)
+    finally:
+        if written:
+            # One refresh of caches and indexes for the whole import
+            inventory.notify(written)
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["received"] / elapsed) if elapsed else None
+    return report
+
+
+class _ChunkReader(io.RawIOBase):
+    """Blocking file object over byte chunks handed over by ``read_chunk``"""
+
+    def __init__(self, read_chunk):
+        self._read_chunk = read_chunk
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            self._buffer = self._read_chunk()
+            if not self._buffer:
+                return 0
+        n = min(len(target), len(self._buffer))
+        target[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+async def aimport_properties(chunks, fmt: str = "csv", chunk_rows: int = None, dry_run: bool = False) -> dict:
+    """``import_properties`` over an async iterator of byte chunks (e.g. a request body).
+
+    Parsing and loading run on a worker thread that pulls the body as it
+    needs it, so the upload is never buffered whole.
+    """
+    send, receive = anyio.create_memory_object_stream(16)
+
+    async def pump():
+        async with send:
+            try:
+                async for chunk in chunks:
+                    if chunk:
+                        await send.send(chunk)
+            except anyio.BrokenResourceError:
+                pass  # the importer stopped reading
+
+    def read_chunk():
+        try:
+            return anyio.from_thread.run(receive.receive)
+        except anyio.EndOfStream:
+            return b""
+
+    def run():
+        with receive:
+            stream = io.TextIOWrapper(io.BufferedReader(_ChunkReader(read_chunk)), encoding="utf-8-sig", newline="")
+            return import_properties(stream, fmt, chunk_rows, dry_run)
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(pump)
+        return await anyio.to_thread.run_sync(run)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import properties from CSV or JSONL")
+    parser.add_argument("path", help="file to import, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--chunk-rows", type=int, default=settings.PROPERTY_IMPORT_CHUNK_ROWS)
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    if args.path == "-":
+        import sys
+        source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    else:
+        source = open(args.path, encoding="utf-8-sig", newline="")
+    with source:
+        result = import_properties(source, fmt, args.chunk_rows, args.dry_run)
+    for error in result["errors"]:
+        print(f"row {error['row']}: {'; '.join(error['errors'])}")
+    print(
+        f"Imported {result['imported']} of {result['received']} rows ({result['failed']} failed, "
+        f"{result['duplicates']} flagged and {result['merged']} merged as duplicates) "
+        f"in {result['seconds']:.1f} s: {result['rows_per_second']} rows/s"
+    )
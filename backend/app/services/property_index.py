@@ -0,0 +1,380 @@
+import logging
+import threading
+import time
+import anyio
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Property
+from .dedup import not_duplicate
+from .inventory import inventory
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+SORTS = ("newest", "price_asc", "price_desc", "bedrooms", "area")
+
+# _BYTE_BITS[v, k] is bit k of byte value v, to turn byte histograms into bit counts
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder="little").astype(np.int64)
+
+_COLUMNS = (Property.id, Property.price, Property.bedrooms, Property.bathrooms, Property.area_sqft,
+            Property.location, Property.property_type, Property.amenities)
+
+
+class _Dictionary:
+    """Dictionary encoding of a text column; values compare case-insensitively"""
+
+    def __init__(self):
+        self.codes = {}  # lowercased value -> code
+        self.labels = []  # code -> value as first seen
+
+    def encode(self, value) -> int:
+        label = str(value or "").strip()
+        if not label:
+            return -1
+        key = label.lower()
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def lookup(self, predicate) -> np.ndarray:
+        """Table indexed by ``code + 1``: True where the lowercased value satisfies ``predicate``"""
+        table = np.zeros(len(self.labels) + 1, dtype=bool)
+        for key, code in list(self.codes.items()):
+            table[code + 1] = predicate(key)
+        return table
+
+
+class _Snapshot:
+    """Immutable view of the first ``size`` rows of the column buffers"""
+
+    __slots__ = ("size", "version", "id", "price", "bedrooms", "bathrooms", "area_sqft", "location", "property_type", "amenities")
+
+    def __init__(self, size, version, columns):
+        self.size = size
+        self.version = version
+        for name, values in columns.items():
+            setattr(self, name, values[..., :size])
+
+
+class PropertyIndex:
+    """In-memory columnar copy of the filterable property columns.
+
+    Holds price, bedrooms, bathrooms and area as NumPy arrays, location and
+    type as dictionary codes and amenities as a bitmask (64 amenities per
+    uint64 word), so filters, sorts and facet counts are vectorised masks
+    instead of ORM round trips. New rows are appended in place as inventory
+    writes arrive (buffers grow by doubling); readers work on a snapshot
+    whose ``version`` is the inventory version it reflects. A full reload
+    picks up writes made by other worker processes after ``max_age_seconds``.
+    """
+
+    def __init__(self, max_age_seconds: float = 300):
+        self.max_age_seconds = max_age_seconds
+        self.locations = _Dictionary()
+        self.property_types = _Dictionary()
+        self.amenity_names = _Dictionary()
+        self.loaded_at = None
+        self._columns = self._allocate(0, 1)
+        self._positions = {}  # property id -> row
+        self._snapshot = _Snapshot(0, 0, self._columns)
+        self._pending = None  # writes seen while a reload is running
+        self._lock = threading.Lock()
+        self._reload_done = threading.Event()  # set when the reload in flight ends, loaded or not
+
+    @staticmethod
+    def _allocate(capacity, words):
+        return {
+            "id": np.zeros(capacity, dtype=np.int64),
+            "price": np.full(capacity, np.nan),
+            "bedrooms": np.full(capacity, -1, dtype=np.int16),
+            "bathrooms": np.full(capacity, -1, dtype=np.int16),
+            "area_sqft": np.full(capacity, np.nan),
+            "location": np.full(capacity, -1, dtype=np.int32),
+            "property_type": np.full(capacity, -1, dtype=np.int32),
+            # One contiguous row of bits per 64 amenities
+            "amenities": np.zeros((words, capacity), dtype=np.uint64),
+        }
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def is_stale(self) -> bool:
+        return (
+            not self.loaded
+            or self._snapshot.version != inventory.version
+            or time.monotonic() - self.loaded_at > self.max_age_seconds
+        )
+
+    def _reserve(self, rows, words):
+        current_words, capacity = self._columns["amenities"].shape
+        if rows <= capacity and words <= current_words:
+            return
+        grown = self._allocate(max(rows, capacity * 2, 64), max(words, current_words))
+        size = len(self._positions)
+        for name, values in self._columns.items():
+            if name == "amenities":
+                grown[name][:current_words, :size] = values[:, :size]
+            else:
+                grown[name][:size] = values[:size]
+        self._columns = grown
+
+    def _write_rows(self, rows):
+        """Insert or overwrite rows; caller holds the lock"""
+        size = len(self._positions)
+        encoded = []
+        for row in rows:
+            codes = [self.amenity_names.encode(a) for a in (row.amenities or [])]
+            encoded.append((row, [c for c in codes if c >= 0]))
+        words = max(1, -(-len(self.amenity_names.labels) // 64))
+        new_rows = sum(1 for row, _ in encoded if row.id not in self._positions)
+        self._reserve(size + new_rows, words)
+
+        c = self._columns
+        for row, codes in encoded:
+            pos = self._positions.get(row.id)
+            if pos is None:
+                pos = self._positions[row.id] = size
+                size += 1
+            c["id"][pos] = row.id
+            c["price"][pos] = np.nan if row.price is None else row.price
+            c["bedrooms"][pos] = -1 if row.bedrooms is None else row.bedrooms
+            c["bathrooms"][pos] = -1 if row.bathrooms is None else row.bathrooms
+            c["area_sqft"][pos] = np.nan if row.area_sqft is None else row.area_sqft
+            c["location"][pos] = self.locations.encode(row.location)
+            c["property_type"][pos] = self.property_types.encode(row.property_type)
+            c["amenities"][:, pos] = 0
+            for code in codes:
+                c["amenities"][code // 64, pos] |= np.uint64(1 << (code % 64))
+        return size
+
+    def add_properties(self, properties):
+        """Apply written rows incrementally; subscribed to inventory writes"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(properties)
+            size = self._write_rows(properties)
+            self._snapshot = _Snapshot(size, inventory.version, self._columns)
+
+    def _replace(self, rows):
+        fresh = PropertyIndex(self.max_age_seconds)
+        fresh._write_rows(rows)
+        with self._lock:
+            # Rows written while the SELECT ran may be missing from its result
+            size = fresh._write_rows(self._pending or [])
+            self._pending = None
+            self.locations, self.property_types, self.amenity_names = fresh.locations, fresh.property_types, fresh.amenity_names
+            self._columns, self._positions = fresh._columns, fresh._positions
+            # With the pending writes applied the index is current as of now
+            self._snapshot = _Snapshot(size, inventory.version, self._columns)
+            self.loaded_at = time.monotonic()
+
+    def load(self, db: Session):
+        """Rebuild the index from the properties table"""
+        with self._lock:
+            self._pending = []
+        self._replace(db.execute(select(*_COLUMNS).where(not_duplicate())).all())
+
+    async def ensure_fresh(self):
+        """The current snapshot; a stale index reloads on a worker thread meanwhile.
+
+        Requests keep reading the snapshot they have while the reload runs.
+        Only before the first load completes do callers wait, off the event
+        loop, for the one reload in flight.
+        """
+        if self.is_stale():
+            self.load_in_background()
+        if not self.loaded:
+            await anyio.to_thread.run_sync(self._reload_done.wait)
+        return self._snapshot
+
+    def load_in_background(self):
+        """Reload on a daemon thread unless a reload is already running"""
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+            self._reload_done = threading.Event()
+        threading.Thread(target=self._background_load, args=(self._reload_done,), name="property-index-load", daemon=True).start()
+
+    def _background_load(self, done):
+        from app.database import SessionLocal
+
+        try:
+            with SessionLocal() as db:
+                self._replace(db.execute(select(*_COLUMNS).where(not_duplicate())).all())
+        except Exception as e:
+            with self._lock:
+                self._pending = None
+            ERRORS.inc(component="property_index")
+            logger.exception(f"Error loading the property index: {e}")
+        finally:
+            done.set()
+
+    def _masks(self, snap, location=None, property_type=None, min_price=None, max_price=None,
+               bedrooms=None, amenities=None, amenities_match="all"):
+        """One boolean mask per active filter, keyed by facet name"""
+        masks = {}
+        if location:
+            needle = location.strip().lower()
+            # Substring match, as in GET /properties, evaluated once per distinct location
+            table = self.locations.lookup(lambda key: needle in key)
+            masks["location"] = table[snap.location + 1]
+        if property_type:
+            masks["property_type"] = snap.property_type == self.property_types.codes.get(property_type.strip().lower(), -2)
+        if min_price is not None or max_price is not None:
+            price = np.ones(snap.size, dtype=bool)
+            if min_price is not None:
+                price &= snap.price >= min_price
+            if max_price is not None:
+                price &= snap.price <= max_price
+            masks["price"] = price
+        if bedrooms:
+            masks["bedrooms"] = snap.bedrooms >= bedrooms
+        if amenities:
+            codes = [self.amenity_names.codes.get(str(a).strip().lower()) for a in amenities]
+            known = [code for code in codes if code is not None and code // 64 < len(snap.amenities)]
+            wanted = {}
+            for code in known:
+                wanted[code // 64] = wanted.get(code // 64, 0) | (1 << (code % 64))
+            if amenities_match == "any":
+                mask = np.zeros(snap.size, dtype=bool)
+                for word, bits in wanted.items():
+                    mask |= (snap.amenities[word] & np.uint64(bits)) != 0
+            elif len(known) < len(codes):
+                # An amenity no property has: nothing can have all of them
+                mask = np.zeros(snap.size, dtype=bool)
+            else:
+                mask = np.ones(snap.size, dtype=bool)
+                for word, bits in wanted.items():
+                    bits = np.uint64(bits)
+                    mask &= (snap.amenities[word] & bits) == bits
+            masks["amenities"] = mask
+        return masks
+
+    @staticmethod
+    def _combine(snap, masks, exclude=None):
+        mask = np.ones(snap.size, dtype=bool)
+        for name, m in masks.items():
+            if name != exclude:
+                mask &= m
+        return mask
+
+    def search(self, sort: str = "newest", limit: int = 20, **filters):
+        """Ids of matching properties in ``sort`` order, at most ``limit`` (``None``: all)"""
+        snap = self._snapshot
+        rows = np.flatnonzero(self._combine(snap, self._masks(snap, **filters)))
+        if sort == "newest":
+            keys = -snap.id[rows]
+        elif sort == "price_asc":
+            keys = snap.price[rows]
+        elif sort == "price_desc":
+            keys = -snap.price[rows]
+        elif sort == "bedrooms":
+            keys = -snap.bedrooms[rows].astype(np.int64)
+        elif sort == "area":
+            keys = -snap.area_sqft[rows]
+        else:
+            raise ValueError(f"Unknown sort {sort!r}")
+        if limit is not None and limit < len(rows):
+            # Partial sort: only the first ``limit`` keys need ordering
+            top = np.argpartition(keys, limit - 1)[:limit]
+            rows, keys = rows[top], keys[top]
+        order = np.lexsort((snap.id[rows], keys))  # NaN prices sort last
+        return snap.id[rows[order]].tolist()
+
+    def rank(self, limit: int, locations=(), property_types=(), bedrooms=None, amenities=(),
+             budget_min=None, budget_max=None, strict: bool = True):
+        """Ids ordered like the chat retrieval query, at most ``limit``.
+
+        Budget always filters; locations (lowercase prefixes), types and the
+        bedroom count also filter with ``strict`` and otherwise only score:
+        4 for the location, 3 for the type, 2 for the exact bedroom count
+        (1 for more) and 1 per requested amenity. Ties go to the cheaper,
+        then the older listing.
+        """
+        snap = self._snapshot
+        mask = np.ones(snap.size, dtype=bool)
+        if budget_min:
+            mask &= snap.price >= budget_min
+        if budget_max:
+            mask &= snap.price <= budget_max
+        score = np.zeros(snap.size, dtype=np.int64)
+        if locations:
+            table = self.locations.lookup(lambda key: any(key.startswith(loc) for loc in locations))
+            matched = table[snap.location + 1]
+            score += 4 * matched
+            if strict:
+                mask &= matched
+        if property_types:
+            table = self.property_types.lookup(lambda key: key in property_types)
+            matched = table[snap.property_type + 1]
+            score += 3 * matched
+            if strict:
+                mask &= matched
+        if bedrooms:
+            score += np.where(snap.bedrooms == bedrooms, 2, np.where(snap.bedrooms > bedrooms, 1, 0))
+            if strict:
+                mask &= snap.bedrooms >= bedrooms
+        for amenity in amenities or ():
+            code = self.amenity_names.codes.get(str(amenity).strip().lower())
+            if code is not None and code // 64 < len(snap.amenities):
+                score += ((snap.amenities[code // 64] >> np.uint64(code % 64)) & np.uint64(1)).astype(np.int64)
+        rows = np.flatnonzero(mask)
+        order = np.lexsort((snap.id[rows], snap.price[rows], -score[rows]))[:limit]
+        return snap.id[rows[order]].tolist()
+
+    @staticmethod
+    def _bit_counts(words):
+        """Rows with bit k set, for k in 0..63 (bit k of word w is amenity 64 * w + k)"""
+        by_byte = np.ascontiguousarray(words).view(np.uint8).reshape(-1, 8)
+        # A 256-bin histogram per byte position is far cheaper than unpacking every bit
+        histograms = np.stack([np.bincount(by_byte[:, b], minlength=256) for b in range(8)])
+        return (histograms @ _BYTE_BITS).ravel()
+
+    def facets(self, **filters) -> dict:
+        """Counts per location, type, bedrooms and amenity within the filters.
+
+        Each facet ignores its own filter (so the other locations still show
+        their counts when one is selected) and applies all the others.
+        """
+        snap = self._snapshot
+        masks = self._masks(snap, **filters)
+
+        def rows_for(facet):
+            return self._combine(snap, masks, exclude=facet)
+
+        def ranked(labels, counts):
+            nonzero = np.flatnonzero(counts)
+            order = nonzero[np.argsort(-counts[nonzero], kind="stable")]
+            return [{"value": labels[i], "count": int(counts[i])} for i in order]
+
+        def coded(dictionary, codes):
+            return ranked(dictionary.labels, np.bincount(codes[codes >= 0], minlength=len(dictionary.labels)))
+
+        bedrooms = snap.bedrooms[rows_for("bedrooms")]
+        values, counts = np.unique(bedrooms[bedrooms >= 0], return_counts=True)
+        amenity_counts = np.concatenate([self._bit_counts(word) for word in snap.amenities[:, rows_for("amenities")]])
+        prices = snap.price[rows_for("price")]
+        prices = prices[~np.isnan(prices)]
+        return {
+            "total": int(self._combine(snap, masks).sum()),
+            "version": snap.version,
+            "location": coded(self.locations, snap.location[rows_for("location")]),
+            "property_type": coded(self.property_types, snap.property_type[rows_for("property_type")]),
+            "bedrooms": [{"value": int(v), "count": int(n)} for v, n in zip(values, counts)],
+            "amenities": ranked(self.amenity_names.labels, amenity_counts[:len(self.amenity_names.labels)]),
+            "price": {"min": float(prices.min()), "max": float(prices.max())} if len(prices) else None,
+        }
+
+
+property_index = PropertyIndex(max_age_seconds=settings.PROPERTY_INDEX_MAX_AGE_SECONDS)
+inventory.subscribe(property_index.add_properties)
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import datetime
+import json
+import re
+from sqlalchemy import select, func, and_, or_, literal_column, column, table, text, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Property
+from .amenities import amenity_filter, normalise_amenities
+from .dedup import not_duplicate
+
+SORTS = ("relevance", "newest", "price_asc", "price_desc")
+MAX_PAGE_SIZE = 100
+
+# Searchable document; the PostgreSQL indexes are built over these exact expressions
+SEARCH_DOCUMENT_SQL = "(coalesce(title, '') || ' ' || coalesce(location, '') || ' ' || coalesce(description, ''))"
+SEARCH_VECTOR_SQL = f"to_tsvector('simple', {SEARCH_DOCUMENT_SQL})"
+
+POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_properties_search_tsv ON properties USING gin ({SEARCH_VECTOR_SQL})",
+    f"CREATE INDEX IF NOT EXISTS ix_properties_search_trgm ON properties USING gin ({SEARCH_DOCUMENT_SQL} gin_trgm_ops)",
+)
+
+# External-content FTS5 table kept in sync with properties by triggers
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5("
+    "title, location, description, content='properties', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_ai AFTER INSERT ON properties BEGIN "
+    "INSERT INTO properties_fts(rowid, title, location, description) VALUES (new.id, new.title, new.location, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_ad AFTER DELETE ON properties BEGIN "
+    "INSERT INTO properties_fts(properties_fts, rowid, title, location, description) "
+    "VALUES ('delete', old.id, old.title, old.location, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS properties_fts_au AFTER UPDATE ON properties BEGIN "
+    "INSERT INTO properties_fts(properties_fts, rowid, title, location, description) "
+    "VALUES ('delete', old.id, old.title, old.location, old.description); "
+    "INSERT INTO properties_fts(rowid, title, location, description) VALUES (new.id, new.title, new.location, new.description); END",
+    "INSERT INTO properties_fts(properties_fts) VALUES ('rebuild')",
+)
+
+_fts = table("properties_fts", column("rowid"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, value, last_id: int) -> str:
+    if isinstance(value, datetime.datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps({"s": sort, "v": value, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        value, last_id = data["v"], int(data["id"])
+        if isinstance(value, dict):
+            value = datetime.datetime.fromisoformat(value["dt"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if data.get("s") != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    return value, last_id
+
+
+def escape_like(text: str) -> str:
+    """Escape LIKE wildcards so user text only matches itself"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts5_query(q: str) -> str:
+    # Prefix match on every term, any term may match; bm25 ranks rows matching more terms first
+    return " OR ".join(f'"{term}"*' for term in re.findall(r"\w+", q))
+
+
+def _relevance(dialect: str, q: str):
+    """(match condition, score expression, join target) for a text query"""
+    if dialect == "sqlite":
+        return (
+            literal_column("properties_fts").op("MATCH")(bindparam("fts_query", _fts5_query(q))),
+            -func.bm25(literal_column("properties_fts")),
+            _fts,
+        )
+    search_q = bindparam("search_q", q)
+    tsquery = func.websearch_to_tsquery("simple", search_q)
+    vector = literal_column(SEARCH_VECTOR_SQL)
+    document = literal_column(SEARCH_DOCUMENT_SQL)
+    # @@ is served by the tsvector index; <% (word similarity, catches typos) by the trigram index
+    match = or_(vector.op("@@")(tsquery), search_q.op("<%")(document))
+    score = func.ts_rank_cd(vector, tsquery) + func.word_similarity(search_q, document)
+    return match, score, None
+
+
+def build_search_query(dialect: str, q: str = None, location: str = None, property_type: str = None,
+                       min_price: float = None, max_price: float = None, bedrooms: int = None,
+                       amenities=None, amenities_match: str = "all", sort: str = "relevance", cursor: str = None, limit: int = 20):
+    """Filtered, ranked SELECT over properties with keyset pagination.
+
+    Rows come back as ``(Property, sort_value)``; ``limit + 1`` rows are
+    selected so the caller can tell whether another page exists.
+    """
+    q = (q or "").strip()
+    if sort == "relevance" and not (q and re.search(r"\w", q)):
+        sort = "newest"
+
+    if sort == "relevance":
+        match, key, join = _relevance(dialect, q)
+        stmt = select(Property, key.label("sort_value"))
+        if join is not None:
+            stmt = stmt.join(join, join.c.rowid == Property.id)
+        stmt = stmt.where(match)
+        descending = True
+    else:
+        key = {"newest": Property.created_at, "price_asc": Property.price, "price_desc": Property.price}[sort]
+        if sort == "newest" and dialect == "sqlite":
+            # SQLite keeps timestamps as text, with or without fractional seconds
+            # depending on who wrote them; compare a normalised form instead
+            key = func.strftime("%Y-%m-%d %H:%M:%f", Property.created_at)
+        stmt = select(Property, key.label("sort_value"))
+        descending = sort in ("newest", "price_desc")
+
+    # Listings flagged as near-duplicates at ingest stay out of search results
+    stmt = stmt.where(not_duplicate())
+    if location:
+        # Prefix match on lower(location) is served by ix_properties_location_lower
+        stmt = stmt.where(func.lower(Property.location).like(f"{escape_like(location.strip().lower())}%", escape="\\"))
+    if property_type:
+        stmt = stmt.where(func.lower(Property.property_type) == property_type.strip().lower())
+    if min_price is not None:
+        stmt = stmt.where(Property.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Property.price <= max_price)
+    if bedrooms:
+        stmt = stmt.where(Property.bedrooms >= bedrooms)
+    if normalise_amenities(amenities):
+        stmt = stmt.where(amenity_filter(amenities, amenities_match))
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        if descending:
+            stmt = stmt.where(or_(key < value, and_(key == value, Property.id > last_id)))
+        else:
+            stmt = stmt.where(or_(key > value, and_(key == value, Property.id > last_id)))
+
+    order = key.desc() if descending else key.asc()
+    return stmt.order_by(order, Property.id.asc()).limit(limit + 1), sort
+
+
+async def search_properties(db: AsyncSession, limit: int = 20, **filters):
+    """Return ``(properties, next_cursor)`` for one page of search results"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt, sort = build_search_query(db.bind.dialect.name, limit=limit, **filters)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, value = rows[-1]
+        next_cursor = encode_cursor(sort, value, last.id)
+    return [prop for prop, _value in rows], next_cursor
+
+
+def create_search_indexes(conn):
+    """Create the full-text/trigram indexes (PostgreSQL) or the FTS5 table (SQLite)"""
+    if conn.dialect.name == "sqlite":
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'properties_fts'")).first()
+        statements = SQLITE_SEARCH_DDL if not exists else SQLITE_SEARCH_DDL[1:-1]
+    elif conn.dialect.name == "postgresql":
+        statements = POSTGRES_SEARCH_DDL
+    else:
+        return
+    for statement in statements:
+        conn.execute(text(statement))
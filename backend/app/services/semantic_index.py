@@ -0,0 +1,273 @@
+"""Offline semantic search over property listings.
+
+Listings are embedded with a signed feature-hashing vectoriser (no model
+download, no network) and kept as one contiguous float32 matrix that is
+memory-mapped from disk, so worker processes share its pages. Build or
+refresh the file ahead of time with:
+
+    python -m app.services.semantic_index
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Property, PropertyDuplicate
+from .dedup import not_duplicate
+from .inventory import inventory
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix-vector product; bounds the pages touched per step
+SCORE_CHUNK_ROWS = 65536
+
+_COLUMNS = (Property.id, Property.title, Property.description, Property.amenities)
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it me my near of on or our the this to we with want "
+    "looking need please some".split()
+)
+
+
+class HashingVectorizer:
+    """Sublinear-tf word unigram and bigram features hashed into ``dim`` signed buckets"""
+
+    # Title and amenity words say more about a listing than its description
+    FIELD_WEIGHTS = {"title": 2.0, "amenities": 1.5, "description": 1.0}
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @staticmethod
+    def tokens(text):
+        words = []
+        for word in _WORD.findall((text or "").casefold()):
+            if word in _STOPWORDS or len(word) < 2:
+                continue
+            # Cheap plural folding so "villas" meets "villa"
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            words.append(word)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _accumulate(self, counts, text, weight):
+        for token in self.tokens(text):
+            h = zlib.crc32(token.encode())
+            bucket = h % self.dim
+            counts[bucket] = counts.get(bucket, 0.0) + (weight if h & 0x80000000 else -weight)
+
+    def _finish(self, counts):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, value in counts.items():
+            vector[bucket] = np.sign(value) * np.log1p(abs(value))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def transform_property(self, prop):
+        counts = {}
+        self._accumulate(counts, prop.title, self.FIELD_WEIGHTS["title"])
+        self._accumulate(counts, " ".join(str(a) for a in prop.amenities or []), self.FIELD_WEIGHTS["amenities"])
+        self._accumulate(counts, prop.description, self.FIELD_WEIGHTS["description"])
+        return self._finish(counts)
+
+    def transform_query(self, text):
+        counts = {}
+        self._accumulate(counts, text, 1.0)
+        return self._finish(counts)
+
+
+class SemanticIndex:
+    """Memory-mapped embedding matrix plus an in-memory tail of recent writes.
+
+    ``path`` holds the float32 matrix and ``<path>.ids.npy`` the matching
+    property ids. Rows written since the file was saved live in a small
+    in-memory delta that is searched alongside it; once ``flush_rows`` have
+    accumulated, base and delta are written to a new file and swapped in
+    with ``os.replace``. Searches remap a file replaced by another worker;
+    ``ensure_fresh`` embeds any property the index has not seen on a
+    background thread, at most every ``max_age_seconds``, so requests never
+    wait for it and search whatever is loaded meanwhile.
+    """
+
+    def __init__(self, path: str, dim: int = 512, max_age_seconds: float = 300, flush_rows: int = 1000):
+        self.path = path
+        self.ids_path = path[:-len(".npy")] + ".ids.npy" if path.endswith(".npy") else path + ".ids.npy"
+        self.vectorizer = HashingVectorizer(dim)
+        self.max_age_seconds = max_age_seconds
+        self.flush_rows = flush_rows
+        self.checked_at = None
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._base_ids = np.zeros(0, dtype=np.int64)
+        self._file_mtime = None
+        self._delta = []  # (id, vector) written since the file was saved
+        self._known = set()
+        self._df = np.zeros(dim, dtype=np.int64)  # documents per bucket, for query idf
+        self._hidden = np.zeros(0, dtype=np.int64)  # indexed ids since flagged as duplicates
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._base_ids) + len(self._delta)
+
+    def _open(self):
+        """(Re)map the saved matrix if it changed on disk; caller holds the lock"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            base = np.load(self.path, mmap_mode="r")
+            ids = np.load(self.ids_path)
+        except (OSError, ValueError) as e:
+            ERRORS.inc(component="semantic_index")
+            logger.warning(f"Ignoring unreadable semantic index {self.path}: {e}")
+            return
+        if base.ndim != 2 or base.shape[1] != self.vectorizer.dim or len(ids) != len(base):
+            ERRORS.inc(component="semantic_index")
+            logger.warning(f"Ignoring semantic index {self.path}: shape {base.shape} does not match dim {self.vectorizer.dim}")
+            return
+        self._base, self._base_ids, self._file_mtime = base, ids.astype(np.int64), mtime
+        saved = set(self._base_ids.tolist())
+        self._delta = [(pid, vector) for pid, vector in self._delta if pid not in saved]
+        self._known = saved | {pid for pid, _ in self._delta}
+        self._df = np.count_nonzero(self._base, axis=0).astype(np.int64)
+        for _, vector in self._delta:
+            self._df += vector != 0
+
+    def _save(self):
+        """Write base + delta as a new file and map it; caller holds the lock"""
+        matrix = np.concatenate([self._base, np.array([v for _, v in self._delta], dtype=np.float32).reshape(-1, self.vectorizer.dim)])
+        ids = np.concatenate([self._base_ids, np.array([pid for pid, _ in self._delta], dtype=np.int64)])
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        for target, data in ((self.ids_path, ids), (self.path, matrix)):
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, target)
+        self._base = np.load(self.path, mmap_mode="r")
+        self._base_ids = ids
+        self._file_mtime = os.stat(self.path).st_mtime_ns
+        self._delta = []
+
+    def add_properties(self, properties):
+        """Embed written rows; subscribed to inventory writes"""
+        vectors = [(prop.id, self.vectorizer.transform_property(prop)) for prop in properties]
+        with self._lock:
+            for pid, vector in vectors:
+                if pid in self._known:
+                    continue
+                self._known.add(pid)
+                self._delta.append((pid, vector))
+                self._df += vector != 0
+            if len(self._delta) >= self.flush_rows:
+                try:
+                    self._save()
+                except OSError as e:
+                    ERRORS.inc(component="semantic_index")
+                    logger.error(f"Error saving semantic index: {e}")
+
+    def _missing(self, ids):
+        with self._lock:
+            self._open()
+            return [pid for pid in ids if pid not in self._known]
+
+    def refresh(self, db: Session):
+        """Embed every property not yet in the index and hide the ones flagged as duplicates"""
+        hidden = np.array(db.execute(select(PropertyDuplicate.property_id)).scalars().all(), dtype=np.int64)
+        with self._lock:
+            self._hidden = hidden
+        missing = self._missing(db.execute(select(Property.id).where(not_duplicate())).scalars().all())
+        for start in range(0, len(missing), 1000):
+            self.add_properties(db.execute(select(*_COLUMNS).where(Property.id.in_(missing[start:start + 1000]))).all())
+        self.checked_at = time.monotonic()
+
+    def refresh_in_background(self):
+        """Run ``refresh`` on a daemon thread unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="semantic-index-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        from app.database import SessionLocal
+
+        try:
+            with SessionLocal() as db:
+                self.refresh(db)
+        except Exception as e:
+            ERRORS.inc(component="semantic_index")
+            logger.exception(f"Error refreshing the semantic index: {e}")
+        finally:
+            self._refreshing = False
+
+    def ensure_fresh(self):
+        """Start a background refresh when one is due; never waits for it"""
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.max_age_seconds:
+            self.refresh_in_background()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def search(self, query: str, limit: int = 10):
+        """``[(property_id, score)]`` by descending cosine similarity to the query"""
+        vector = self.vectorizer.transform_query(query)
+        if not vector.any():
+            return []
+        with self._lock:
+            self._open()
+            base, base_ids = self._base, self._base_ids
+            delta_ids = np.array([pid for pid, _ in self._delta], dtype=np.int64)
+            delta = np.array([v for _, v in self._delta], dtype=np.float32).reshape(-1, self.vectorizer.dim)
+            documents = len(base_ids) + len(delta_ids)
+            # Rare buckets count for more: weight the query by smoothed idf
+            idf = np.log((1 + documents) / (1 + self._df)) + 1
+            hidden = self._hidden
+        weighted = (vector * idf).astype(np.float32)
+        weighted /= np.linalg.norm(weighted) or 1
+
+        scores = np.empty(len(base_ids) + len(delta_ids), dtype=np.float32)
+        for start in range(0, len(base_ids), SCORE_CHUNK_ROWS):
+            stop = min(start + SCORE_CHUNK_ROWS, len(base_ids))
+            scores[start:stop] = base[start:stop] @ weighted
+        scores[len(base_ids):] = delta @ weighted
+        ids = np.concatenate([base_ids, delta_ids])
+        if len(hidden):
+            scores[np.isin(ids, hidden)] = 0
+
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+semantic_index = SemanticIndex(
+    settings.SEMANTIC_INDEX_PATH,
+    dim=settings.SEMANTIC_INDEX_DIM,
+    max_age_seconds=settings.SEMANTIC_INDEX_MAX_AGE_SECONDS,
+    flush_rows=settings.SEMANTIC_INDEX_FLUSH_ROWS
+)
+inventory.subscribe(semantic_index.add_properties)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        semantic_index.refresh(db)
+    semantic_index.save()
+    print(f"Semantic index: {len(semantic_index)} properties in {time.perf_counter() - started:.1f} s -> {semantic_index.path}")
@@ -0,0 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class SessionLocks:
+    """Async locks keyed by session id, created on demand.
+
+    Turns for one session run one at a time and in arrival order (asyncio
+    locks are FIFO), so memory updates are applied in the order messages
+    were sent; different sessions never wait on each other. A lock is
+    dropped as soon as nobody holds or waits on it.
+    """
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [lock, holders and waiters]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(session_id) is entry:
+                del self._locks[session_id]
+
+    def __len__(self):
+        return len(self._locks)
@@ -0,0 +1,225 @@
+import threading
+import anyio
+import numpy as np
+from app.config import settings
+from .property_index import property_index
+
+# Distance = mean squared z-score gap over the numeric features
+#          + LOCATION_PENALTY if locations differ + TYPE_PENALTY if types differ
+#          + AMENITY_WEIGHT * (1 - Jaccard overlap of amenities)
+LOCATION_PENALTY = 1.0
+TYPE_PENALTY = 0.5
+AMENITY_WEIGHT = 1.0
+
+# Upper bound on the pairwise distance block computed at once (float32 cells)
+BLOCK_CELLS = 8_000_000
+
+_POPCOUNT = np.array([bin(v).count("1") for v in range(256)], dtype=np.uint8)
+
+
+def _popcount(words):
+    """Set bits per element of a uint64 array, summed over the leading (word) axis"""
+    counts = _POPCOUNT[np.ascontiguousarray(words).view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.int32).sum(axis=0)
+
+
+class SimilarProperties:
+    """Precomputed k-nearest-neighbour table over the columnar property index.
+
+    Rows line up with the property index rows. The full build compares
+    listings of the same type in blocks of at most ``BLOCK_CELLS`` pairs:
+    numeric and location distance for the whole block, with a matrix product,
+    and the amenity overlap only for the best ``candidates`` of each row.
+    A property added later is compared once against every row. It enters
+    only the neighbour lists it beats, so only those neighbourhoods change.
+    Adding listings keeps the same comparison blocks; when a type crosses
+    the ``k`` listings that decide its block the table is rebuilt instead.
+    Reads are a row lookup: O(k).
+    """
+
+    def __init__(self, k: int = 10, candidates: int = None):
+        self.k = k
+        self.candidates = candidates or max(4 * k, 32)
+        self.size = 0
+        self._source = None  # property index load this table was built from
+        self._positions = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._neighbours = np.zeros((0, k), dtype=np.int64)  # row numbers, -1 = none
+        self._distances = np.zeros((0, k), dtype=np.float32)
+        self._stats = None  # (mean, std) of the raw numeric features
+        self._feature_matrix = np.zeros((0, 5), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _raw_features(snap, rows):
+        price = snap.price[rows]
+        area = snap.area_sqft[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_sqft = np.where(area > 0, price / area, np.nan)
+        bedrooms = np.where(snap.bedrooms[rows] >= 0, snap.bedrooms[rows], np.nan)
+        bathrooms = np.where(snap.bathrooms[rows] >= 0, snap.bathrooms[rows], np.nan)
+        # Prices and areas are compared on a log scale: 1M vs 2M is like 5M vs 10M
+        return np.column_stack([np.log1p(price), np.log1p(per_sqft), bedrooms, bathrooms, np.log1p(area)])
+
+    def _features(self, snap, rows):
+        mean, std = self._stats
+        z = (self._raw_features(snap, rows) - mean) / std
+        return np.nan_to_num(z, nan=0.0).astype(np.float32)  # unknown = average
+
+    def _distances_to(self, snap, features, rows, others):
+        """Full distance block between ``rows`` and ``others`` (row numbers)"""
+        x, y = features[rows], features[others]
+        # |x - y|^2 = |x|^2 + |y|^2 - 2 x.y, accumulated in place in float32
+        d = x @ y.T
+        d *= -2
+        d += (x * x).sum(1)[:, None]
+        d += (y * y).sum(1)[None, :]
+        np.maximum(d, 0, out=d)
+        d *= np.float32(1 / features.shape[1])
+        d += np.float32(LOCATION_PENALTY) * (snap.location[rows][:, None] != snap.location[others][None, :])
+        types = snap.property_type[rows]
+        if (types != types[0]).any() or (snap.property_type[others] != types[0]).any():
+            d += np.float32(TYPE_PENALTY) * (types[:, None] != snap.property_type[others][None, :])
+        return d
+
+    def _amenity_distance(self, snap, rows, others):
+        """AMENITY_WEIGHT * (1 - Jaccard) for each ``rows[i]`` against ``others[i, j]``"""
+        a = snap.amenities[:, rows][:, :, None]
+        b = snap.amenities[:, others]
+        union = _popcount(a | b)
+        overlap = np.where(union > 0, _popcount(a & b) / np.maximum(union, 1), 0.0)
+        return AMENITY_WEIGHT * (1 - overlap)
+
+    def _nearest(self, snap, features, rows, others):
+        """(neighbour row numbers, distances) of the k nearest ``others`` per row"""
+        d = self._distances_to(snap, features, rows, others)
+        d[rows[:, None] == others[None, :]] = np.inf
+        if d.shape[1] > self.candidates:
+            keep = np.argpartition(d, self.candidates - 1, axis=1)[:, :self.candidates]
+        else:
+            keep = np.broadcast_to(np.arange(d.shape[1]), d.shape)
+        candidates = others[keep]
+        total = np.take_along_axis(d, keep, axis=1) + self._amenity_distance(snap, rows, candidates)
+        order = np.argsort(total, axis=1, kind="stable")[:, :self.k]
+        neighbours = np.take_along_axis(candidates, order, axis=1)
+        distances = np.take_along_axis(total, order, axis=1).astype(np.float32)
+        neighbours[~np.isfinite(distances)] = -1
+        pad = self.k - neighbours.shape[1]
+        if pad > 0:
+            neighbours = np.pad(neighbours, ((0, 0), (0, pad)), constant_values=-1)
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        return neighbours, distances
+
+    def _large_types(self, types) -> set:
+        """Type codes with enough listings to be compared only among themselves"""
+        codes, counts = np.unique(types, return_counts=True)
+        return {int(code) for code, count in zip(codes, counts) if count > self.k}
+
+    def _block(self, types, type_code, large, everyone):
+        # A type with too few listings to fill a neighbour list competes with all of them
+        return np.flatnonzero(types == type_code) if type_code in large else everyone
+
+    def _fill(self, snap, features, rows, others, neighbours, distances):
+        step = max(1, BLOCK_CELLS // max(len(others), 1))
+        for start in range(0, len(rows), step):
+            chunk = rows[start:start + step]
+            neighbours[chunk], distances[chunk] = self._nearest(snap, features, chunk, others)
+
+    def build(self, snap, source=None):
+        """Compute the whole table from a property index snapshot"""
+        n = snap.size
+        raw = self._raw_features(snap, np.arange(n))
+        mean = np.nanmean(raw, axis=0) if n else np.zeros(raw.shape[1])
+        std = np.nanstd(raw, axis=0) if n else np.ones(raw.shape[1])
+        self._stats = (np.nan_to_num(mean), np.where(np.nan_to_num(std) > 0, np.nan_to_num(std), 1.0))
+        features = self._features(snap, np.arange(n))
+
+        neighbours = np.full((n, self.k), -1, dtype=np.int64)
+        distances = np.full((n, self.k), np.inf, dtype=np.float32)
+        everyone = np.arange(n)
+        large = self._large_types(snap.property_type)
+        for type_code in np.unique(snap.property_type):
+            members = np.flatnonzero(snap.property_type == type_code)
+            self._fill(snap, features, members, self._block(snap.property_type, int(type_code), large, everyone),
+                       neighbours, distances)
+
+        self._ids = snap.id.copy()
+        self._positions = {int(pid): i for i, pid in enumerate(self._ids)}
+        self._neighbours, self._distances = neighbours, distances
+        self._feature_matrix = features
+        self.size = n
+        self._source = source
+
+    def add_rows(self, snap, rows):
+        """Give new rows their neighbours and insert them where they beat an existing one"""
+        types = snap.property_type
+        large = self._large_types(types)
+        old = self.size
+        features = np.concatenate([self._feature_matrix, self._features(snap, rows)])
+        neighbours = np.full((snap.size, self.k), -1, dtype=np.int64)
+        distances = np.full((snap.size, self.k), np.inf, dtype=np.float32)
+        neighbours[:old], distances[:old] = self._neighbours, self._distances
+
+        # New rows against their whole block, new rows included, as build() would
+        everyone = np.arange(snap.size)
+        for type_code in np.unique(types[rows]):
+            members = rows[types[rows] == type_code]
+            self._fill(snap, features, members, self._block(types, int(type_code), large, everyone), neighbours, distances)
+
+        # Existing rows only see a new row that falls in their own block
+        existing_types = types[:old]
+        small = ~np.isin(existing_types, list(large))
+        for row in rows:
+            row_arr = np.array([row])
+            existing = np.flatnonzero(small | (existing_types == types[row]))
+            if not len(existing):
+                continue
+            d = self._distances_to(snap, features, row_arr, existing)[0]
+            d += self._amenity_distance(snap, row_arr, existing[None, :])[0]
+            beaten = d < distances[existing, -1]
+            affected, d = existing[beaten], d[beaten]
+            if len(affected):
+                neighbours[affected, -1] = row
+                distances[affected, -1] = d
+                order = np.argsort(distances[affected], axis=1, kind="stable")
+                neighbours[affected] = np.take_along_axis(neighbours[affected], order, axis=1)
+                distances[affected] = np.take_along_axis(distances[affected], order, axis=1)
+
+        for row in rows:
+            self._positions[int(snap.id[row])] = int(row)
+        self._neighbours, self._distances = neighbours, distances
+        self.size = snap.size
+        self._ids = snap.id[:self.size].copy()
+        self._feature_matrix = features
+
+    def _refresh(self, snap, source):
+        with self._lock:
+            missing = snap.size - self.size
+            # Rebuild after an index reload (row numbers and codes change), a large backlog
+            # or a type crossing the size that decides its comparison block
+            if (self._source != source or missing > max(self.k, snap.size // 100)
+                    or self._large_types(snap.property_type[:self.size]) != self._large_types(snap.property_type)):
+                self.build(snap, source)
+            elif missing > 0:
+                self.add_rows(snap, np.arange(self.size, snap.size))
+
+    async def ensure_fresh(self):
+        snap = await property_index.ensure_fresh()
+        if self._source != property_index.loaded_at or self.size != snap.size:
+            # The full build is CPU bound; keep it off the event loop
+            await anyio.to_thread.run_sync(self._refresh, snap, property_index.loaded_at)
+
+    def similar(self, property_id: int, limit: int = None):
+        """``[(property_id, similarity)]`` nearest first; ``None`` for an unknown id"""
+        row = self._positions.get(property_id)
+        if row is None:
+            return None
+        neighbours = self._neighbours[row][:limit or self.k]
+        distances = self._distances[row][:limit or self.k]
+        return [
+            (int(self._ids[n]), float(1 / (1 + d)))
+            for n, d in zip(neighbours, distances) if n >= 0
+        ]
+
+
+similar_properties = SimilarProperties(k=settings.SIMILAR_PROPERTIES_K)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue that persists writes off the request path.
+
+    Producers ``put`` ``(kind, payload)`` items and return immediately; a
+    background task collects up to ``batch_size`` items or whatever arrived
+    within ``flush_interval_ms`` and hands each kind to its handler inside a
+    single transaction. Handlers receive every payload of their kind in the
+    batch, in arrival order, so they can write with one ``executemany``.
+    ``put`` waits while ``max_pending`` items are queued, which pushes back
+    on producers instead of growing without bound.
+    """
+
+    def __init__(self, session_factory, handlers, batch_size: int = 100, flush_interval_ms: float = 50,
+                 max_pending: int = 10000, max_attempts: int = 3):
+        self.session_factory = session_factory
+        # Handlers run in this order within a flush: kind -> async fn(db, payloads)
+        self.handlers = dict(handlers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._stats = {"enqueued": 0, "flushed": 0, "batches": 0, "failed_batches": 0, "isolated": 0, "dropped": 0, "backpressure_waits": 0}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._loop is not loop:
+                # Queues are bound to the loop that created them
+                self._queue = asyncio.Queue(maxsize=self.max_pending)
+                self._loop = loop
+            self._task = loop.create_task(self._run(), name="write-behind-flusher")
+
+    async def put(self, kind: str, payload: dict):
+        if kind not in self.handlers:
+            raise ValueError(f"No write-behind handler for {kind!r}")
+        self._ensure_started()
+        if self._queue.full():
+            self._stats["backpressure_waits"] += 1
+        await self._queue.put((kind, payload))
+        self._stats["enqueued"] += 1
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch):
+        by_kind = {kind: [] for kind in self.handlers}
+        for kind, payload in batch:
+            by_kind[kind].append(payload)
+        async with self.session_factory() as db:
+            for kind, handler in self.handlers.items():
+                if by_kind[kind]:
+                    await handler(db, by_kind[kind])
+            await db.commit()
+
+    async def _flush(self, batch):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self._write(batch)
+                self._stats["batches"] += 1
+                self._stats["flushed"] += len(batch)
+                return
+            except Exception as e:
+                self._stats["failed_batches"] += 1
+                ERRORS.inc(component="write_behind")
+                logger.error(f"Error flushing write-behind batch (attempt {attempt}/{self.max_attempts}): {e}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+        if len(batch) > 1:
+            await self._isolate(batch)
+        else:
+            self._stats["dropped"] += 1
+
+    async def _isolate(self, batch):
+        """Write a batch that keeps failing one item per transaction.
+
+        A single bad row (a constraint violation, an unencodable value) would
+        otherwise take every other write of the batch down with it; this way
+        only the items that fail on their own are dropped.
+        """
+        for item in batch:
+            try:
+                await self._write([item])
+                self._stats["isolated"] += 1
+                self._stats["flushed"] += 1
+            except Exception as e:
+                self._stats["dropped"] += 1
+                ERRORS.inc(component="write_behind")
+                logger.error(f"Dropping write-behind {item[0]} write: {e}")
+
+    async def flush(self, timeout: float = None):
+        """Wait until everything queued so far has been written"""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        await asyncio.wait_for(self._queue.join(), timeout)
+
+    async def stop(self, timeout: float = 10):
+        """Drain pending writes and stop the flusher (application shutdown)"""
+        started = time.monotonic()
+        try:
+            await self.flush(timeout)
+        except asyncio.TimeoutError:
+            ERRORS.inc(component="write_behind")
+            logger.error(f"Write-behind drain timed out with {self.pending} writes pending")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"Write-behind queue drained in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": self.pending, "max_pending": self.max_pending}
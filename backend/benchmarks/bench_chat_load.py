@@ -0,0 +1,338 @@
+"""Load test of the chat path with a fake model and SQLite.
+
+Simulated users run chat sessions against ``app.main:app`` in-process:
+each session lists properties once, then sends ``--turns`` chat messages
+(greetings, plain searches, open-ended and off-topic questions), refreshing
+the sidebar after every turn. Gemini is replaced by the local fake model
+(``FAKE_LLM``) with the given latency and token rate, and the database is a
+throwaway SQLite file unless ``--database-url`` says otherwise.
+
+Reports requests per second, p50/p95/p99 latency per endpoint, event loop
+lag and database queries per request, and writes them as JSON so two
+commits can be compared:
+
+    python benchmarks/bench_chat_load.py [--users 20] [--sessions 2] [--turns 5] [--output results.json]
+    python benchmarks/bench_chat_load.py --compare baseline.json
+"""
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+MESSAGES = [
+    "hello",
+    "{bedrooms} bedroom apartment in {location} under {budget}",
+    "villa in {location} with a pool",
+    "What are the service charges like for apartments in {location}?",
+    "Why are prices in {location} rising and is it a good time to buy?",
+    "Tell me about Emaar",
+    "Can you recommend a good restaurant for dinner tonight?",
+    "Compare {location} and Business Bay for renting out a {bedrooms} bedroom flat",
+]
+LOCATIONS = ["Dubai Marina", "Downtown", "Palm Jumeirah", "Business Bay", "Jumeirah", "Deira"]
+PROPERTY_TYPES = ["apartment", "villa", "studio", "penthouse", "townhouse"]
+AMENITIES = ["pool", "gym", "parking", "security", "beach", "garden"]
+
+# Label of the request the current task is making, for query attribution
+_request = contextvars.ContextVar("bench_request", default=None)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary_ms(values):
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+        "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None,
+    }
+
+
+def configure_environment(args, tmp):
+    """Settings are read at import, so everything is set before ``app`` is imported"""
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["FAKE_LLM"] = "true"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_JITTER_MS"] = str(args.llm_jitter_ms)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.llm_tokens_per_second)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["GEMINI_MODEL_CACHE_PATH"] = os.path.join(tmp, "gemini_model_cache.json")
+    os.environ["MEMORY_STORE_PATH"] = os.path.join(tmp, "session_memory.db")
+    os.environ["SEMANTIC_INDEX_PATH"] = os.path.join(tmp, "semantic_index.npy")
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+
+
+def seed_properties(count, rng):
+    from app.services.property_import import import_properties
+    lines = []
+    for i in range(count):
+        location = rng.choice(LOCATIONS)
+        property_type = rng.choice(PROPERTY_TYPES)
+        bedrooms = 0 if property_type == "studio" else rng.randint(1, 5)
+        lines.append(json.dumps({
+            "title": f"{property_type.title()} {i} in {location}",
+            "description": f"Bright {bedrooms} bedroom {property_type} close to {location} amenities, listing {i}",
+            "price": rng.randrange(400_000, 12_000_000, 10_000),
+            "location": location,
+            "property_type": property_type,
+            "bedrooms": bedrooms,
+            "bathrooms": max(1, bedrooms),
+            "area_sqft": rng.randrange(400, 8000, 10),
+            "amenities": rng.sample(AMENITIES, rng.randint(0, 4)),
+        }))
+    return import_properties(io.StringIO("\n".join(lines)), "jsonl")
+
+
+class QueryCounter:
+    """Counts statements per request label through SQLAlchemy cursor events"""
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+        self.by_label = {}
+        self.background = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        label = _request.get()
+        if label is None:
+            # Write-behind flushes, index loads and other work off the request path
+            self.background += 1
+        else:
+            label[1][0] += 1
+
+
+class LoopLagMonitor:
+    """Oversleep of a periodic timer: how long ready callbacks waited for the loop"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.queries = {}
+
+    async def call(self, name, request):
+        counter = [0]
+        token = _request.set((name, counter))
+        started = time.perf_counter()
+        try:
+            response = await request
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        finally:
+            _request.reset(token)
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        self.queries.setdefault(name, []).append(counter[0])
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def chat_message(rng):
+    return rng.choice(MESSAGES).format(
+        bedrooms=rng.randint(1, 4),
+        location=rng.choice(LOCATIONS),
+        budget=f"{rng.randint(1, 9)}M",
+    )
+
+
+async def simulate_user(client, recorder, user_id, args, rng):
+    for session in range(args.sessions):
+        session_id = f"bench-{user_id}-{session}-{rng.getrandbits(32):08x}"
+        await recorder.call("properties", client.get(
+            "/api/v1/properties", params={"location": rng.choice(LOCATIONS), "max_price": 5_000_000}
+        ))
+        for _ in range(args.turns):
+            await recorder.call("chat", client.post(
+                "/api/v1/chat", params={"user_id": user_id},
+                json={"message": chat_message(rng), "session_id": session_id, "language": "auto"}
+            ))
+            await recorder.call("chat_sessions", client.get("/api/v1/chat-sessions", params={"user_id": user_id}))
+            if args.think_ms:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+
+async def run(args):
+    import httpx
+    from app.main import app
+    from app.database import engine, async_engine
+
+    queries = QueryCounter([engine, async_engine.sync_engine])
+    recorder = Recorder()
+    monitor = LoopLagMonitor()
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # One warm-up turn builds the agent service, vocabularies and indexes outside the measurement
+        await client.post("/api/v1/chat", json={"message": "hello", "session_id": "bench-warmup"})
+        background_before = queries.background
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            simulate_user(client, recorder, user_id, args, random.Random(args.seed * 1000 + user_id))
+            for user_id in range(1, args.users + 1)
+        ])
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+    await app.router.shutdown()
+    await async_engine.dispose()
+
+    total = sum(len(v) for v in recorder.latencies.values())
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "rps": round(len(values) / elapsed, 2),
+            **summary_ms(values),
+            "db_queries_per_request": round(statistics.fmean(recorder.queries[name]), 2),
+        }
+    every = [v for values in recorder.latencies.values() for v in values]
+    return {
+        "requests": total,
+        "errors": sum(recorder.errors.values()),
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 2),
+        **summary_ms(every),
+        "endpoints": endpoints,
+        "event_loop_lag": {
+            "samples": len(monitor.samples),
+            **summary_ms(monitor.samples),
+        },
+        "db_queries": {
+            "per_request": round(sum(sum(v) for v in recorder.queries.values()) / total, 2) if total else None,
+            "background": queries.background - background_before,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Print the change of the headline numbers against a previous result file"""
+    print(f"\nagainst {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    rows = [("all", current["results"], baseline["results"])]
+    for name, stats in current["results"]["endpoints"].items():
+        if name in baseline["results"].get("endpoints", {}):
+            rows.append((name, stats, baseline["results"]["endpoints"][name]))
+    print(f"{'endpoint':14} {'metric':8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, now, before in rows:
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            a, b = before.get(metric), now.get(metric)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"{name:14} {metric:8} {a:10.2f} {b:10.2f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--sessions", type=int, default=2, help="chat sessions per user")
+    parser.add_argument("--turns", type=int, default=5, help="chat messages per session")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's turns")
+    parser.add_argument("--properties", type=int, default=2000, help="listings seeded into a fresh database")
+    parser.add_argument("--llm-latency-ms", type=int, default=300)
+    parser.add_argument("--llm-jitter-ms", type=int, default=100)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0, help="0: whole answer after the latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON result here (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="chat-load-")
+    configure_environment(args, tmp)
+
+    import logging
+    logging.disable(logging.INFO)
+    from app.migrations import run_migrations
+    run_migrations()
+    seeded = seed_properties(args.properties, random.Random(args.seed)) if args.properties and not args.database_url else None
+
+    results = asyncio.run(run(args))
+    report = {
+        "benchmark": "chat_load",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "seeded_properties": seeded["imported"] if seeded else None,
+        "results": results,
+    }
+
+    print(f"{results['requests']} requests in {results['seconds']:.1f} s: {results['rps']:.1f} req/s, "
+          f"{results['errors']} errors, {results['db_queries']['per_request']} queries/request")
+    print(f"{'endpoint':14} {'requests':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:14} {stats['requests']:8} {stats['rps']:8.1f} {stats['p50_ms']:9.1f} {stats['p95_ms']:9.1f} "
+              f"{stats['p99_ms']:9.1f} {stats['db_queries_per_request']:8.1f}")
+    lag = results["event_loop_lag"]
+    print(f"event loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"chat_load-{report['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
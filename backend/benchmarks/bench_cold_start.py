@@ -0,0 +1,75 @@
+"""Measure worker cold start: import time and time-to-first-request.
+
+Each run starts a fresh interpreter, imports ``app.main`` and serves the
+first requests in-process, so the numbers include every import-time side
+effect. The schema is migrated once up front, as a deploy would.
+
+    python benchmarks/bench_cold_start.py [--runs N] [--database-url URL]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+from app.main import app
+t_import = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    t_startup = time.perf_counter()
+    client.get("/health")
+    t_health = time.perf_counter()
+    client.get("/api/v1/properties")
+    t_db = time.perf_counter()
+    client.get("/api/v1/chat/cache-stats")
+    t_agent = time.perf_counter()
+ms = lambda a, b: round((b - a) * 1000, 1)
+print(json.dumps({
+    "import_ms": ms(t0, t_import),
+    "first_request_ms": ms(t0, t_health),
+    "first_db_request_ms": ms(t0, t_db),
+    "agent_service_ms": ms(t_db, t_agent),
+}))
+"""
+
+
+def run_once(env):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, timeout=120, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="cold-start-")
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark-key")
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    env["GEMINI_MODEL_CACHE_PATH"] = os.path.join(tmp, "gemini_model_cache.json")
+    env["MEMORY_STORE_PATH"] = os.path.join(tmp, "session_memory.db")
+
+    subprocess.run([sys.executable, "-m", "app.migrations"], cwd=BACKEND_DIR, env=env,
+                   check=True, capture_output=True)
+
+    runs = [run_once(env) for _ in range(args.runs)]
+    print(f"{'metric':22} {'median':>9} {'min':>9} {'max':>9}  (ms, {args.runs} runs)")
+    for metric in runs[0]:
+        values = [r[metric] for r in runs]
+        print(f"{metric:22} {statistics.median(values):9.1f} {min(values):9.1f} {max(values):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
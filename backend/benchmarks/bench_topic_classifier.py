@@ -0,0 +1,73 @@
+"""Micro-benchmark for the chat topic classifier.
+
+Compares the compiled single-pass TopicClassifier with the previous
+implementation that rebuilt both keyword lists and ran one substring scan
+per keyword on every call.
+
+    python benchmarks/bench_topic_classifier.py [--iterations N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.topic_classifier import KEYWORDS, PROHIBITED, REAL_ESTATE, TopicClassifier
+
+MESSAGES = [
+    "Show me 2 bedroom apartments in Dubai Marina under 1.5M AED",
+    "hello",
+    "Can you recommend a good restaurant for dinner tonight near the beach?",
+    "What are the service charges for a villa in Arabian Ranches with a private pool and garden?",
+    "I want to know the latest football scores and the weather forecast for the weekend in London",
+    "أريد شقة بغرفتين في دبي مارينا بميزانية مليون درهم",
+    "டுபாயில் இரண்டு படுக்கையறை வீடு வாங்க விரும்புகிறேன்",
+    "Which developers are building off plan projects in Dubai Hills and what are the payment plans?",
+]
+
+
+def legacy_is_real_estate_related(message, languages=("english",)):
+    """The original per-call list rebuild plus one substring scan per keyword"""
+    message_lower = message.lower()
+    real_estate_keywords = [k for lang in languages for k in KEYWORDS[lang][REAL_ESTATE]]
+    prohibited_keywords = [k for lang in languages for k in KEYWORDS[lang][PROHIBITED]]
+    has_real_estate_keywords = any(keyword in message_lower for keyword in real_estate_keywords)
+    has_prohibited_keywords = any(keyword in message_lower for keyword in prohibited_keywords)
+    if has_prohibited_keywords and not has_real_estate_keywords:
+        return False
+    if has_real_estate_keywords:
+        return True
+    return len(message.split()) <= 3
+
+
+def bench(fn, iterations):
+    seconds = timeit.timeit(lambda: [fn(m) for m in MESSAGES], number=iterations)
+    return seconds / (iterations * len(MESSAGES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    build = timeit.timeit(TopicClassifier, number=5) / 5 * 1e3
+    classifier = TopicClassifier()
+
+    legacy_us = bench(legacy_is_real_estate_related, args.iterations)
+    legacy_all_us = bench(lambda m: legacy_is_real_estate_related(m, tuple(KEYWORDS)), args.iterations)
+    compiled_us = bench(classifier.classify, args.iterations)
+
+    print(f"compile (once at startup):      {build:8.2f} ms")
+    print(f"legacy scan, english only:      {legacy_us:8.2f} us/message")
+    print(f"legacy scan, all 3 languages:   {legacy_all_us:8.2f} us/message")
+    print(f"compiled classifier, 3 langs:   {compiled_us:8.2f} us/message (with spans and score)")
+    print(f"speedup at equal vocabulary:    {legacy_all_us / compiled_us:8.2f}x")
+    print()
+    for message in MESSAGES:
+        result = classifier.classify(message)
+        print(f"{str(result.is_related):5} {result.score:4.2f} {[m.keyword for m in result.matches]} <- {message[:60]}")
+
+
+if __name__ == "__main__":
+    main()
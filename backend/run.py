@@ -14,6 +14,10 @@ if __name__ == "__main__":
     print(f"Database URL: {os.getenv('DATABASE_URL')}")
     print(f"Gemini API Key: {'Set' if os.getenv('GEMINI_API_KEY') else 'Not Set'}")
     
+    # Development convenience: apply the schema before serving
+    from app.migrations import run_migrations
+    run_migrations()
+    
     uvicorn.run(
         "app.main:app",
         host=host,
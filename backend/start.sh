@@ -3,5 +3,8 @@
 # Install dependencies
 pip install -r requirements.txt
 
+# Create missing tables before any worker starts
+python -m app.migrations
+
 # Start the FastAPI server
 uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload`
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""Shared test setup: a throwaway SQLite database and the fake model.
+
+Settings are read when ``app.config`` is imported, so the environment is
+set here before any test module imports the app.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_TMP = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["FAKE_LLM"] = "true"
+os.environ["GEMINI_MODEL_CACHE_PATH"] = os.path.join(_TMP, "gemini_model_cache.json")
+os.environ["MEMORY_STORE_PATH"] = os.path.join(_TMP, "session_memory.db")
+os.environ["SEMANTIC_INDEX_PATH"] = os.path.join(_TMP, "semantic_index.npy")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    from app.config import settings
+    from app.migrations import run_migrations
+    run_migrations()
+    return settings.DATABASE_URL
+
+
+@pytest.fixture
+async def session_factory(database_url):
+    """Async sessions on an engine owned by the running test's event loop"""
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy.pool import NullPool
+    from app.database import get_async_database_url
+    from app.models import ChatSession, Conversation, UserPreference
+
+    engine = create_async_engine(get_async_database_url(database_url), poolclass=NullPool)
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    async with factory() as db:
+        for model in (ChatSession, Conversation, UserPreference):
+            await db.execute(delete(model))
+        await db.commit()
+    yield factory
+    await engine.dispose()
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+
+from app.models import ChatSession, Conversation, UserPreference
+from app.services.chat_writes import session_row
+
+
+@pytest.fixture
+def client(database_url):
+    from app.database import SessionLocal
+    from app.main import app
+
+    with SessionLocal() as db:
+        for model in (ChatSession, Conversation, UserPreference):
+            db.execute(delete(model))
+        db.commit()
+    with TestClient(app) as client:
+        yield client
+
+
+def add_session(session_id, title="Villas in Dubai"):
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        db.execute(ChatSession.__table__.insert(), [session_row(session_id, title, "english", None)])
+        db.commit()
+
+
+def is_active(session_id):
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        return db.execute(select(ChatSession.is_active).where(ChatSession.session_id == session_id)).scalar_one()
+
+
+def test_delete_stands_when_clearing_memory_fails(client, monkeypatch):
+    from app.routes import chat
+
+    def no_agent():
+        raise ValueError("Gemini API key is required")
+
+    add_session("doomed")
+    monkeypatch.setattr(chat, "get_agent_service", no_agent)
+
+    response = client.delete("/api/v1/chat-sessions/doomed")
+
+    assert response.status_code == 200
+    assert not is_active("doomed")
+
+
+def test_rename_changes_the_sidebar_etag(client):
+    add_session("renamed")
+    etag = client.get("/api/v1/chat-sessions").headers["etag"]
+    assert client.get("/api/v1/chat-sessions", headers={"If-None-Match": etag}).status_code == 304
+
+    # Two renames within the same second must still give two validators
+    for title in ("Marina flats", "Palm villas"):
+        assert client.put("/api/v1/chat-sessions/renamed/title", params={"title": title}).status_code == 200
+        response = client.get("/api/v1/chat-sessions", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [s["title"] for s in response.json()["sessions"]] == [title]
+        assert response.headers["etag"] != etag
+        etag = response.headers["etag"]
+
+
+def test_delete_shows_up_in_the_delta_sync(client):
+    add_session("kept")
+    add_session("dropped")
+    since = client.get("/api/v1/chat-sessions").json()["latest_updated_at"]
+
+    assert client.delete("/api/v1/chat-sessions/dropped").status_code == 200
+
+    delta = client.get("/api/v1/chat-sessions", params={"updated_since": since}).json()["sessions"]
+    assert [(s["session_id"], s["is_active"]) for s in delta] == [("dropped", False)]
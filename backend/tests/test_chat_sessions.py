@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.models import ChatSession
+from app.services.chat_writes import SESSION, flush_sessions, session_row, session_upsert
+from app.services.session_locks import SessionLocks
+from app.services.write_behind import WriteBehindQueue
+
+pytestmark = pytest.mark.anyio
+
+
+async def load_sessions(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(ChatSession))).scalars().all()
+
+
+async def test_concurrent_first_messages_create_one_session(session_factory):
+    async def first_message():
+        async with session_factory() as db:
+            await db.execute(session_upsert(db.bind.dialect.name), [session_row("race", "Hello", "english", 7)])
+            await db.commit()
+
+    await asyncio.gather(*[first_message() for _ in range(20)])
+
+    sessions = await load_sessions(session_factory)
+    assert len(sessions) == 1
+    assert sessions[0].message_count == 20 and sessions[0].user_id == 7
+
+
+async def test_queued_session_messages_sum_across_batches(session_factory):
+    queue = WriteBehindQueue(session_factory, {SESSION: flush_sessions}, batch_size=3, flush_interval_ms=5)
+
+    async def message(n):
+        row = session_row("queued", f"title {n}", "english", None)
+        await queue.put(SESSION, {
+            "session_id": "queued", "title": row["title"], "language": "english", "user_id": None,
+            "created_at": row["created_at"], "touched_at": row["updated_at"],
+        })
+
+    await asyncio.gather(*[message(n) for n in range(25)])
+    await queue.stop()
+
+    sessions = await load_sessions(session_factory)
+    assert len(sessions) == 1
+    assert sessions[0].message_count == 25
+    # The first message names the session; later ones only bump it
+    assert sessions[0].title == "title 0"
+
+
+async def test_same_session_turns_run_in_arrival_order():
+    locks = SessionLocks()
+    log = []
+
+    async def turn(session_id, n):
+        async with locks.hold(session_id):
+            log.append((session_id, n, "start"))
+            await asyncio.sleep(0.01)
+            log.append((session_id, n, "end"))
+
+    tasks = []
+    for n in range(5):
+        tasks.append(asyncio.ensure_future(turn("a", n)))
+        # Let each turn queue on the lock before the next one arrives
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert log == [("a", n, event) for n in range(5) for event in ("start", "end")]
+    assert len(locks) == 0
+
+
+async def test_different_sessions_do_not_wait_on_each_other():
+    locks = SessionLocks()
+    inside = set()
+    overlap = []
+
+    async def turn(session_id):
+        async with locks.hold(session_id):
+            inside.add(session_id)
+            await asyncio.sleep(0.02)
+            overlap.append(len(inside))
+            inside.discard(session_id)
+
+    await asyncio.gather(turn("a"), turn("b"), turn("c"))
+
+    assert max(overlap) == 3
+    assert len(locks) == 0
+
+
+async def test_cancelled_waiter_releases_its_slot():
+    locks = SessionLocks()
+    release = asyncio.Event()
+
+    async def holder():
+        async with locks.hold("s"):
+            await release.wait()
+
+    first = asyncio.ensure_future(holder())
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(holder())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    release.set()
+    await first
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert len(locks) == 0
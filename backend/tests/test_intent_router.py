@@ -0,0 +1,47 @@
+import pytest
+
+from app.agents.intent_router import COMPANY_INFO, GREETING, OPEN_ENDED, PROPERTY_SEARCH, IntentRouter
+from app.agents.preference_extractor import PreferenceExtractor
+from app.agents.topic_classifier import TopicClassifier
+
+
+@pytest.fixture(scope="module")
+def classify():
+    router, extractor, classifier = IntentRouter(), PreferenceExtractor(), TopicClassifier()
+
+    def classify(message):
+        return router.classify(message, extractor.extract(message), classifier.classify(message))
+    return classify
+
+
+@pytest.mark.parametrize("message", [
+    "I want to sell my 2 bedroom apartment in Dubai Marina",
+    "can I rent out my villa in Palm Jumeirah",
+    "Is a 2 bedroom in Dubai Marina under 2M a good deal?",
+    "Which is cheaper, Deira or Business Bay for a 1 bedroom?",
+    "what are service charges for apartments in Downtown Dubai",
+    "2 bedroom apartment in Dubai Marina",
+])
+def test_owners_questions_and_bare_criteria_go_to_the_model(classify, message):
+    assert classify(message) == OPEN_ENDED
+
+
+@pytest.mark.parametrize("message", [
+    "I'm looking for a 2 bedroom apartment in Dubai Marina under 2M",
+    "show me villas in Palm Jumeirah",
+    "need a studio in Business Bay",
+    "find me a 3 bedroom villa under 5M",
+    "أبحث عن شقة في دبي مارينا",
+    "டுபாய் மரினாவில் 2 படுக்கையறை அபார்ட்மெண்ட் வேண்டும்",
+])
+def test_search_requests_with_criteria_are_searches(classify, message):
+    assert classify(message) == PROPERTY_SEARCH
+
+
+def test_search_request_without_criteria_goes_to_the_model(classify):
+    assert classify("I'm looking for something nice") == OPEN_ENDED
+
+
+def test_greetings_and_company_questions(classify):
+    assert classify("good morning") == GREETING
+    assert classify("tell me about emaar") == COMPANY_INFO
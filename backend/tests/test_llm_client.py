@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+from app.agents.fake_model import FakeModel
+from app.agents.llm_client import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientModel
+
+pytestmark = pytest.mark.anyio
+
+
+class ScriptedModel(FakeModel):
+    """FakeModel whose calls fail or stall on a script instead of at random"""
+
+    def __init__(self, failures: int = 0, delays=(), **kwargs):
+        kwargs.setdefault("latency", 0.01)
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.delays = list(delays)
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.delays.pop(0) if self.delays else self.latency
+            return delay, self.calls <= self.failures
+
+
+def resilient(model, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("hedge", False)
+    return ResilientModel(lambda: model, **kwargs)
+
+
+async def drain(stream):
+    return "".join([text async for text in stream])
+
+
+async def test_transient_failures_are_retried():
+    model = ScriptedModel(failures=2)
+    llm = resilient(model, max_retries=2)
+
+    response = await llm.agenerate("prompt")
+
+    assert response.text == model.response
+    assert model.calls == 3
+    assert llm.counts["retries"] == 2
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_stream_is_retried_until_the_first_chunk():
+    model = ScriptedModel(failures=1)
+    llm = resilient(model, max_retries=1)
+
+    assert await drain(llm.astream("prompt")) == model.response
+    assert model.calls == 2
+
+
+async def test_breaker_trips_half_opens_and_closes():
+    model = ScriptedModel(failures=3)
+    llm = resilient(model, max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0.05))
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="injected"):
+            await llm.agenerate("prompt")
+    assert llm.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        await llm.agenerate("prompt")
+    assert model.calls == 2
+
+    # The half-open probe fails: open again
+    await asyncio.sleep(0.06)
+    with pytest.raises(Exception, match="injected"):
+        await llm.agenerate("prompt")
+    assert llm.breaker.state == CircuitBreaker.OPEN
+
+    # The next probe succeeds: closed
+    await asyncio.sleep(0.06)
+    await llm.agenerate("prompt")
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+    assert llm.breaker.trips == 2
+
+
+def open_breaker(llm):
+    llm.breaker.state = CircuitBreaker.OPEN
+    llm.breaker.opened_at = time.monotonic() - llm.breaker.reset_seconds
+
+
+async def test_stream_cancelled_before_the_first_chunk_releases_the_probe():
+    model = ScriptedModel(latency=0.5)
+    llm = resilient(model, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.05))
+    open_breaker(llm)
+
+    stream = llm.astream("prompt")
+    first = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0.02)
+    assert llm.breaker.state == CircuitBreaker.HALF_OPEN
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await stream.aclose()
+
+    # Another call gets to probe instead of being rejected forever
+    model.latency = 0.01
+    assert await drain(llm.astream("prompt")) == model.response
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_stream_closed_after_the_first_chunk_closes_the_breaker():
+    model = ScriptedModel(chunk_words=1)
+    llm = resilient(model, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.05))
+    open_breaker(llm)
+
+    stream = llm.astream("prompt")
+    await stream.__anext__()
+    await stream.aclose()
+
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+    assert llm.breaker.allow()
+
+
+async def test_identical_concurrent_prompts_share_one_call():
+    model = ScriptedModel(latency=0.05)
+    llm = resilient(model)
+
+    responses = await asyncio.gather(*(llm.agenerate("same prompt") for _ in range(10)))
+
+    assert {r.text for r in responses} == {model.response}
+    assert model.calls == 1
+    assert llm.counts["coalesced"] == 9
+
+
+async def test_slow_call_is_hedged():
+    # The first call stalls; the hedge sent after the p95 latency answers first
+    model = ScriptedModel(delays=[1.0])
+    llm = resilient(model, hedge=True)
+    for _ in range(20):
+        llm.latency.add(0.01)
+
+    started = time.perf_counter()
+    response = await llm.agenerate("prompt")
+
+    assert response.text == model.response
+    assert time.perf_counter() - started < 0.5
+    assert llm.counts["hedges"] == 1
+    assert llm.counts["hedge_wins"] == 1
+
+
+async def test_deadline_exceeded():
+    model = ScriptedModel(latency=1.0)
+    llm = resilient(model, deadline_seconds=0.05)
+
+    with pytest.raises(DeadlineExceeded):
+        await llm.agenerate("prompt")
+    with pytest.raises(DeadlineExceeded):
+        await drain(llm.astream("other prompt"))
+    assert llm.counts["timeouts"] == 2
@@ -0,0 +1,50 @@
+import pytest
+
+from app.agents.preference_extractor import PreferenceExtractor
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return PreferenceExtractor()
+
+
+@pytest.mark.parametrize("message, budget_min, budget_max", [
+    ("villa under 2M", None, 2_000_000),
+    ("apartment 1-2M AED", 1_000_000, 2_000_000),
+    ("budget 500k", None, 500_000),
+    ("500k or less", None, 500_000),
+    ("apartments in marina from AED 1.2M", 1_200_000, None),
+    ("2 bedroom apartment in marina under 1.5 million", None, 1_500_000),
+    ("50 லட்சம் வரை", None, 5_000_000),
+    ("شقة بميزانية مليون درهم", None, 1_000_000),
+])
+def test_budgets(extractor, message, budget_min, budget_max):
+    preferences = extractor.extract(message)
+    assert (preferences["budget_min"], preferences["budget_max"]) == (budget_min, budget_max)
+
+
+@pytest.mark.parametrize("message", [
+    "house 100 m from the beach",
+    "within 500 m of the metro",
+    "villa 2-3 km from the beach",
+    "I'm looking for a flat",
+    "reviews from 2023",
+])
+def test_distances_and_years_are_not_budgets(extractor, message):
+    preferences = extractor.extract(message)
+    assert preferences["budget_min"] is None and preferences["budget_max"] is None
+
+
+def test_distance_does_not_take_the_budget_comparator(extractor):
+    preferences = extractor.extract("house 100 m from the beach, budget 2M")
+    assert (preferences["budget_min"], preferences["budget_max"]) == (None, 2_000_000)
+
+
+@pytest.mark.parametrize("message, bedrooms", [
+    ("looking for 2 or 3 bedrooms", 2),
+    ("2-3 bedroom apartment", 2),
+    ("3 or 4 bedroom villa with pool budget 5M", 3),
+    ("3 bhk under 900k", 3),
+])
+def test_bedroom_ranges_ask_for_the_lower_count(extractor, message, bedrooms):
+    assert extractor.extract(message)["bedrooms"] == bedrooms
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import delete, insert
+
+from app.models import Property
+from app.services.property_index import PropertyIndex
+
+pytestmark = pytest.mark.anyio
+
+
+def listing(n):
+    return {"title": f"Listing {n}", "location": "Dubai Marina", "property_type": "apartment",
+            "price": 1_000_000 + n, "bedrooms": 1 + n % 3, "amenities": ["pool"]}
+
+
+def add_listings(*numbers):
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        db.execute(insert(Property), [listing(n) for n in numbers])
+        db.commit()
+
+
+@pytest.fixture
+def listings(database_url):
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        db.execute(delete(Property))
+        db.commit()
+    add_listings(*range(5))
+    yield
+    with SessionLocal() as db:
+        db.execute(delete(Property))
+        db.commit()
+
+
+class CountingIndex(PropertyIndex):
+    """Counts reloads and can hold them until ``release`` is set"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reloads = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def _replace(self, rows):
+        self.reloads += 1
+        self.release.wait(5)
+        super()._replace(rows)
+
+
+async def test_first_requests_share_one_load(listings):
+    index = CountingIndex()
+    index.release.clear()
+    waiting = asyncio.gather(*(index.ensure_fresh() for _ in range(5)))
+    await asyncio.sleep(0.05)
+    index.release.set()
+
+    snapshots = await waiting
+
+    assert index.reloads == 1
+    assert {snap.size for snap in snapshots} == {5}
+
+
+async def test_stale_index_serves_its_snapshot_while_reloading(listings):
+    index = CountingIndex(max_age_seconds=0)
+    await index.ensure_fresh()
+    add_listings(5, 6)
+    index.release.clear()
+
+    snap = await asyncio.wait_for(index.ensure_fresh(), 1)
+    again = await asyncio.wait_for(index.ensure_fresh(), 1)
+
+    assert snap.size == again.size == 5
+    index.release.set()
+    for _ in range(100):
+        if len(index.search(limit=None)) == 7:
+            break
+        await asyncio.sleep(0.01)
+    assert len(index.search(limit=None)) == 7
+    # The first load, then one reload shared by both stale reads
+    assert index.reloads == 2
@@ -0,0 +1,79 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete
+
+from app.models import Property, PropertyAmenity, PropertyDuplicate
+
+MARINA = {
+    "title": "Two bedroom apartment with marina view",
+    "description": "Bright apartment on a high floor overlooking Dubai Marina, with a pool and a gym",
+    "price": 2_000_000, "location": "Dubai Marina", "property_type": "apartment",
+    "bedrooms": 2, "bathrooms": 2, "area_sqft": 1200, "amenities": ["pool", "gym"],
+}
+CANAL = {
+    "title": "Canal side apartment in Business Bay",
+    "description": "Two bedrooms facing the canal, walking distance to the metro",
+    "price": 1_900_000, "location": "Business Bay", "property_type": "apartment",
+    "bedrooms": 2, "bathrooms": 2, "area_sqft": 1150, "amenities": ["gym"],
+}
+
+
+@pytest.fixture
+def client(database_url):
+    from app.database import SessionLocal
+    from app.main import app
+    from app.services.dedup import deduplicator
+    from app.services.property_index import property_index
+
+    def clear():
+        with SessionLocal() as db:
+            for model in (PropertyDuplicate, PropertyAmenity, Property):
+                db.execute(delete(model))
+            db.commit()
+            property_index.load(db)
+
+    clear()
+    deduplicator.index, deduplicator.max_id = deduplicator.new_index(), 0
+    with TestClient(app) as client:
+        yield client
+    clear()
+
+
+@pytest.fixture
+def listings(client, monkeypatch):
+    from app.services.dedup import deduplicator
+
+    monkeypatch.setattr(deduplicator, "mode", "flag")
+    return [client.post("/api/v1/properties", json=data).json()["id"] for data in (MARINA, CANAL, MARINA)]
+
+
+def test_flagged_duplicate_is_recorded(client, listings):
+    from app.database import SessionLocal
+
+    original, _, duplicate = listings
+    with SessionLocal() as db:
+        assert db.get(PropertyDuplicate, duplicate).duplicate_of == original
+
+
+def test_flagged_duplicates_stay_out_of_listings(client, listings):
+    original, canal, _ = listings
+    assert [p["id"] for p in client.get("/api/v1/properties").json()] == [original, canal]
+    assert [p["id"] for p in client.get("/api/v1/properties", params={"location": "marina"}).json()] == [original]
+
+
+def test_flagged_duplicates_stay_out_of_similar(client, listings):
+    original, canal, _ = listings
+    assert [p["id"] for p in client.get(f"/api/v1/properties/{original}/similar").json()] == [canal]
+
+
+def test_flagged_duplicates_stay_out_of_semantic_search(client, listings):
+    original, _, _ = listings
+    matches = client.get("/api/v1/properties/semantic", params={"q": "marina view apartment"}).json()
+    assert original in [m["id"] for m in matches]
+    assert len(matches) == len({m["title"] for m in matches})
+
+
+def test_flagged_duplicates_stay_out_of_facets(client, listings):
+    facets = client.get("/api/v1/properties/facets").json()
+    assert facets["total"] == 2
+    assert {f["value"]: f["count"] for f in facets["location"]} == {"Dubai Marina": 1, "Business Bay": 1}
@@ -0,0 +1,106 @@
+import datetime
+
+import pytest
+from sqlalchemy import delete, insert
+
+from app.models import Property
+from app.services.property_search import InvalidCursor, search_properties
+
+pytestmark = pytest.mark.anyio
+
+LISTINGS = [
+    ("Marina view apartment", "Dubai Marina", "apartment", 1_200_000, 1, "Bright flat over the marina walk"),
+    ("Marina penthouse", "Dubai Marina", "penthouse", 6_500_000, 4, "Penthouse with a private pool"),
+    ("Family villa", "Palm Jumeirah", "villa", 9_000_000, 5, "Beachfront villa with a garden"),
+    ("Studio near metro", "Business Bay", "studio", 650_000, 0, "Compact studio by the canal"),
+    ("Canal apartment", "Business Bay", "apartment", 1_500_000, 2, "Two bedrooms facing the canal"),
+    ("Townhouse", "Arabian Ranches", "townhouse", 3_200_000, 3, "Quiet community with a park"),
+    ("Wildcard flat", "100% Dubai_Hills", "apartment", 2_000_000, 2, "Literal wildcards in its location"),
+]
+
+
+@pytest.fixture
+async def properties(session_factory):
+    created = datetime.datetime(2026, 1, 1)
+    rows = [
+        {"title": title, "location": location, "property_type": kind, "price": price, "bedrooms": bedrooms,
+         "description": description, "amenities": [], "created_at": created + datetime.timedelta(days=n % 3)}
+        for n, (title, location, kind, price, bedrooms, description) in enumerate(LISTINGS)
+    ]
+    async with session_factory() as db:
+        await db.execute(delete(Property))
+        await db.execute(insert(Property), rows)
+        await db.commit()
+    yield session_factory
+    async with session_factory() as db:
+        await db.execute(delete(Property))
+        await db.commit()
+
+
+async def all_pages(db, page_size, **filters):
+    titles, cursor, pages = [], None, 0
+    while True:
+        found, cursor = await search_properties(db, limit=page_size, cursor=cursor, **filters)
+        titles += [p.title for p in found]
+        pages += 1
+        if cursor is None:
+            return titles, pages
+
+
+@pytest.mark.parametrize("sort", ["newest", "price_asc", "price_desc"])
+async def test_cursor_pages_cover_every_row_once(properties, sort):
+    async with properties() as db:
+        everything, _ = await search_properties(db, limit=100, sort=sort)
+        paged, pages = await all_pages(db, 2, sort=sort)
+    assert paged == [p.title for p in everything]
+    assert len(paged) == len(LISTINGS) and pages == 4
+
+
+async def test_price_pages_are_ordered(properties):
+    async with properties() as db:
+        titles, _ = await all_pages(db, 3, sort="price_asc", min_price=1_000_000)
+    prices = {title: price for title, _, _, price, _, _ in LISTINGS}
+    assert [prices[t] for t in titles] == sorted(prices[t] for t in titles)
+    assert "Studio near metro" not in titles
+
+
+async def test_cursor_from_another_sort_is_rejected(properties):
+    async with properties() as db:
+        _, cursor = await search_properties(db, limit=2, sort="newest")
+        with pytest.raises(InvalidCursor):
+            await search_properties(db, limit=2, sort="price_asc", cursor=cursor)
+
+
+async def test_full_text_query_ranks_matches(properties):
+    async with properties() as db:
+        found, _ = await search_properties(db, q="marina penthouse")
+    titles = [p.title for p in found]
+    assert titles[0] == "Marina penthouse"
+    assert set(titles) == {"Marina penthouse", "Marina view apartment"}
+
+
+async def test_full_text_query_pages_by_relevance(properties):
+    async with properties() as db:
+        everything, _ = await search_properties(db, q="canal apartment", limit=100)
+        paged, _ = await all_pages(db, 1, q="canal apartment")
+    assert paged == [p.title for p in everything]
+    assert paged[0] == "Canal apartment"
+
+
+async def test_full_text_prefix_and_filters(properties):
+    async with properties() as db:
+        found, _ = await search_properties(db, q="apart", location="business")
+    assert [p.title for p in found] == ["Canal apartment"]
+
+
+@pytest.mark.parametrize("location, titles", [
+    ("dubai", ["Marina view apartment", "Marina penthouse"]),
+    ("%", []),
+    ("_", []),
+    ("100%", ["Wildcard flat"]),
+    ("100% dubai_", ["Wildcard flat"]),
+])
+async def test_location_wildcards_match_literally(properties, location, titles):
+    async with properties() as db:
+        found, _ = await search_properties(db, location=location, sort="price_asc")
+    assert [p.title for p in found] == titles
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from app.agents.fake_model import FakeModel
+from app.agents.multilingual import MultilingualRealEstateAgent
+from app.agents.stream_formatter import IncrementalFormatter
+
+
+def format_whole(text):
+    return MultilingualRealEstateAgent.enhance_response_formatting(None, text)
+
+
+def format_streamed(text, chunk_sizes, max_buffer=400):
+    formatter = IncrementalFormatter(format_whole, max_buffer=max_buffer)
+    pieces, start = [], 0
+    for size in chunk_sizes:
+        pieces += formatter.feed(text[start:start + size])
+        start += size
+    pieces += formatter.feed(text[start:])
+    return pieces + formatter.flush()
+
+
+@pytest.mark.parametrize("text", [
+    FakeModel.RESPONSE,
+    "1.\n\nApple towers",
+    "## \n\nText after a bare heading marker",
+    "OVERVIEW\n\nABc mixed capitals",
+    "Prices##* * \n\nAED 2,000,000",
+    "First line  \n \n  indented paragraph",
+    "Before\n\n**\n\nAfter",
+])
+def test_streamed_pieces_concatenate_to_the_whole_text_formatted(text):
+    for size in (1, 3, 8, len(text)):
+        assert "".join(format_streamed(text, [size] * (len(text) // size))) == format_whole(text)
+
+
+def test_random_chunkings_match_the_whole_text():
+    rnd = random.Random(3)
+    tokens = ["Dubai", "villas", "HEADING", "DUBAI MARINA", "UAEDubai", "ABc", "1.", "2.", "#", "##", "**bold**",
+              "*", "`x`", ":", "AED 2,000,000", " ", "\t", "\n", "\n\n", "\n \n", "\n\n\n"]
+    for _ in range(2000):
+        text = "".join(rnd.choice(tokens) + rnd.choice(["", " "]) for _ in range(rnd.randint(1, 40)))
+        sizes = [rnd.randint(1, 12) for _ in range(len(text))]
+        streamed = format_streamed(text, sizes, max_buffer=rnd.choice([5, 40, 400]))
+        assert "".join(streamed) == format_whole(text), text
+
+
+def test_paragraphs_are_released_before_the_stream_ends():
+    formatter = IncrementalFormatter(format_whole)
+    released = []
+    for word in FakeModel.RESPONSE.split(" "):
+        released += formatter.feed(word + " ")
+
+    assert len(released) >= 3
+    assert released[0] == "DUBAI PROPERTY OVERVIEW"
+
+
+def test_long_paragraph_is_released_at_line_breaks():
+    text = "\n".join(" ".join([word] * 100) for word in ("first", "second", "third"))
+    formatter = IncrementalFormatter(format_whole, max_buffer=400)
+    released = []
+    for word in text.split(" "):
+        released += formatter.feed(word + " ")
+
+    assert released
+    assert "".join(released + formatter.flush()) == format_whole(text)
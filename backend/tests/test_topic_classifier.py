@@ -0,0 +1,52 @@
+import pytest
+
+from app.agents.topic_classifier import PROHIBITED, REAL_ESTATE, TopicClassifier
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return TopicClassifier()
+
+
+@pytest.mark.parametrize("message", [
+    "I am interested in buying something",
+    "thinking about renting somewhere",
+    "what about selling my place",
+    "I am investing my savings",
+    "is the rented unit furnished",
+    "tell me about the market trends for investing here",
+    "are there any buyers for penthouses",
+    "we are leasing our flat",
+    "டுபாயில் வீடு வேண்டும் என்று நினைக்கிறேன் இப்போது",
+    "வீட்டில் இருந்து அலுவலகம் எவ்வளவு தூரம் இருக்கும்",
+])
+def test_inflected_keywords_are_real_estate(classifier, message):
+    assert classifier.classify(message).is_related
+
+
+@pytest.mark.parametrize("message, keyword", [
+    ("renting", "rent"),
+    ("buyers", "buy"),
+    ("investor", "invest"),
+    ("leasing", "lease"),
+    ("priced", "price"),
+    ("டுபாயில்", "டுபாய்"),
+])
+def test_inflected_forms_report_their_keyword(classifier, message, keyword):
+    assert [m.keyword for m in classifier.find(message)] == [keyword]
+
+
+@pytest.mark.parametrize("message", [
+    "I cared about the weather forecast this weekend",
+    "recommend a card game for the family tonight",
+    "காரணம் என்ன சொல்லுங்கள் இப்போது நண்பரே",
+])
+def test_off_topic_messages_stay_unrelated(classifier, message):
+    result = classifier.classify(message)
+    assert not result.is_related
+    assert not result.categories(REAL_ESTATE)
+
+
+def test_prohibited_keywords_match_whole_words_only(classifier):
+    assert [m.category for m in classifier.find("car")] == [PROHIBITED]
+    assert classifier.find("cared cards") == []
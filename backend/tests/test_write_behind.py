@@ -0,0 +1,161 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import Conversation, UserPreference
+from app.services.chat_writes import CONVERSATION, PREFERENCES, flush_conversations, flush_preferences
+from app.services.metrics import ERRORS
+from app.services.write_behind import WriteBehindQueue
+
+pytestmark = pytest.mark.anyio
+
+
+def conversation(session_id, n):
+    return {
+        "session_id": session_id,
+        "user_id": None,
+        "user_message": f"message {n}",
+        "agent_response": f"response {n}",
+        "language": "english",
+        "conversation_data": {"preferences": {}},
+        "created_at": datetime.utcnow(),
+    }
+
+
+async def count_conversations(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(func.count()).select_from(Conversation))).scalar_one()
+
+
+async def test_stop_drains_pending_writes(session_factory):
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: flush_conversations}, batch_size=7, flush_interval_ms=200)
+    for n in range(50):
+        await queue.put(CONVERSATION, conversation("drain", n))
+    assert queue.pending > 0
+
+    await queue.stop()
+
+    assert queue.pending == 0
+    assert await count_conversations(session_factory) == 50
+    stats = queue.stats()
+    assert stats["flushed"] == 50 and stats["batches"] >= 50 // 7 and stats["dropped"] == 0
+
+
+async def test_batches_keep_arrival_order(session_factory):
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: flush_conversations}, batch_size=4)
+    for n in range(10):
+        await queue.put(CONVERSATION, conversation("order", n))
+    await queue.stop()
+
+    async with session_factory() as db:
+        messages = (await db.execute(select(Conversation.user_message).order_by(Conversation.id))).scalars().all()
+    assert messages == [f"message {n}" for n in range(10)]
+
+
+async def test_failed_batch_is_retried(session_factory):
+    calls = []
+
+    async def flaky(db, items):
+        calls.append(len(items))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        await flush_conversations(db, items)
+
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: flaky}, batch_size=10, flush_interval_ms=20)
+    for n in range(3):
+        await queue.put(CONVERSATION, conversation("retry", n))
+    await queue.stop()
+
+    assert calls == [3, 3]
+    assert await count_conversations(session_factory) == 3
+    stats = queue.stats()
+    assert stats["failed_batches"] == 1 and stats["flushed"] == 3 and stats["dropped"] == 0
+
+
+async def test_batch_is_dropped_after_max_attempts(session_factory):
+    async def broken(db, items):
+        raise RuntimeError("disk full")
+
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: broken}, batch_size=10, flush_interval_ms=20, max_attempts=2)
+    for n in range(4):
+        await queue.put(CONVERSATION, conversation("drop", n))
+    await queue.stop()
+
+    stats = queue.stats()
+    assert stats["failed_batches"] == 2 and stats["dropped"] == 4 and stats["flushed"] == 0
+    assert queue.pending == 0
+
+
+async def test_only_the_failing_row_is_dropped(session_factory):
+    async def poisoned(db, items):
+        if any(item["user_message"] == "message 2" for item in items):
+            raise RuntimeError("value too long")
+        await flush_conversations(db, items)
+
+    errors = ERRORS._values.get(("write_behind",), 0)
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: poisoned}, batch_size=10, flush_interval_ms=20, max_attempts=2)
+    for n in range(5):
+        await queue.put(CONVERSATION, conversation("poison", n))
+    await queue.stop()
+
+    async with session_factory() as db:
+        messages = (await db.execute(select(Conversation.user_message).order_by(Conversation.id))).scalars().all()
+    assert messages == ["message 0", "message 1", "message 3", "message 4"]
+    stats = queue.stats()
+    assert stats["dropped"] == 1 and stats["isolated"] == 4 and stats["flushed"] == 4
+    # Two failed attempts and the dropped row
+    assert ERRORS._values[("write_behind",)] - errors == 3
+
+
+def preferences(session_id, **values):
+    return {"session_id": session_id, "language": "english", "preferences": values}
+
+
+async def test_concurrent_preference_writes_share_one_row(session_factory):
+    async def write(items):
+        async with session_factory() as db:
+            await flush_preferences(db, items)
+            await db.commit()
+
+    await asyncio.gather(
+        write([preferences("prefs", budget_max=2_000_000)]),
+        write([preferences("prefs", bedrooms=2, preferred_locations=["Dubai Marina"])]),
+    )
+    await write([preferences("prefs", budget_max=1_500_000, property_types=[]), preferences("prefs", bedrooms=3)])
+
+    async with session_factory() as db:
+        rows = (await db.execute(select(UserPreference).where(UserPreference.session_id == "prefs"))).scalars().all()
+    assert len(rows) == 1
+    assert (rows[0].budget_max, rows[0].bedrooms, rows[0].preferred_locations) == (1_500_000, 3, ["Dubai Marina"])
+    assert rows[0].property_types is None
+
+
+async def test_put_waits_when_queue_is_full(session_factory):
+    release = asyncio.Event()
+
+    async def slow(db, items):
+        await release.wait()
+
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: slow}, batch_size=1, max_pending=2)
+    await queue.put(CONVERSATION, conversation("full", 0))
+    # The flusher takes the first item and blocks on it; two more fill the queue
+    await asyncio.sleep(0.01)
+    for n in range(1, 3):
+        await queue.put(CONVERSATION, conversation("full", n))
+    blocked = asyncio.ensure_future(queue.put(CONVERSATION, conversation("full", 3)))
+    await asyncio.sleep(0.05)
+    assert not blocked.done()
+    assert queue.stats()["backpressure_waits"] == 1
+
+    release.set()
+    await blocked
+    await queue.stop()
+    assert queue.stats()["flushed"] == 4
+
+
+async def test_unknown_kind_is_rejected(session_factory):
+    queue = WriteBehindQueue(session_factory, {CONVERSATION: flush_conversations})
+    with pytest.raises(ValueError):
+        await queue.put("unknown", {})
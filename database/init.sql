@@ -34,7 +34,7 @@ CREATE TABLE IF NOT EXISTS conversations (
 
 CREATE TABLE IF NOT EXISTS user_preferences (
     id SERIAL PRIMARY KEY,
-    session_id VARCHAR NOT NULL,
+    session_id VARCHAR UNIQUE NOT NULL,
     budget_min DECIMAL,
     budget_max DECIMAL,
     preferred_locations JSONB,
@@ -45,6 +45,21 @@ CREATE TABLE IF NOT EXISTS user_preferences (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Normalised amenities: one row per (property, amenity), lower case
+CREATE TABLE IF NOT EXISTS property_amenities (
+    property_id INTEGER NOT NULL,
+    amenity VARCHAR NOT NULL,
+    PRIMARY KEY (property_id, amenity)
+);
+
+-- Listings flagged as near-duplicates of an earlier listing at ingest
+CREATE TABLE IF NOT EXISTS property_duplicates (
+    property_id INTEGER PRIMARY KEY,
+    duplicate_of INTEGER NOT NULL,
+    similarity FLOAT,
+    detected_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- NEW: Chat sessions table for sidebar
 CREATE TABLE IF NOT EXISTS chat_sessions (
     id SERIAL PRIMARY KEY,
@@ -63,6 +78,19 @@ CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created
 CREATE INDEX IF NOT EXISTS idx_properties_location ON properties(location);
 CREATE INDEX IF NOT EXISTS idx_properties_price ON properties(price);
 CREATE INDEX IF NOT EXISTS idx_properties_property_type ON properties(property_type);
+CREATE INDEX IF NOT EXISTS ix_properties_location_lower ON properties(lower(location) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS ix_properties_type_lower ON properties(lower(property_type));
+CREATE INDEX IF NOT EXISTS ix_properties_available_price ON properties(available_from, price);
+CREATE INDEX IF NOT EXISTS ix_properties_bedrooms_price ON properties(bedrooms, price);
+CREATE INDEX IF NOT EXISTS ix_properties_price_id ON properties(price, id);
+CREATE INDEX IF NOT EXISTS ix_properties_created_id ON properties(created_at, id);
+
+-- Full-text and trigram search over title, location and description
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_properties_search_tsv ON properties USING gin (to_tsvector('simple', (coalesce(title, '') || ' ' || coalesce(location, '') || ' ' || coalesce(description, ''))));
+CREATE INDEX IF NOT EXISTS ix_properties_search_trgm ON properties USING gin ((coalesce(title, '') || ' ' || coalesce(location, '') || ' ' || coalesce(description, '')) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_property_amenities_amenity ON property_amenities(amenity, property_id);
+CREATE INDEX IF NOT EXISTS ix_property_duplicates_duplicate_of ON property_duplicates(duplicate_of);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_session_id ON chat_sessions(session_id);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_is_active ON chat_sessions(is_active);
@@ -75,6 +103,11 @@ INSERT INTO properties (title, description, price, location, property_type, bedr
 ('Luxury Penthouse in Business Bay', 'Stunning 3-bedroom penthouse 
 with city views', 5200000, 'Business Bay', 'apartment', 3, 3, 3200, '["pool", "gym", "concierge", "private elevator"]', '[]');
 
+INSERT INTO property_amenities (property_id, amenity)
+SELECT DISTINCT id, lower(trim(amenity)) FROM properties, jsonb_array_elements_text(amenities) AS amenity
+WHERE trim(amenity) <> ''
+ON CONFLICT DO NOTHING;
+
 
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
@@ -92,7 +125,10 @@ ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS user_id INTEGER;
 
 -- Create indexes for user relationships
 CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
+CREATE INDEX IF NOT EXISTS ix_conversations_session_created_id ON conversations(session_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_conversations_user_created_id ON conversations(user_id, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON chat_sessions(user_id);
+CREATE INDEX IF NOT EXISTS ix_chat_sessions_user_active_updated ON chat_sessions(user_id, is_active, updated_at, id);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
 -- Update existing chat_sessions to have NULL user_id for old data
@@ -12,6 +12,7 @@ function ChatApp() {
   const [inputMessage, setInputMessage] = useState('');
   const [sessionId, setSessionId] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [chatHistory, setChatHistory] = useState([]);
   const [isSidebarOpen, setIsSidebarOpen] = useState(false);
   const [user, setUser] = useState(null);
@@ -19,6 +20,7 @@ function ChatApp() {
   const [isLogin, setIsLogin] = useState(true);
   const [authData, setAuthData] = useState({ email: '', password: '', name: '' });
   const messagesEndRef = useRef(null);
+  const sidebarSyncRef = useRef(null);
 
   const chatContent = {
     english: {
@@ -151,8 +153,10 @@ useEffect(() => {
       const response = await axios.get(`${API_BASE}/conversations/${sessionId}`, {
         headers: { Authorization: `Bearer ${user.token}` }
       });
-      if (response.data && Array.isArray(response.data) && response.data.length > 0) {
-        const history = response.data.flatMap(conv => [
+      // The latest page of turns, oldest first
+      const turns = response.data?.items || [];
+      if (turns.length > 0) {
+        const history = turns.flatMap(conv => [
           { type: 'user', content: conv.user_message, language: conv.language },
           { type: 'agent', content: conv.agent_response, language: conv.language }
         ]);
@@ -176,15 +180,31 @@ const loadChatHistory = async () => {
   
   try {
     console.log('Loading chat history for user:', user.id);
+    // After the first load, ask only for sessions changed since the last sync
+    const since = sidebarSyncRef.current;
     const response = await axios.get(`${API_BASE}/chat-sessions`, {
       headers: { Authorization: `Bearer ${user.token}` },
-      params: { user_id: user.id }
+      params: since ? { user_id: user.id, updated_since: since } : { user_id: user.id }
     });
     
     if (response.data && response.data.sessions) {
       console.log('Chat history loaded:', response.data.sessions.length, 'sessions');
-      setChatHistory(response.data.sessions);
-      localStorage.setItem('chatHistory', JSON.stringify(response.data.sessions));
+      if (since) {
+        setChatHistory(prev => {
+          const bySession = new Map(prev.map(s => [s.session_id, s]));
+          response.data.sessions.forEach(s => {
+            if (s.is_active) bySession.set(s.session_id, s);
+            else bySession.delete(s.session_id);
+          });
+          const merged = [...bySession.values()].sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at));
+          localStorage.setItem('chatHistory', JSON.stringify(merged));
+          return merged;
+        });
+      } else {
+        setChatHistory(response.data.sessions);
+        localStorage.setItem('chatHistory', JSON.stringify(response.data.sessions));
+      }
+      sidebarSyncRef.current = response.data.latest_updated_at || since;
     }
   } catch (error) {
     console.error('Error loading chat history:', error);
@@ -196,6 +216,7 @@ const loadChatHistory = async () => {
 };
 
 useEffect(() => {
+  sidebarSyncRef.current = null;
   if (user && user.token) {
     console.log('User authenticated, loading chat history');
     loadChatHistory();
@@ -240,20 +261,68 @@ const sendMessage = async () => {
       language: currentLanguage
     };
 
-    const config = user ? { 
-      headers: { Authorization: `Bearer ${user.token}` },
-      params: {
-        user_id: user.id  // Send user_id as query parameter in POST request
-      }
-    } : {};
+    // Send user_id as query parameter in POST request
+    const query = user ? `?user_id=${encodeURIComponent(user.id)}` : '';
+    const headers = { 'Content-Type': 'application/json' };
+    if (user) {
+      headers.Authorization = `Bearer ${user.token}`;
+    }
 
-    const response = await axios.post(`${API_BASE}/chat`, messageData, config);
+    const response = await fetch(`${API_BASE}/chat/stream${query}`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(messageData)
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat stream failed with status ${response.status}`);
+    }
 
-    const agentMessage = {
-      type: 'agent',
-      content: response.data.response,
-      language: response.data.language
+    // Render the agent message as soon as the first delta arrives
+    let agentMessage = { type: 'agent', content: '', language: currentLanguage };
+    const showAgentMessage = () => {
+      setMessages([...updatedMessages, { ...agentMessage }]);
     };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamError = null;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE frames are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = 'message';
+        let data = '';
+        frame.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (!data) continue;
+        const payload = JSON.parse(data);
+
+        if (event === 'start') {
+          agentMessage = { ...agentMessage, language: payload.language };
+        } else if (event === 'delta') {
+          agentMessage = { ...agentMessage, content: agentMessage.content + payload.text };
+          setIsStreaming(true);
+          showAgentMessage();
+        } else if (event === 'error') {
+          streamError = payload.detail;
+        }
+      }
+    }
+
+    if (!agentMessage.content) {
+      throw new Error(streamError || 'Empty response from chat stream');
+    }
     const finalMessages = [...updatedMessages, agentMessage];
     setMessages(finalMessages);
     localStorage.setItem('currentChatMessages', JSON.stringify(finalMessages));
@@ -275,6 +344,7 @@ const sendMessage = async () => {
     localStorage.setItem('currentChatMessages', JSON.stringify(errorMessages));
   } finally {
     setIsLoading(false);
+    setIsStreaming(false);
   }
 };
 
@@ -376,8 +446,8 @@ const handleGoogleLogin = () => {
         headers: { Authorization: `Bearer ${user.token}` }
       });
       
-      if (response.data && Array.isArray(response.data)) {
-        const history = response.data.flatMap(conv => [
+      if (response.data && Array.isArray(response.data.items)) {
+        const history = response.data.items.flatMap(conv => [
           { type: 'user', content: conv.user_message, language: conv.language },
           { type: 'agent', content: conv.agent_response, language: conv.language }
         ]);
@@ -596,7 +666,7 @@ const handleGoogleLogin = () => {
               </div>
             ))}
             
-            {isLoading && (
+            {isLoading && !isStreaming && (
               <div className="message-simple ai-msg">
                 <div className="typing-simple">
                   <span></span>